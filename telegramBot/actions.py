@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих действий бота (муты, баны, удаления, уведомления).
+Запросы к Telegram идут через общий и поканальный (по чату) лимиты: у сообщений бота
+свой лимит чата, у удалений и мутов свой. Модерация обгоняет уведомления, а TelegramRetryAfter не теряет действие:
+оно возвращается в очередь после паузы, которую назвал Telegram.
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from aiogram.exceptions import TelegramRetryAfter
+from cache import TTLCache
+from config import (
+    ACTION_GLOBAL_RATE, ACTION_CHAT_RATE, ACTION_CHAT_BURST, ACTION_CHAT_MOD_RATE, ACTION_CHAT_MOD_BURST,
+    ACTION_MAX_QUEUE, ACTION_CONCURRENCY, ACTION_MAX_RETRIES
+)
+
+# Приоритеты: меньше — раньше
+PRIORITY_MODERATION = 0 # муты, баны, удаление нарушений
+PRIORITY_NOTICE = 1     # уведомления и уборка сообщений бота
+
+# deleteMessages принимает до 100 id за раз
+DELETE_BATCH = 100
+
+# Лимиты чата: сообщения бота (уведомления) и все остальное (удаления, муты, баны)
+LIMIT_SEND = 'send'
+LIMIT_MODERATION = 'moderation'
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.blocked_until = 0.0 # до этого момента Telegram просил подождать (retry_after)
+
+    def delay(self, now: float) -> float:
+        """Через сколько секунд можно отправить запрос (0 — сейчас)."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1
+
+class _Action:
+    __slots__ = ('chat_id', 'priority', 'call', 'future', 'attempts', 'kind', 'limit')
+
+    def __init__(self, chat_id, priority, call, future, kind='call', limit=LIMIT_MODERATION):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.call = call       # без аргументов, возвращает корутину запроса
+        self.future = future
+        self.attempts = 0
+        self.kind = kind
+        self.limit = limit     # какой лимит чата расходует
+
+class _DeleteBatch:
+    """Ожидающие удаления одного чата: повторный id не добавляет запроса."""
+    __slots__ = ('bot', 'ids', 'future', 'priority')
+
+    def __init__(self, bot, future, priority):
+        self.bot = bot
+        self.ids = {} # { message_id: None } — упорядоченное множество
+        self.future = future
+        self.priority = priority
+
+def _retrieve(future):
+    # Ошибки действий без ожидания результата не должны попадать в лог как «never retrieved»
+    if not future.cancelled():
+        future.exception()
+
+class ActionQueue:
+    def __init__(self, global_rate: float = ACTION_GLOBAL_RATE, chat_rate: float = ACTION_CHAT_RATE,
+                 chat_burst: int = ACTION_CHAT_BURST, max_queue: int = ACTION_MAX_QUEUE,
+                 concurrency: int = ACTION_CONCURRENCY, max_retries: int = ACTION_MAX_RETRIES,
+                 mod_rate: float = ACTION_CHAT_MOD_RATE, mod_burst: int = ACTION_CHAT_MOD_BURST):
+        # { вид лимита: (запросов в секунду, запас) }
+        self.chat_limits = {LIMIT_SEND: (chat_rate, chat_burst), LIMIT_MODERATION: (mod_rate, mod_burst)}
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate, time.monotonic())
+        # Простаивающий чат все равно набрал бы полный запас, поэтому его ведро можно забыть
+        refill = max(burst / rate for rate, burst in self.chat_limits.values())
+        self._chats = TTLCache('action_buckets', maxsize=10000, ttl=max(60.0, refill)) # { (chat_id, вид): ведро }
+        self._ready = []   # куча (priority, seq, action)
+        self._delayed = [] # куча (ready_at, seq, action): лимит чата или retry_after
+        self._seq = itertools.count()
+        self._deletes = {} # { chat_id: _DeleteBatch }
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._in_flight = set()
+        self._task = None
+        self.metrics = Counter()
+
+    # === ПОСТАНОВКА В ОЧЕРЕДЬ ===
+    def _push(self, action: _Action):
+        heapq.heappush(self._ready, (action.priority, next(self._seq), action))
+        self._wakeup.set()
+
+    def submit(self, chat_id: int, call, priority: int = PRIORITY_NOTICE) -> asyncio.Future:
+        """
+        Ставит запрос в очередь и сразу возвращает Future с его результатом.
+        При переполнении уведомления отбрасываются (Future с результатом None), модерация — никогда.
+        Уведомления расходуют лимит сообщений чата, модерация — лимит удалений и мутов.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        if priority > PRIORITY_MODERATION and self.depth() >= self.max_queue:
+            self.metrics['dropped'] += 1
+            future.set_result(None)
+            return future
+        self.metrics['submitted'] += 1
+        limit = LIMIT_SEND if priority > PRIORITY_MODERATION else LIMIT_MODERATION
+        self._push(_Action(chat_id, priority, call, future, limit=limit))
+        return future
+
+    async def run(self, chat_id: int, call, priority: int = PRIORITY_NOTICE):
+        """submit() с ожиданием результата; ошибка запроса пробрасывается вызывающему."""
+        return await self.submit(chat_id, call, priority)
+
+    def delete(self, bot, chat_id: int, message_id: int, priority: int = PRIORITY_NOTICE) -> asyncio.Future:
+        """
+        Удаление сообщения. Удаления одного чата копятся и уходят одним deleteMessages,
+        повторное удаление того же id не создает нового запроса.
+        """
+        batch = self._deletes.get(chat_id)
+        if batch is None:
+            future = asyncio.get_running_loop().create_future()
+            future.add_done_callback(_retrieve)
+            batch = self._deletes[chat_id] = _DeleteBatch(bot, future, priority)
+            self._push(_Action(chat_id, priority, None, future, kind='delete'))
+        elif message_id in batch.ids:
+            self.metrics['coalesced'] += 1
+            return batch.future
+        elif priority < batch.priority:
+            # Срочное удаление поднимает всю пачку: старая запись в очереди найдет ее уже отправленной
+            batch.priority = priority
+            self._push(_Action(chat_id, priority, None, batch.future, kind='delete'))
+        batch.ids[message_id] = None
+        self.metrics['submitted'] += 1
+        return batch.future
+
+    def delete_many(self, bot, chat_id: int, message_ids, priority: int = PRIORITY_MODERATION) -> asyncio.Future:
+        future = None
+        for message_id in message_ids:
+            future = self.delete(bot, chat_id, message_id, priority)
+        return future
+
+    # === ОБРАБОТКА ===
+    def _bucket(self, action: _Action, now):
+        key = (action.chat_id, action.limit)
+        bucket = self._chats.get(key)
+        if bucket is None:
+            bucket = TokenBucket(*self.chat_limits[action.limit], now)
+        # set() продлевает жизнь ведра
+        self._chats.set(key, bucket)
+        return bucket
+
+    def _bind_delete(self, action: _Action) -> bool:
+        """Забирает накопленную пачку удалений чата в действие; False — пачку уже отправили."""
+        batch = self._deletes.pop(action.chat_id, None)
+        if batch is None or batch.future is not action.future:
+            if batch is not None:
+                self._deletes[action.chat_id] = batch
+            return False
+        ids = list(batch.ids)
+        if len(ids) > DELETE_BATCH:
+            # Остаток — следующей пачкой с тем же Future
+            rest = _DeleteBatch(batch.bot, batch.future, batch.priority)
+            rest.ids = dict.fromkeys(ids[DELETE_BATCH:])
+            self._deletes[action.chat_id] = rest
+            self._push(_Action(action.chat_id, batch.priority, None, batch.future, kind='delete'))
+            ids = ids[:DELETE_BATCH]
+            action.future = None # результат выставит последняя пачка
+        bot, chat_id = batch.bot, action.chat_id
+        action.call = lambda: bot.delete_messages(chat_id, ids)
+        action.kind = 'call'
+        return True
+
+    async def _next(self) -> _Action:
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, seq, action = heapq.heappop(self._delayed)
+                heapq.heappush(self._ready, (action.priority, seq, action))
+
+            if self._ready:
+                wait = self._global.delay(now)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                _, seq, action = heapq.heappop(self._ready)
+                if action.kind == 'delete' and not self._bind_delete(action):
+                    continue
+                bucket = self._bucket(action, now)
+                wait = bucket.delay(now)
+                if wait > 0:
+                    heapq.heappush(self._delayed, (now + wait, seq, action))
+                    continue
+                bucket.take()
+                self._global.take()
+                return action
+
+            timeout = self._delayed[0][0] - now if self._delayed else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, action: _Action):
+        try:
+            result = await action.call()
+        except TelegramRetryAfter as e:
+            action.attempts += 1
+            if action.attempts > self.max_retries:
+                self.metrics['dropped'] += 1
+                logging.warning(f"Очередь действий: чат {action.chat_id}, действие отброшено после {action.attempts} попыток")
+                if action.future is not None and not action.future.done():
+                    action.future.set_exception(e)
+                return
+            self.metrics['retried'] += 1
+            now = time.monotonic()
+            self._bucket(action, now).blocked_until = now + e.retry_after
+            heapq.heappush(self._delayed, (now + e.retry_after, next(self._seq), action))
+            self._wakeup.set()
+        except Exception as e:
+            self.metrics['failed'] += 1
+            if action.future is not None and not action.future.done():
+                action.future.set_exception(e)
+        else:
+            self.metrics['sent'] += 1
+            if action.future is not None and not action.future.done():
+                action.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    async def _loop(self):
+        while True:
+            action = await self._next()
+            await self._slots.acquire()
+            task = asyncio.create_task(self._execute(action))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self, timeout: float = 5.0):
+        """Дает дойти уже начатым запросам; остальное в очереди теряется."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self._in_flight:
+            await asyncio.wait(self._in_flight, timeout=timeout)
+
+    # === МЕТРИКИ ===
+    def depth(self) -> int:
+        return len(self._ready) + len(self._delayed)
+
+    def snapshot(self) -> dict:
+        by_priority = Counter(action.priority for _, _, action in self._ready + self._delayed)
+        return {
+            'moderation': by_priority[PRIORITY_MODERATION],
+            'notice': by_priority[PRIORITY_NOTICE],
+            'delayed': len(self._delayed),
+            'in_flight': len(self._in_flight),
+            **{name: self.metrics[name] for name in ('submitted', 'sent', 'retried', 'coalesced', 'dropped', 'failed')},
+        }
+
+action_queue = ActionQueue()
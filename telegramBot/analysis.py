@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from config import ANALYSIS_WORKERS, ANALYSIS_INLINE_LIMIT, ANALYSIS_MAX_PENDING, ANALYSIS_TIMEOUT
+from utils import content_verdict, similarity_ratio, flood_control
+
+# === ИСПОЛНИТЕЛЬ АНАЛИЗА ===
+class AnalysisExecutor:
+    """
+    Запускает тяжелый анализ текста вне цикла событий.
+    Короткие тексты (меньше inline_limit символов) проверяются сразу в основном процессе,
+    длинные — в ProcessPoolExecutor. Если в работе уже max_pending задач или задача
+    не уложилась в timeout, возвращается запасной вердикт, а бот продолжает обрабатывать апдейты.
+    """
+    LATENCY_SAMPLES = 1000
+
+    def __init__(self, workers: int = ANALYSIS_WORKERS, inline_limit: int = ANALYSIS_INLINE_LIMIT,
+                 max_pending: int = ANALYSIS_MAX_PENDING, timeout: float = ANALYSIS_TIMEOUT):
+        self.workers = workers
+        self.inline_limit = inline_limit
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.pending = 0  # Задачи в пуле, включая те, что уже не дождались (timeout)
+        self.max_seen_pending = 0
+        self.counters = {'inline': 0, 'offloaded': 0, 'rejected': 0, 'timeouts': 0, 'errors': 0}
+        self.latency = {mode: deque(maxlen=self.LATENCY_SAMPLES) for mode in ('inline', 'offloaded')}
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def _release(self):
+        self.pending -= 1
+
+    def _release_from_pool(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass # Цикл уже закрыт при остановке бота
+
+    async def run(self, func, *args, size: int, fallback):
+        """
+        func(*args) в основном процессе или в пуле, в зависимости от size.
+        fallback — вызываемый объект для запасного вердикта (перегрузка, таймаут, ошибка).
+        """
+        started = time.perf_counter()
+        if self.workers <= 0 or size < self.inline_limit:
+            result = func(*args)
+            self.counters['inline'] += 1
+            self.latency['inline'].append(time.perf_counter() - started)
+            return result
+
+        if self.pending >= self.max_pending:
+            self.counters['rejected'] += 1
+            return fallback()
+
+        loop = asyncio.get_running_loop()
+        try:
+            future = self._get_pool().submit(func, *args)
+        except BrokenProcessPool:
+            self._pool = None
+            self.counters['errors'] += 1
+            return fallback()
+        # Счетчик уменьшается, когда воркер действительно освободился, а не когда мы перестали ждать
+        self.pending += 1
+        self.max_seen_pending = max(self.max_seen_pending, self.pending)
+        future.add_done_callback(lambda _: self._release_from_pool(loop))
+
+        try:
+            result = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            return fallback()
+        except BrokenProcessPool:
+            self._pool = None
+            self.counters['errors'] += 1
+            return fallback()
+        except Exception as e:
+            logging.error(f"Анализ: ошибка в пуле: {e}")
+            self.counters['errors'] += 1
+            return fallback()
+        self.counters['offloaded'] += 1
+        self.latency['offloaded'].append(time.perf_counter() - started)
+        return result
+
+    @staticmethod
+    def _percentile(samples, q):
+        if not samples: return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self) -> dict:
+        """Счетчики, глубина очереди и задержки (мс) по последним LATENCY_SAMPLES задачам."""
+        stats = dict(self.counters)
+        stats['pending'] = self.pending
+        stats['max_pending'] = self.max_seen_pending
+        for mode, samples in self.latency.items():
+            stats[f'{mode}_p50_ms'] = round(self._percentile(samples, 0.50) * 1000, 2)
+            stats[f'{mode}_p99_ms'] = round(self._percentile(samples, 0.99) * 1000, 2)
+        return stats
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        logging.info(f"Анализ: {self.snapshot()}")
+
+analysis_executor = AnalysisExecutor()
+
+# === ПРОВЕРКИ ===
+
+async def check_content(text: str, chat_id: int, whitelist, badwords, versions) -> str:
+    """
+    Причина удаления сообщения или None. versions — (версия whitelist, версия badwords).
+    При перегрузке пула — только ссылки и точные совпадения, это дешево и без ложных срабатываний.
+    """
+    whitelist_key, badwords_key = (chat_id, versions[0]), (chat_id, versions[1])
+    return await analysis_executor.run(
+        content_verdict, text, whitelist, badwords, whitelist_key, badwords_key,
+        size=len(text),
+        fallback=lambda: content_verdict(text, whitelist, badwords, whitelist_key, badwords_key, fuzzy=False),
+    )
+
+async def flood_similarity(user_id: int, text: str):
+    """
+    Похожесть на предыдущее сообщение для flood_control.check(). Точный повтор засчитывает хранилище счета.
+    None для общего хранилища: оно сравнит само, без лишнего чтения.
+    """
+    if not flood_control.backend.local:
+        return None
+    previous = await flood_control.last_message(user_id)
+    clean_text = text.lower().strip()
+    if not previous or clean_text == previous:
+        return 0.0
+    # При перегрузке считаем сообщение непохожим: дубликаты все равно ловятся сравнением строк
+    return await analysis_executor.run(
+        similarity_ratio, clean_text, previous,
+        size=len(clean_text) + len(previous),
+        fallback=lambda: 0.0,
+    )
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+# Замеры производительности. Запуск из папки telegramBot: python -m benchmarks.<имя>
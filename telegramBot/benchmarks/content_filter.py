@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+Замер фильтра контента по стадиям: нормализация, ссылки, точный и нечеткий поиск слов,
+сборка matcher'а и антифлуд. Для каждой стадии — сообщений в секунду и p50/p99 задержки.
+
+    python -m benchmarks.content_filter [--messages 5000] [--badwords 10,100,1000,10000]
+                                        [--whitelist 0,10,100,1000] [--output results.json]
+    python -m benchmarks.content_filter --compare old.json new.json [--tolerance 0.15]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import sys
+import time
+
+from benchmarks.corpus import make_badwords, make_whitelist, make_chat
+from utils import TextAnalyzer, LinkClassifier, SmartFloodControl
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _summary(samples, total):
+    samples.sort()
+    return {
+        'ops_per_sec': round(len(samples) / total, 1) if total else 0.0,
+        'p50_us': round(_percentile(samples, 0.50) / 1000, 2),
+        'p99_us': round(_percentile(samples, 0.99) / 1000, 2),
+    }
+
+def measure(func, items):
+    """Прогон func по items: {'ops_per_sec', 'p50_us', 'p99_us'}."""
+    samples = []
+    perf = time.perf_counter_ns
+    started = perf()
+    for item in items:
+        t0 = perf()
+        func(item)
+        samples.append(perf() - t0)
+    return _summary(samples, (perf() - started) / 1e9)
+
+async def measure_async(func, items):
+    """measure() для корутин: каждый вызов дожидается результата в одном цикле событий."""
+    samples = []
+    perf = time.perf_counter_ns
+    started = perf()
+    for item in items:
+        t0 = perf()
+        await func(item)
+        samples.append(perf() - t0)
+    return _summary(samples, (perf() - started) / 1e9)
+
+def run_case(rng, messages_count, badwords_count, whitelist_count):
+    badwords = make_badwords(rng, badwords_count)
+    whitelist = make_whitelist(rng, whitelist_count)
+    chat = make_chat(rng, messages_count, badwords, whitelist)
+    texts = [text for _, text in chat]
+
+    # Свежие экземпляры: кеши matcher'ов не переходят между случаями
+    analyzer = TextAnalyzer()
+    links = LinkClassifier()
+    flood = SmartFloodControl()
+
+    stages = {}
+    started = time.perf_counter()
+    analyzer.matcher(badwords, key='bench')
+    links.whitelist(whitelist, key='bench')
+    stages['build'] = {'ms': round((time.perf_counter() - started) * 1000, 2)}
+
+    prepared = [analyzer.prepare(text) for text in texts]
+    stages['normalize'] = measure(analyzer.prepare, texts)
+    stages['links'] = measure(lambda n: links.forbidden_links(n.lower, whitelist, key='bench'), prepared)
+    stages['badwords_exact'] = measure(
+        lambda n: analyzer.is_bad_word(n, badwords, key='bench', fuzzy=False), prepared)
+    stages['badwords_full'] = measure(lambda n: analyzer.is_bad_word(n, badwords, key='bench'), prepared)
+    # check() — корутина: весь прогон в одном цикле событий, как в боте
+    stages['flood'] = asyncio.run(measure_async(lambda m: flood.check(m[0], m[1]), chat))
+
+    hits = sum(analyzer.is_bad_word(n, badwords, key='bench') for n in prepared)
+    return {
+        'badwords': badwords_count,
+        'whitelist': whitelist_count,
+        'messages': len(texts),
+        'badword_hits': hits,
+        'stages': stages,
+    }
+
+def case_name(case):
+    return f"bw={case['badwords']} wl={case['whitelist']}"
+
+def run(args):
+    cases = []
+    for badwords_count in args.badwords:
+        for whitelist_count in args.whitelist:
+            rng = random.Random(f"{args.seed}:{badwords_count}:{whitelist_count}")
+            case = run_case(rng, args.messages, badwords_count, whitelist_count)
+            cases.append(case)
+            stages = case['stages']
+            print(f"{case_name(case):<20} build {stages['build']['ms']:8.1f} мс  " + "  ".join(
+                f"{stage} {data['ops_per_sec']:>9.0f}/с p99 {data['p99_us']:>7.1f}мкс"
+                for stage, data in stages.items() if stage != 'build'
+            ))
+    result = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'seed': args.seed,
+        'cases': cases,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены в {args.output}")
+    return 0
+
+def compare(old_path, new_path, tolerance):
+    """Сравнивает два прогона; регрессия — падение ops/сек или рост p50/p99 больше чем на tolerance."""
+    with open(old_path, encoding='utf-8') as f:
+        old = {case_name(c): c for c in json.load(f)['cases']}
+    with open(new_path, encoding='utf-8') as f:
+        new = {case_name(c): c for c in json.load(f)['cases']}
+
+    regressions = 0
+    for name in sorted(old.keys() & new.keys(), key=lambda n: (old[n]['badwords'], old[n]['whitelist'])):
+        for stage, before in old[name]['stages'].items():
+            after = new[name]['stages'].get(stage)
+            if not after:
+                continue
+            for metric, higher_is_better in (('ops_per_sec', True), ('p50_us', False), ('p99_us', False), ('ms', False)):
+                if metric not in before or metric not in after or not before[metric]:
+                    continue
+                change = (after[metric] - before[metric]) / before[metric]
+                worse = -change if higher_is_better else change
+                if worse > tolerance:
+                    regressions += 1
+                    print(f"❌ {name} {stage}.{metric}: {before[metric]} -> {after[metric]} ({change:+.0%})")
+                elif worse < -tolerance:
+                    print(f"✅ {name} {stage}.{metric}: {before[metric]} -> {after[metric]} ({change:+.0%})")
+    missing = old.keys() - new.keys()
+    if missing:
+        print(f"⚠️ Нет в новом прогоне: {', '.join(sorted(missing))}")
+    print(f"Регрессий: {regressions} (порог {tolerance:.0%})")
+    return 1 if regressions else 0
+
+def _sizes(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--badwords', type=_sizes, default=[10, 100, 1000, 10000])
+    parser.add_argument('--whitelist', type=_sizes, default=[0, 10, 100, 1000])
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='Файл JSON для результатов')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Сравнить два JSON-прогона')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Допустимое ухудшение (доля)')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return compare(*args.compare, args.tolerance)
+    return run(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Синтетические чаты для замеров: смесь русского и английского, ссылки, упоминания, обходы фильтра."""
+import random
+
+RU_WORDS = (
+    "привет как дела что нового сегодня завтра вчера хорошо плохо нормально спасибо пожалуйста "
+    "да нет может быть конечно давай пойдем смотри слушай знаешь думаю кажется вообще короче "
+    "работа учеба дом игра матч команда чат бот сообщение вопрос ответ время день ночь утро вечер "
+    "деньги цена скидка купить продать бесплатно подписка канал группа ссылка видео фото музыка "
+    "кто где когда почему зачем сколько очень тоже уже еще только просто вот там тут здесь"
+).split()
+EN_WORDS = (
+    "hello hi how are you today tomorrow good bad fine thanks please yes no maybe sure lets go look "
+    "listen know think seems work study home game match team chat bot message question answer time "
+    "day night morning evening money price discount buy sell free subscribe channel group link video "
+    "photo music who where when why what very also already only just here there lol ok"
+).split()
+TLDS = ('com', 'ru', 'org', 'net', 'io', 'me', 'info', 'xyz')
+ALPHABET_RU = 'абвгдежзиклмнопрстуфхцчшыэюя'
+ALPHABET_EN = 'abcdefghijklmnopqrstuvwxyz'
+
+# Обходы фильтра: латиница вместо кириллицы, leet, растягивание букв, невидимые символы
+HOMOGLYPHS = {'а': 'a', 'е': 'e', 'о': 'o', 'р': 'p', 'с': 'c', 'у': 'y', 'х': 'x'}
+LEET = {'a': '4', 'e': '3', 'o': '0', 'i': '1', 's': '5', 't': '7'}
+
+def random_word(rng, alphabet, min_len=3, max_len=9):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(min_len, max_len)))
+
+def make_badwords(rng, count):
+    words = set()
+    while len(words) < count:
+        alphabet = ALPHABET_RU if rng.random() < 0.7 else ALPHABET_EN
+        words.add(random_word(rng, alphabet, 3, 10))
+    return sorted(words)
+
+def make_domain(rng):
+    return f"{random_word(rng, ALPHABET_EN, 3, 10)}.{rng.choice(TLDS)}"
+
+def make_whitelist(rng, count):
+    items = set()
+    while len(items) < count:
+        roll = rng.random()
+        if roll < 0.7:
+            items.add(make_domain(rng))
+        elif roll < 0.85:
+            items.add(f"t.me/{random_word(rng, ALPHABET_EN, 5, 12)}")
+        else:
+            items.add(f"@{random_word(rng, ALPHABET_EN, 5, 12)}")
+    return sorted(items)
+
+def disguise(rng, word):
+    roll = rng.random()
+    if roll < 0.25:
+        return ''.join(HOMOGLYPHS.get(c, c) for c in word)
+    if roll < 0.45:
+        return ''.join(LEET.get(c, c) for c in word)
+    if roll < 0.6:
+        pos = rng.randrange(len(word))
+        return word[:pos] + word[pos] * rng.randint(2, 5) + word[pos + 1:]
+    if roll < 0.7:
+        pos = rng.randrange(1, len(word)) if len(word) > 1 else 0
+        return word[:pos] + '​' + word[pos:]
+    return word
+
+def make_message(rng, badwords, whitelist, long_ratio=0.02):
+    words = RU_WORDS if rng.random() < 0.6 else EN_WORDS
+    length = rng.randint(40, 400) if rng.random() < long_ratio else rng.randint(1, 25)
+    tokens = [rng.choice(words) for _ in range(length)]
+
+    roll = rng.random()
+    if roll < 0.08 and badwords:
+        tokens.insert(rng.randrange(len(tokens) + 1), disguise(rng, rng.choice(badwords)))
+    elif roll < 0.14:
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(('https://', 'www.', '')) + make_domain(rng))
+    elif roll < 0.18 and whitelist:
+        tokens.insert(rng.randrange(len(tokens) + 1), rng.choice(whitelist))
+    elif roll < 0.22:
+        tokens.insert(rng.randrange(len(tokens) + 1), '@' + random_word(rng, ALPHABET_EN, 5, 12))
+
+    text = ' '.join(tokens)
+    if rng.random() < 0.3:
+        text = text.capitalize() + rng.choice(('', '!', '?', '...', ')))'))
+    return text
+
+def make_chat(rng, count, badwords, whitelist, users=50):
+    """[(user_id, текст), ...] — поток сообщений чата; часть пользователей пишет очередями."""
+    messages = []
+    while len(messages) < count:
+        user_id = rng.randrange(users)
+        text = make_message(rng, badwords, whitelist)
+        burst = rng.randint(2, 6) if rng.random() < 0.05 else 1
+        messages.extend((user_id, text) for _ in range(burst))
+    return messages[:count]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Сравнение нечеткого поиска запрещенных слов: полный перебор SequenceMatcher
+(как было раньше) против FuzzyIndex. Проверяет, что вердикты совпадают.
+
+    python -m benchmarks.fuzzy_badwords [--words 500] [--messages 3000] [--seed 1]
+"""
+import argparse
+import difflib
+import random
+import sys
+import time
+
+from utils import FuzzyIndex
+
+ALPHABET_RU = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+ALPHABET_EN = 'abcdefghijklmnopqrstuvwxyz'
+
+def legacy_find(token, words, ratio=0.85):
+    """Прежняя реализация: каждое слово сообщения с каждым запрещенным словом."""
+    for bad in words:
+        if difflib.SequenceMatcher(None, token, bad).ratio() > ratio:
+            return True
+    return False
+
+def random_word(rng, alphabet, min_len=2, max_len=10):
+    return ''.join(rng.choice(alphabet) for _ in range(rng.randint(min_len, max_len)))
+
+def mutate(rng, word, alphabet):
+    """Опечатка: замена, вставка, удаление или перестановка соседних букв."""
+    chars = list(word)
+    for _ in range(rng.randint(1, 2)):
+        pos = rng.randrange(len(chars))
+        op = rng.choice('sidt')
+        if op == 's':
+            chars[pos] = rng.choice(alphabet)
+        elif op == 'i':
+            chars.insert(pos, rng.choice(alphabet))
+        elif op == 'd' and len(chars) > 2:
+            del chars[pos]
+        elif op == 't' and pos + 1 < len(chars):
+            chars[pos], chars[pos + 1] = chars[pos + 1], chars[pos]
+    return ''.join(chars)
+
+def build_corpus(rng, words_count, messages_count):
+    badwords = set()
+    while len(badwords) < words_count:
+        alphabet = ALPHABET_RU if rng.random() < 0.6 else ALPHABET_EN
+        badwords.add(random_word(rng, alphabet, 4, 10))
+    badwords = sorted(badwords)
+
+    tokens = []
+    for _ in range(messages_count):
+        alphabet = ALPHABET_RU if rng.random() < 0.6 else ALPHABET_EN
+        roll = rng.random()
+        if roll < 0.3:
+            tokens.append(mutate(rng, rng.choice(badwords), alphabet))
+        elif roll < 0.4:
+            tokens.append(rng.choice(badwords))
+        else:
+            tokens.append(random_word(rng, alphabet))
+    return badwords, tokens
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--words', type=int, default=500)
+    parser.add_argument('--messages', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    badwords, tokens = build_corpus(rng, args.words, args.messages)
+
+    started = time.perf_counter()
+    expected = [legacy_find(token, badwords) for token in tokens]
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = FuzzyIndex(badwords)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = [index.find(token) for token in tokens]
+    index_time = time.perf_counter() - started
+
+    candidates = sum(sum(1 for _ in index.candidates(token)) for token in tokens)
+    mismatches = [token for token, a, b in zip(tokens, expected, actual) if a != b]
+
+    print(f"Слов: {len(badwords)}, токенов: {len(tokens)}, совпадений: {sum(expected)}")
+    print(f"Перебор:     {legacy_time * 1000:9.1f} мс ({legacy_time / len(tokens) * 1e6:8.1f} мкс/токен)")
+    print(f"FuzzyIndex:  {index_time * 1000:9.1f} мс ({index_time / len(tokens) * 1e6:8.1f} мкс/токен), "
+          f"построение {build_time * 1000:.1f} мс")
+    print(f"Кандидатов на токен: {candidates / len(tokens):.2f} (вместо {len(badwords)})")
+    if mismatches:
+        print(f"❌ Вердикты расходятся: {len(mismatches)}, например {mismatches[:5]}")
+        return 1
+    print("✅ Вердикты совпадают")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
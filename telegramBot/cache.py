@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+import sys
+import time
+from collections import OrderedDict
+
+# Все созданные кеши по имени: для отчета о памяти (/cache_stats)
+registry = {}
+
+_MISSING = object()
+
+class _Entry:
+    __slots__ = ('value', 'expires_at')
+
+    def __init__(self, value, expires_at):
+        self.value = value
+        self.expires_at = expires_at
+
+class TTLCache:
+    """
+    Словарь с ограничением по размеру и времени жизни записей.
+    Записи упорядочены по времени последней записи (set), поэтому истекшие
+    всегда в начале: очистка идет с головы за O(1) на запись, без обхода всего кеша.
+    При переполнении вытесняется запись, которую дольше всех не обновляли.
+    ttl=None — записи не истекают, только вытесняются по размеру.
+    """
+    def __init__(self, name: str, maxsize: int, ttl: float = None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict() # { key: _Entry }
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        registry[name] = self
+
+    def _expire(self, now):
+        if self.ttl is None:
+            return
+        data = self._data
+        while data:
+            entry = next(iter(data.values()))
+            if entry.expires_at > now:
+                break
+            data.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key, default=None):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if self.ttl is not None and entry.expires_at <= time.monotonic():
+            del self._data[key]
+            self.evictions += 1
+            self.misses += 1
+            return default
+        self.hits += 1
+        return entry.value
+
+    def set(self, key, value):
+        now = time.monotonic()
+        self._expire(now)
+        expires_at = now + self.ttl if self.ttl is not None else None
+        entry = self._data.get(key)
+        if entry is None:
+            self._data[key] = _Entry(value, expires_at)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        else:
+            entry.value = value
+            entry.expires_at = expires_at
+            self._data.move_to_end(key)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry.value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    __setitem__ = set
+
+    def __delitem__(self, key):
+        del self._data[key]
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        self._data.clear()
+
+    def size_report(self) -> dict:
+        """Число записей, лимиты, попадания и примерный объем в байтах (ключи + записи, без вложенных значений)."""
+        self._expire(time.monotonic())
+        approx = sys.getsizeof(self._data) + sum(
+            sys.getsizeof(key) + sys.getsizeof(entry) + sys.getsizeof(entry.value)
+            for key, entry in self._data.items()
+        )
+        return {
+            'entries': len(self._data),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'bytes': approx,
+        }
+
+def cache_report() -> dict:
+    """{ имя кеша: size_report() } по всем кешам процесса."""
+    return {name: cache.size_report() for name, cache in registry.items()}
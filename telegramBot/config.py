@@ -6,11 +6,78 @@ OWNER_ID = 1089429471
 
 # Настройки модерации
 WARN_LIMIT = 3  # Количество варнов до бана
+WARN_EXPIRE_DAYS = 30     # Через сколько дней варн сгорает (0 — никогда)
+WARN_SWEEP_INTERVAL = 3600 # Секунд между очистками истекших варнов
+WARN_SWEEP_BATCH = 500    # Сколько варнов удалять за одну транзакцию
+BLOCK_MENTIONS = False    # Считать @упоминания (не из белого списка) рекламой
 AUTO_DELETE_TIME = 60 # Время жизни сообщений бота (секунды)
 
+# ID основного чата: в него переносятся XP, варны и права из старой общей базы
+# (до разделения данных по чатам). Обязательно укажите ID группы перед обновлением
+# старой базы: с 0 миграция остановится с ошибкой, чтобы не потерять данные.
+# Старые таблицы с данными сохраняются в базе с суффиксом _legacy.
+LEGACY_CHAT_ID = 0
+
+# Движок хранения данных: "sqlite" (файл bot_database.db) или "memory" (без сохранения, для тестовых прогонов)
+STORAGE_BACKEND = "sqlite"
+
 # Настройки опыта (ВОТ ЭТОЙ СТРОКИ НЕ ХВАТАЛО)
 DEFAULT_XP_PER_MSG = (1, 5) # Диапазон опыта за сообщение (мин, макс)
 
+# Отложенная запись XP за сообщения (сброс в БД одной транзакцией)
+XP_FLUSH_INTERVAL = 10    # Секунд между сбросами
+XP_FLUSH_MAX_EVENTS = 100 # Досрочный сброс после стольких начислений
+
+# Кеш строк пользователей перед get_user
+USER_CACHE_SIZE = 5000 # Максимум записей (вытеснение самых давних)
+USER_CACHE_TTL = 300   # Время жизни записи (секунды)
+
+# Кеши состояния по пользователям (антифлуд, кулдауны): максимум записей в каждом
+STATE_CACHE_SIZE = 50000
+
+# Хранилище счета антифлуда: "memory" (в процессе бота) или "sqlite" (общий файл FLOOD_DB,
+# нужен, если обновления обрабатывают несколько процессов)
+FLOOD_BACKEND = "memory"
+FLOOD_DB = "flood_state.db"
+
+# Кеш администраторов чатов (обновляется и по событиям chat_member)
+CHAT_ADMINS_TTL = 600   # Полная перезагрузка списка не чаще (секунды)
+
+# Рейды: один и тот же (или почти) текст от разных пользователей
+RAID_WINDOW = 120       # Окно поиска похожих сообщений (секунды)
+RAID_MAX_MESSAGES = 300 # Сообщений в окне одного чата
+RAID_MAX_CHATS = 1000   # Чатов с окнами в памяти (самые давние вытесняются)
+RAID_MIN_USERS = 6      # Столько разных авторов похожего текста — рейд
+RAID_MIN_LENGTH = 15    # Более короткие тексты не проверяются («привет», «+»)
+RAID_MUTE_TIME = 3600   # Блокировка участников рейда (секунды)
+RAID_JOIN_WINDOW = 86400 # Вступивший в чат не раньше стольких секунд назад считается новичком
+# Рейд — только рассылка со ссылкой или @упоминанием (удаляются и блокируются все авторы)
+# или от новичков (только они); одинаковые поздравления старых участников не трогаются
+
+# Анализ длинных текстов в отдельных процессах (фильтр слов, сравнение для антифлуда)
+ANALYSIS_WORKERS = 2        # Процессов в пуле (0 — все в основном процессе)
+ANALYSIS_INLINE_LIMIT = 1000 # Тексты короче (символов) проверяются сразу, без пула
+ANALYSIS_MAX_PENDING = 32   # Больше задач в пуле — запасной вердикт без ожидания
+ANALYSIS_TIMEOUT = 2.0      # Секунд на одну задачу
+
+# Очередь исходящих запросов к Telegram (муты, баны, удаления, уведомления)
+ACTION_GLOBAL_RATE = 25  # Запросов в секунду на весь бот
+ACTION_CHAT_RATE = 0.33  # Сообщений бота в секунду в одном чате (Telegram: ~20 в минуту на группу)
+ACTION_CHAT_BURST = 3    # Запас сообщений на всплеск в одном чате
+ACTION_CHAT_MOD_RATE = 1.0 # Удалений, мутов и банов в секунду в одном чате (отдельно от сообщений)
+ACTION_CHAT_MOD_BURST = 10 # Запас таких запросов на всплеск в одном чате
+ACTION_MAX_QUEUE = 1000  # Уведомления сверх этого отбрасываются (модерация — никогда)
+ACTION_CONCURRENCY = 8   # Одновременных запросов
+ACTION_MAX_RETRIES = 5   # Повторов после TelegramRetryAfter
+
+# Журнал последних сообщений чата для /purge и /clean
+MESSAGE_LOG_SIZE = 1000   # Сообщений на чат (кольцевой буфер)
+MESSAGE_LOG_CHATS = 1000  # Чатов в памяти (самые давние вытесняются)
+
+# Отложенное удаление сообщений бота (сохраняется в БД и переживает перезапуск)
+SCHEDULE_FLUSH_INTERVAL = 5 # Секунд между записями изменений в БД
+SCHEDULE_PERSIST_MIN = 30   # Более короткие удаления в БД не пишутся
+
 # Команды для меню (чтобы они подсказывались)
 COMMANDS = [
     BotCommand(command="start", description="Запустить бота"),
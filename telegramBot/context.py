@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Контекст апдейта: строка пользователя, уровень доступа и списки чата
+загружаются один раз и передаются обработчикам через data
+(аргументы user_row, user_level, chat_settings, query_stats).
+"""
+import logging
+from collections import Counter, namedtuple
+from typing import Callable, Dict, Any, Awaitable
+from aiogram import BaseMiddleware, types
+from database import get_user, get_list, list_version
+from storage import query_stats
+from modules.moderation import get_sender_level, LVL_USER
+
+# Белый список и фильтр слов чата (вместе с глобальными) и их версии для кеша анализа
+ChatSettings = namedtuple('ChatSettings', 'whitelist badwords versions')
+
+async def load_chat_settings(chat_id: int) -> ChatSettings:
+    return ChatSettings(
+        await get_list('whitelist', chat_id),
+        await get_list('badwords', chat_id),
+        (list_version('whitelist'), list_version('badwords')),
+    )
+
+class ContextMiddleware(BaseMiddleware):
+    """
+    Внешний middleware диспетчера: срабатывает до всех роутеров.
+    get_user с обновлением имени вызывается здесь и больше нигде для автора апдейта.
+    """
+    async def __call__(
+        self,
+        handler: Callable[[types.TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: types.TelegramObject,
+        data: Dict[str, Any]
+    ) -> Any:
+        stats = Counter()
+        token = query_stats.set(stats)
+        try:
+            user = data.get('event_from_user')
+            chat = data.get('event_chat')
+            data['query_stats'] = stats
+            data['user_row'] = None
+            data['user_level'] = LVL_USER
+            data['chat_settings'] = None
+            if user and chat:
+                row = await get_user(chat.id, user.id, user.username, user.full_name)
+                data['user_row'] = row
+                data['user_level'] = await get_sender_level(chat, user.id, row)
+                if chat.type != 'private':
+                    data['chat_settings'] = await load_chat_settings(chat.id)
+            return await handler(event, data)
+        finally:
+            query_stats.reset(token)
+            logging.debug(f"Апдейт {getattr(event, 'update_id', '?')}: обращения к данным {dict(stats)}")
@@ -1,307 +1,564 @@
-import aiosqlite
+import asyncio
 import logging
 import time
-import json
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
 from datetime import datetime
+from config import (
+    XP_FLUSH_INTERVAL, XP_FLUSH_MAX_EVENTS, USER_CACHE_SIZE, USER_CACHE_TTL, STORAGE_BACKEND,
+    WARN_EXPIRE_DAYS, WARN_SWEEP_INTERVAL, WARN_SWEEP_BATCH
+)
+from levels import LEVEL_CAPS, LEVEL_THRESHOLDS, MAX_LEVEL, level_from_total, total_from_level
+from storage import create_storage, count_query, GLOBAL_CHAT_ID, LIST_TABLES
 
-DB_NAME = 'bot_database.db'
+# Движок хранения (см. storage/). Все функции ниже работают только через него
+storage = create_storage(STORAGE_BACKEND)
 
-# Конфигурация уровней (XP Cap для каждого уровня)
-LEVEL_CAPS = {
-    1: 500,
-    2: 2000,
-    3: 8000,
-    4: 25000,
-    5: float('inf')
-}
+# === КЕШ ПОЛЬЗОВАТЕЛЕЙ ===
+class UserCache:
+    """
+    LRU-кеш строк пользователей с TTL, ключ (chat_id, user_id).
+    Любая запись в строку пользователя должна вызывать invalidate() после коммита.
+    """
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._rows = OrderedDict() # { (chat_id, user_id): (row, expires_at) }
+        # Счетчик инвалидаций: строка, прочитанная до инвалидации, в кеш не попадет
+        self.generation = 0
+
+    def get(self, key):
+        entry = self._rows.get(key)
+        if entry is None:
+            return None
+        row, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._rows[key]
+            return None
+        self._rows.move_to_end(key)
+        return row
+
+    def put(self, key, row, generation: int = None):
+        if generation is not None and generation != self.generation:
+            return
+        self._rows[key] = (row, time.monotonic() + self.ttl)
+        self._rows.move_to_end(key)
+        while len(self._rows) > self.maxsize:
+            self._rows.popitem(last=False)
+
+    def invalidate(self, key):
+        self.generation += 1
+        self._rows.pop(key, None)
+
+    def clear(self):
+        self.generation += 1
+        self._rows.clear()
+
+user_cache = UserCache()
+
+# === ИНДЕКС РЕЙТИНГА ===
+class RankIndex:
+    """
+    Отсортированный список (total_xp, user_id) участников одного чата.
+    Место в рейтинге ищется бинарным поиском вместо COUNT(*) по таблице.
+    top_version растет при каждом изменении, затрагивающем топ TOP_N.
+    """
+    TOP_N = 10
+
+    def __init__(self, totals: dict = None):
+        self.top_version = 0
+        self._by_user = dict(totals or {})  # { user_id: total_xp }
+        self._entries = sorted((total, user_id) for user_id, total in self._by_user.items())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _in_top(self, total_xp, user_id) -> bool:
+        position = bisect_left(self._entries, (total_xp, user_id))
+        return len(self._entries) - position <= self.TOP_N
+
+    def update(self, user_id, total_xp):
+        old = self._by_user.get(user_id)
+        if old == total_xp: return
+        was_top = old is not None and self._in_top(old, user_id)
+        if old is not None:
+            del self._entries[bisect_left(self._entries, (old, user_id))]
+        insort(self._entries, (total_xp, user_id))
+        self._by_user[user_id] = total_xp
+        # Топ меняется, только если пользователь был в нем или вошел в него
+        if was_top or self._in_top(total_xp, user_id):
+            self.top_version += 1
+
+    def add_if_missing(self, user_id, total_xp=0):
+        if user_id not in self._by_user:
+            self.update(user_id, total_xp)
+
+    def touch(self, user_id):
+        """Сообщает об изменении отображаемых данных (имени) пользователя."""
+        total = self._by_user.get(user_id)
+        if total is not None and self._in_top(total, user_id):
+            self.top_version += 1
+
+    def top(self, limit):
+        """[(user_id, total_xp), ...] по убыванию XP."""
+        return [(user_id, total) for total, user_id in reversed(self._entries[-limit:])] if limit > 0 else []
+
+    def rank(self, user_id):
+        """Место пользователя (1 = первый) или None, если юзер неизвестен."""
+        total = self._by_user.get(user_id)
+        if total is None: return None
+        # Выше нас все, у кого XP строго больше
+        return len(self._entries) - bisect_right(self._entries, (total, float('inf'))) + 1
+
+class ChatRankIndexes:
+    """
+    Индексы рейтинга по чатам. Загружаются одним запросом при старте;
+    пока загрузки не было (loaded = False), for_chat() возвращает None и запросы идут через SQL.
+    """
+    def __init__(self):
+        self.loaded = False
+        self._chats = {}  # { chat_id: RankIndex }
+
+    async def load(self):
+        started = time.perf_counter()
+        rows = await storage.load_rank_totals()
+        grouped = {}
+        for chat_id, user_id, total in rows:
+            grouped.setdefault(chat_id, {})[user_id] = total or 0
+        self._chats = {chat_id: RankIndex(totals) for chat_id, totals in grouped.items()}
+        self.loaded = True
+        logging.info(f"Индекс рейтинга: {len(rows)} записей в {len(self._chats)} чатах "
+                     f"за {time.perf_counter() - started:.3f} с")
+
+    def for_chat(self, chat_id):
+        if not self.loaded: return None
+        # После загрузки отсутствие чата означает, что в нем еще нет участников
+        index = self._chats.get(chat_id)
+        if index is None:
+            index = self._chats[chat_id] = RankIndex()
+        return index
+
+    def update(self, chat_id, user_id, total_xp):
+        index = self.for_chat(chat_id)
+        if index is not None:
+            index.update(user_id, total_xp)
+
+    def add_if_missing(self, chat_id, user_id, total_xp=0):
+        index = self.for_chat(chat_id)
+        if index is not None:
+            index.add_if_missing(user_id, total_xp)
+
+    def touch(self, chat_id, user_id):
+        index = self.for_chat(chat_id)
+        if index is not None:
+            index.touch(user_id)
+
+rank_indexes = ChatRankIndexes()
+
+# === КЕШ СПИСКОВ ===
+class ListCache:
+    """
+    Белые списки и фильтры слов всех чатов в памяти. Загружаются один раз,
+    дальше меняются только вместе с БД через add_to_list / remove_from_list / clear_list_data,
+    поэтому проверка сообщений не обращается к БД.
+    versions[table] растет при каждом изменении таблицы: по нему лениво
+    пересобираются производные структуры (matcher слов, набор доменов).
+    """
+    def __init__(self):
+        self.loaded = False
+        self.versions = {table: 0 for table in LIST_TABLES}
+        self._items = {table: {} for table in LIST_TABLES}  # { table: { chat_id: {значение: None} } }
+        self._merged = {} # { (table, chat_id, include_global): tuple } для текущих версий
+        self._lock = asyncio.Lock()
+
+    async def load(self):
+        async with self._lock:
+            if self.loaded:
+                return
+            for table in LIST_TABLES:
+                items = {}
+                for chat_id, item in await storage.load_lists(table):
+                    items.setdefault(chat_id, {})[item] = None
+                self._items[table] = items
+                self._bump(table)
+            self.loaded = True
+
+    def _bump(self, table):
+        self.versions[table] += 1
+        self._merged = {key: value for key, value in self._merged.items() if key[0] != table}
+
+    def get(self, table, chat_id, include_global=True) -> tuple:
+        key = (table, chat_id, include_global)
+        items = self._merged.get(key)
+        if items is None:
+            chats = self._items[table]
+            merged = dict(chats.get(chat_id, {}))
+            if include_global and chat_id != GLOBAL_CHAT_ID:
+                merged.update(chats.get(GLOBAL_CHAT_ID, {}))
+            items = self._merged[key] = tuple(merged)
+        return items
+
+    def add(self, table, chat_id, item):
+        self._items[table].setdefault(chat_id, {})[item] = None
+        self._bump(table)
+
+    def remove(self, table, chat_id, item):
+        self._items[table].get(chat_id, {}).pop(item, None)
+        self._bump(table)
+
+    def clear(self, table, chat_id):
+        self._items[table].pop(chat_id, None)
+        self._bump(table)
+
+    def reset(self):
+        self.loaded = False
+        self._items = {table: {} for table in LIST_TABLES}
+        for table in LIST_TABLES:
+            self._bump(table)
+
+list_cache = ListCache()
+
+def use_storage(new_storage):
+    """Подменяет движок хранения (например, на MemoryStorage в нагрузочных прогонах) и сбрасывает кеши."""
+    global storage
+    storage = new_storage
+    user_cache.clear()
+    rank_indexes.loaded = False
+    rank_indexes._chats = {}
+    list_cache.reset()
 
 async def create_tables():
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 1. Основная таблица пользователей
-        await db.execute('''CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            full_name TEXT,
-            xp INTEGER DEFAULT 0,
-            level INTEGER DEFAULT 1,
-            warns INTEGER DEFAULT 0,
-            mod_level INTEGER DEFAULT 0,
-            reputation INTEGER DEFAULT 0,
-            last_wipe_date TEXT DEFAULT NULL
-        )''')
-        
-        # 2. Таблица истории репутации
-        await db.execute('''CREATE TABLE IF NOT EXISTS rep_history (
-            from_id INTEGER,
-            to_id INTEGER,
-            date_str TEXT,
-            PRIMARY KEY (from_id, to_id, date_str)
-        )''')
-
-        # МИГРАЦИИ (Для старых баз)
-        try:
-            await db.execute('SELECT full_name FROM users LIMIT 1')
-        except Exception:
-            print("⚠️ Миграция: full_name...")
-            try:
-                await db.execute('ALTER TABLE users ADD COLUMN full_name TEXT')
-            except: pass
+    await storage.create_tables()
 
-        try:
-            await db.execute('SELECT mod_level FROM users LIMIT 1')
-        except Exception:
-            print("⚠️ Миграция: mod_level...")
-            try:
-                await db.execute('ALTER TABLE users ADD COLUMN mod_level INTEGER DEFAULT 0')
-            except: pass
 
+def _with_buffered_xp(chat_id, row):
+    """Подставляет в строку пользователя еще не сброшенные из буфера xp и level."""
+    if not row: return row
+    buffered = xp_buffer.peek(chat_id, row[0])
+    if not buffered: return row
+    return row[:3] + buffered + row[5:]
+
+async def _fetch_user_row(chat_id, user_id):
+    generation = user_cache.generation
+    row = await storage.fetch_member(chat_id, user_id)
+    # Пользователь известен, но в этом чате еще не писал
+    if row and row[4] is None:
+        return row
+    if row:
+        user_cache.put((chat_id, user_id), row, generation)
+    return row
+
+async def get_user(chat_id, user_id, username=None, full_name=None):
+    count_query('user')
+    row = user_cache.get((chat_id, user_id))
+    if row is None:
         try:
-            await db.execute('SELECT reputation FROM users LIMIT 1')
-        except Exception:
-            print("⚠️ Миграция: reputation и last_wipe_date...")
-            try:
-                await db.execute('ALTER TABLE users ADD COLUMN reputation INTEGER DEFAULT 0')
-                await db.execute('ALTER TABLE users ADD COLUMN last_wipe_date TEXT DEFAULT NULL')
-            except: pass
-
-        # Индексы и остальные таблицы
-        await db.execute('CREATE INDEX IF NOT EXISTS idx_username ON users (username)')
-        await db.execute('CREATE INDEX IF NOT EXISTS idx_level_xp ON users (level DESC, xp DESC)') 
-        await db.execute('CREATE TABLE IF NOT EXISTS whitelist (item TEXT PRIMARY KEY)')
-        await db.execute('CREATE TABLE IF NOT EXISTS badwords (word TEXT PRIMARY KEY)')
-        await db.execute('''CREATE TABLE IF NOT EXISTS warn_reasons (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            user_id INTEGER, 
-            reason TEXT
-        )''')
-        
-        await db.commit()
-
-async def get_user(user_id, username=None, full_name=None):
-    async with aiosqlite.connect(DB_NAME) as db:
-        try:
-            cursor = await db.execute('''
-                SELECT user_id, username, full_name, xp, level, warns, mod_level, reputation 
-                FROM users WHERE user_id = ?
-            ''', (user_id,))
-            row = await cursor.fetchone()
+            row = await _fetch_user_row(chat_id, user_id)
         except Exception as e:
             print(f"Ошибка БД: {e}")
             row = None
-        
-        clean_username = username.lstrip('@').lower() if username else None
-
-        if not row:
-            if not username: username = "Unknown"
-            if not full_name: full_name = "User"
-            await db.execute('''
-                INSERT INTO users (user_id, username, full_name, xp, level, warns, mod_level, reputation) 
-                VALUES (?, ?, ?, 0, 1, 0, 0, 0)
-            ''', (user_id, clean_username, full_name))
-            await db.commit()
-            return (user_id, clean_username, full_name, 0, 1, 0, 0, 0)
-        else:
-            if username or full_name:
-                await db.execute('UPDATE users SET username = ?, full_name = ? WHERE user_id = ?', 
-                                 (clean_username, full_name, user_id))
-                await db.commit()
-            return row
+    
+    clean_username = username.lstrip('@').lower() if username else None
+
+    if not row or row[4] is None:
+        if row:
+            # Личность уже есть, создаем только запись участника чата
+            clean_username = clean_username or row[1]
+            full_name = full_name or row[2]
+        if not username: username = "Unknown"
+        if not full_name: full_name = "User"
+        await storage.create_member(chat_id, user_id, clean_username, full_name)
+        user_cache.invalidate((chat_id, user_id))
+        rank_indexes.add_if_missing(chat_id, user_id)
+        return (user_id, clean_username, full_name, 0, 1, 0, 0, 0)
+    else:
+        # Пишем только если имя действительно поменялось
+        if (username or full_name) and (row[1], row[2]) != (clean_username, full_name):
+            await storage.update_identity(user_id, clean_username, full_name)
+            user_cache.invalidate((chat_id, user_id))
+            rank_indexes.touch(chat_id, user_id)
+            row = (row[0], clean_username, full_name) + tuple(row[3:])
+            user_cache.put((chat_id, user_id), row)
+        return _with_buffered_xp(chat_id, row)
 
 async def get_id_by_username(username: str):
     clean_username = username.lstrip('@').lower()
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT user_id FROM users WHERE username = ?', (clean_username,))
-        row = await cursor.fetchone()
-        return row[0] if row else None
-
-async def update_xp(user_id, xp_amount):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT xp, level FROM users WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
-        if not row: return (0, 0, 0)
-        
-        current_xp, current_lvl = row
-        old_lvl = current_lvl
-        
-        new_xp = current_xp + xp_amount
-        
-        while new_xp < 0:
-            if current_lvl > 1:
-                current_lvl -= 1 
-                prev_cap = LEVEL_CAPS.get(current_lvl, 500)
-                new_xp = prev_cap + new_xp 
-            else:
-                new_xp = 0
-                break
-        
-        cap = LEVEL_CAPS.get(current_lvl, float('inf'))
-        while new_xp >= cap and current_lvl < 5:
-            new_xp -= cap 
-            current_lvl += 1
-            cap = LEVEL_CAPS.get(current_lvl, float('inf'))
-            
-        await db.execute('UPDATE users SET xp = ?, level = ? WHERE user_id = ?', (new_xp, current_lvl, user_id))
-        await db.commit()
-        return (old_lvl, current_lvl, xp_amount)
-
-async def give_reputation(from_user_id, to_user_id):
+    return await storage.get_id_by_username(clean_username)
+
+async def update_xp(chat_id, user_id, xp_amount):
+    # Несброшенный XP из буфера применяем тем же запросом,
+    # иначе буфер потом перезапишет результат устаревшими данными
+    return await xp_buffer.apply(chat_id, user_id, xp_amount)
+
+# === ОТЛОЖЕННАЯ ЗАПИСЬ XP ===
+class XPBuffer:
+    """
+    Копит начисления XP за сообщения в памяти и сбрасывает их в БД
+    одной транзакцией: раз в interval секунд или после max_events начислений.
+    Уровни считаются сразу по буферизованному состоянию, поэтому уведомления
+    о повышении приходят без ожидания сброса.
+    """
+    def __init__(self, interval: float = XP_FLUSH_INTERVAL, max_events: int = XP_FLUSH_MAX_EVENTS):
+        self.interval = interval
+        self.max_events = max_events
+        # { (chat_id, user_id): [total_xp, несброшенная_дельта] }
+        self._state = {}
+        self._events = 0
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def add(self, chat_id, user_id, xp_amount):
+        """Аналог update_xp без записи в БД. Возвращает (старый уровень, новый уровень, изменение)."""
+        key = (chat_id, user_id)
+        async with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                total = await storage.get_total_xp(chat_id, user_id)
+                if total is None: return (0, 0, 0)
+                state = self._state[key] = [total, 0]
+
+            _, old_lvl = level_from_total(state[0])
+            state[0] = max(0, state[0] + xp_amount)
+            state[1] += xp_amount
+            rank_indexes.update(chat_id, user_id, state[0])
+            _, new_lvl = level_from_total(state[0])
+
+            self._events += 1
+            if self._events >= self.max_events:
+                self._wakeup.set()
+            return (old_lvl, new_lvl, xp_amount)
+
+    def peek(self, chat_id, user_id):
+        """Буферизованные (xp, level) пользователя или None."""
+        state = self._state.get((chat_id, user_id))
+        return level_from_total(state[0]) if state else None
+
+    async def apply(self, chat_id, user_id, xp_amount):
+        """
+        Сразу пишет xp_amount в БД вместе с несброшенной дельтой пользователя.
+        Все под блокировкой буфера: параллельный add() не досчитает от уже забранного итога.
+        Возвращает (старый уровень, новый уровень, изменение).
+        """
+        key = (chat_id, user_id)
+        async with self._lock:
+            state = self._state.pop(key, None)
+            pending = state[1] if state else 0
+            try:
+                row = await storage.add_xp(chat_id, user_id, pending + xp_amount)
+            except Exception:
+                if state is not None:
+                    self._state[key] = state
+                raise
+            if not row: return (0, 0, 0)
+            old_total, new_total, new_lvl = row
+            rank_indexes.update(chat_id, user_id, new_total)
+        user_cache.invalidate(key)
+        # Старый уровень — тот, что пользователь видел: с учетом буфера
+        _, old_lvl = level_from_total(state[0] if state else old_total)
+        return (old_lvl, new_lvl, xp_amount)
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._state:
+                return 0
+            batch, self._state = self._state, {}
+            self._events = 0
+            try:
+                await storage.add_xp_many([
+                    (chat_id, user_id, delta) for (chat_id, user_id), (_, delta) in batch.items()
+                ])
+            except Exception:
+                # Возвращаем несохраненное в буфер, попробуем в следующий раз
+                for key, state in batch.items():
+                    self._state.setdefault(key, state)
+                raise
+            for key in batch:
+                user_cache.invalidate(key)
+            return len(batch)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"XP буфер: ошибка сброса: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+xp_buffer = XPBuffer()
+
+async def give_reputation(chat_id, from_user_id, to_user_id):
     if from_user_id == to_user_id:
         return "self_rep"
 
     today = datetime.now().strftime("%Y-%m-%d")
-    
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT 1 FROM rep_history WHERE from_id = ? AND to_id = ? AND date_str = ?', 
-                                  (from_user_id, to_user_id, today))
-        if await cursor.fetchone():
-            return "daily_limit_user" 
-        
-        cursor = await db.execute('SELECT count(*) FROM rep_history WHERE from_id = ? AND date_str = ?',
-                                  (from_user_id, today))
-        count = await cursor.fetchone()
-        if count and count[0] >= 3:
-            return "daily_limit_total"
-
-        await db.execute('INSERT INTO rep_history (from_id, to_id, date_str) VALUES (?, ?, ?)',
-                         (from_user_id, to_user_id, today))
-        await db.execute('UPDATE users SET reputation = reputation + 1 WHERE user_id = ?', (to_user_id,))
-        await db.commit()
-        
-        return "success"
-
-async def check_wipe_cooldown(user_id):
+    result = await storage.give_reputation(chat_id, from_user_id, to_user_id, today)
+    if result == "success":
+        user_cache.invalidate((chat_id, to_user_id))
+    return result
+
+async def check_wipe_cooldown(chat_id, user_id):
     today = datetime.now().strftime("%Y-%m-%d")
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('SELECT last_wipe_date FROM users WHERE user_id = ?', (user_id,))
-        row = await cursor.fetchone()
-        last_date = row[0] if row else None
-        
-        if last_date == today:
-            return False
-        
-        await db.execute('UPDATE users SET last_wipe_date = ? WHERE user_id = ?', (today, user_id))
-        await db.commit()
-        return True
-
-async def set_moderator_level(user_id: int, level: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute('UPDATE users SET mod_level = ? WHERE user_id = ?', (level, user_id))
-        await db.commit()
-
-async def get_user_stats_full(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('''
-            SELECT user_id, username, full_name, xp, level, warns, mod_level, reputation
-            FROM users WHERE user_id = ?
-        ''', (user_id,))
-        row = await cursor.fetchone()
-        return row
+    return await storage.check_wipe_cooldown(chat_id, user_id, today)
 
-async def manage_warn(user_id: int, action: str = "add", reason: str = None):
-    async with aiosqlite.connect(DB_NAME) as db:
-        if action == "reset":
-            await db.execute('UPDATE users SET warns = 0 WHERE user_id = ?', (user_id,))
-            await db.execute('DELETE FROM warn_reasons WHERE user_id = ?', (user_id,))
-            new_warns = 0
-        elif action == "remove":
-            await db.execute('UPDATE users SET warns = MAX(0, warns - 1) WHERE user_id = ?', (user_id,))
-            await db.execute('DELETE FROM warn_reasons WHERE id = (SELECT MAX(id) FROM warn_reasons WHERE user_id = ?)', (user_id,))
-            cursor = await db.execute('SELECT warns FROM users WHERE user_id = ?', (user_id,))
-            row = await cursor.fetchone()
-            new_warns = row[0] if row else 0
-        else: 
-            await db.execute('UPDATE users SET warns = warns + 1 WHERE user_id = ?', (user_id,))
-            if reason:
-                await db.execute('INSERT INTO warn_reasons (user_id, reason) VALUES (?, ?)', (user_id, reason))
-            cursor = await db.execute('SELECT warns FROM users WHERE user_id = ?', (user_id,))
-            row = await cursor.fetchone()
-            new_warns = row[0] if row else 0
-        await db.commit()
-        return new_warns
-
-async def get_warn_reasons(user_id: int):
-    async with aiosqlite.connect(DB_NAME) as db:
-        try:
-            cursor = await db.execute('SELECT reason FROM warn_reasons WHERE user_id = ?', (user_id,))
-            rows = await cursor.fetchall()
-            return [row[0] for row in rows]
-        except:
-            return []
-
-async def add_to_list(table, item):
-    async with aiosqlite.connect(DB_NAME) as db:
-        try:
-            # table name should be validated or hardcoded in logic to prevent injection, 
-            # but per instructions keeping logic simple for existing functions
-            await db.execute(f'INSERT INTO {table} VALUES (?)', (item.lower(),))
-            await db.commit()
-            return True
-        except:
-            return False
-
-async def remove_from_list(table, item):
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Исправлено: выбираем правильное имя столбца в зависимости от таблицы
-        field = 'item' if table == 'whitelist' else 'word'
-        await db.execute(f'DELETE FROM {table} WHERE {field} = ?', (item.lower(),))
-        await db.commit()
-
-async def get_list(table):
-    async with aiosqlite.connect(DB_NAME) as db:
-        field = 'item' if table == 'whitelist' else 'word'
-        cursor = await db.execute(f'SELECT {field} FROM {table}')
-        rows = await cursor.fetchall()
-        return [row[0] for row in rows]
-
-async def clear_list_data(table):
+async def set_moderator_level(chat_id, user_id: int, level: int):
+    await storage.set_moderator_level(chat_id, user_id, level)
+    user_cache.invalidate((chat_id, user_id))
+    rank_indexes.add_if_missing(chat_id, user_id)
+
+async def get_user_stats_full(chat_id, user_id: int):
+    row = user_cache.get((chat_id, user_id))
+    if row is None:
+        row = await _fetch_user_row(chat_id, user_id)
+        if row and row[4] is None:
+            return None
+    return _with_buffered_xp(chat_id, row)
+
+async def manage_warn(chat_id, user_id: int, action: str = "add", reason: str = None, issuer_id: int = None):
+    new_warns = await storage.manage_warn(chat_id, user_id, action, reason, issuer_id, int(time.time()))
+    user_cache.invalidate((chat_id, user_id))
+    return new_warns
+
+async def get_warn_reasons(chat_id, user_id: int):
+    try:
+        return await storage.get_warn_reasons(chat_id, user_id)
+    except:
+        return []
+
+# === ИСТЕЧЕНИЕ ВАРНОВ ===
+class WarnSweeper:
+    """
+    Раз в interval секунд удаляет варны старше expire_days дней пачками по batch_size,
+    уменьшая счетчики warns в той же транзакции. Счетчик в строке участника
+    остается единственным источником числа активных варнов для /profile и /warn.
+    """
+    def __init__(self, expire_days: int = WARN_EXPIRE_DAYS, interval: float = WARN_SWEEP_INTERVAL,
+                 batch_size: int = WARN_SWEEP_BATCH):
+        self.expire_days = expire_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task = None
+
+    async def sweep(self) -> int:
+        if self.expire_days <= 0:
+            return 0
+        cutoff = int(time.time()) - self.expire_days * 86400
+        total = 0
+        while True:
+            removed = await storage.sweep_warns(cutoff, self.batch_size)
+            for key in set(removed):
+                user_cache.invalidate(key)
+            total += len(removed)
+            if len(removed) < self.batch_size:
+                break
+            # Между пачками отпускаем писателя для обработчиков
+            await asyncio.sleep(0)
+        if total:
+            logging.info(f"Варны: удалено истекших {total}")
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.error(f"Варны: ошибка очистки: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+warn_sweeper = WarnSweeper()
+
+# Списки: записи с chat_id = GLOBAL_CHAT_ID действуют во всех чатах
+
+# Кеш в памяти меняется только после успешной записи в БД
+
+async def add_to_list(table, item, chat_id=GLOBAL_CHAT_ID):
+    item = item.lower()
+    try:
+        added = await storage.add_to_list(table, chat_id, item)
+    except:
+        return False
+    if added:
+        list_cache.add(table, chat_id, item)
+    return added
+
+async def remove_from_list(table, item, chat_id=GLOBAL_CHAT_ID):
+    item = item.lower()
+    await storage.remove_from_list(table, chat_id, item)
+    list_cache.remove(table, chat_id, item)
+
+async def get_list(table, chat_id=GLOBAL_CHAT_ID, include_global=True):
+    """Список чата (кортеж из кеша); с include_global=True вместе с глобальными записями."""
+    if not list_cache.loaded:
+        await list_cache.load()
+    return list_cache.get(table, chat_id, include_global)
+
+def list_version(table) -> int:
+    """Версия списка: меняется при любом изменении таблицы в любом чате."""
+    return list_cache.versions[table]
+
+async def clear_list_data(table, chat_id=GLOBAL_CHAT_ID):
     """Очищает список полностью"""
-    if table not in ['whitelist', 'badwords']: return
-    async with aiosqlite.connect(DB_NAME) as db:
-        await db.execute(f'DELETE FROM {table}')
-        await db.commit()
+    if table not in LIST_TABLES: return
+    await storage.clear_list(table, chat_id)
+    list_cache.clear(table, chat_id)
 
 # --- НОВЫЕ ФУНКЦИИ ДЛЯ ЛИДЕРОВ И СТАФФА ---
 
-async def get_top_users(limit=10):
-    """Возвращает топ пользователей по уровню и XP"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute('''
-            SELECT full_name, level, xp, user_id 
-            FROM users 
-            ORDER BY level DESC, xp DESC 
-            LIMIT ?
-        ''', (limit,))
-        return await cursor.fetchall()
-
-async def get_user_rank(user_id):
-    """Возвращает место, уровень и XP пользователя"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        # Получаем данные пользователя
-        cursor = await db.execute('SELECT level, xp FROM users WHERE user_id = ?', (user_id,))
-        user_data = await cursor.fetchone()
-        if not user_data:
-            return None
-        
-        u_lvl, u_xp = user_data
-        
-        # Считаем сколько людей выше (Level больше ИЛИ (Level такой же И XP больше))
-        cursor = await db.execute('''
-            SELECT COUNT(*) FROM users 
-            WHERE level > ? OR (level = ? AND xp > ?)
-        ''', (u_lvl, u_lvl, u_xp))
-        count = await cursor.fetchone()
-        rank = count[0] + 1 # +1 потому что если 0 людей выше, мы 1-е
-        
-        return rank, u_lvl, u_xp
-
-async def get_all_staff():
-    """Возвращает всех сотрудников (mod_level > 0), отсортированных по рангу"""
-    async with aiosqlite.connect(DB_NAME) as db:
-        # ДОБАВЛЕНО: user_id в выборку
-        cursor = await db.execute('''
-            SELECT full_name, mod_level, username, user_id
-            FROM users 
-            WHERE mod_level > 0 
-            ORDER BY mod_level DESC
-        ''', ())
-        return await cursor.fetchall()
\ No newline at end of file
+async def get_top_users(chat_id, limit=10):
+    """Возвращает топ пользователей чата по уровню и XP"""
+    index = rank_indexes.for_chat(chat_id)
+    if index is not None:
+        rows = []
+        for user_id, total in index.top(limit):
+            user_data = await get_user_stats_full(chat_id, user_id)
+            xp, lvl = level_from_total(total)
+            rows.append((user_data[2] if user_data else "User", lvl, xp, user_id))
+        return rows
+    return await storage.get_top_users(chat_id, limit)
+
+async def get_user_rank(chat_id, user_id):
+    """Возвращает место, уровень и XP пользователя в чате"""
+    index = rank_indexes.for_chat(chat_id)
+    rank = index.rank(user_id) if index is not None else None
+    if rank is not None:
+        user_data = await get_user_stats_full(chat_id, user_id)
+        if user_data:
+            return rank, user_data[4], user_data[3]
+
+    # Индекс еще не загружен: считает движок
+    return await storage.get_member_rank(chat_id, user_id)
+
+async def get_all_staff(chat_id):
+    """Возвращает всех сотрудников чата (mod_level > 0), отсортированных по рангу"""
+    return await storage.get_all_staff(chat_id)
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилища счета антифлуда. SmartFloodControl (utils.py) считает вес сообщения,
+а затухание счета, сравнение с прошлым сообщением (повтор, похожесть) и сброс после мута
+делает хранилище за одно обращение. Общее хранилище нужно, когда обновления обрабатывает несколько процессов:
+иначе каждый видит только часть сообщений пользователя.
+"""
+import difflib
+import time
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from functools import lru_cache
+from cache import TTLCache
+from config import STATE_CACHE_SIZE, FLOOD_DB
+from storage.sqlite import ConnectionPool
+
+# Правила подсчета: скорость затухания (очков в секунду), множитель точного повтора,
+# порог мута, счет, с которого пользователь продолжает после мута,
+# множитель похожего сообщения и порог похожести для него
+FloodRules = namedtuple('FloodRules', 'decay_rate duplicate_mult max_score reset_score similar_mult similar_ratio',
+                        defaults=(1.0, 1.0))
+
+def similarity_ratio(text1: str, text2: str) -> float:
+    return difflib.SequenceMatcher(None, text1, text2).ratio()
+
+class FloodBackend(ABC):
+    name = 'base'
+    # Прошлое сообщение читается без обращения к общему хранилищу (см. analysis.flood_similarity)
+    local = True
+
+    def __init__(self, rules: FloodRules, ttl: float):
+        self.rules = rules
+        self.ttl = ttl # Через столько секунд тишины запись можно забыть
+
+    async def start(self):
+        """Открывает соединения. Повторный вызов ничего не делает."""
+
+    async def close(self):
+        """Закрывает соединения."""
+
+    @abstractmethod
+    async def last_message(self, user_id: int) -> str:
+        """Предыдущее сообщение пользователя ("" если его нет)."""
+
+    @abstractmethod
+    async def hit(self, user_id: int, text: str, weight: float, now: float, similarity: float = None):
+        """
+        Учитывает сообщение весом weight: умножается на duplicate_mult, если text совпал с прошлым,
+        или на similar_mult, если похож на него. similarity — заранее посчитанная похожесть;
+        None — хранилище сравнит с прошлым сообщением само.
+        Возвращает (счет, мут): при муте счет уже сброшен до reset_score.
+        """
+
+    def _mult(self, previous: str, text: str, similarity: float = None) -> float:
+        rules = self.rules
+        if text == previous:
+            return rules.duplicate_mult
+        if similarity is None:
+            similarity = similarity_ratio(text, previous) if previous else 0.0
+        return rules.similar_mult if similarity > rules.similar_ratio else 1.0
+
+    def _first_hit(self, text: str, weight: float, similarity: float = None):
+        """Счет и мут для первого сообщения пользователя (прошлое сообщение — пустая строка)."""
+        score = weight * self._mult("", text, similarity)
+        if score >= self.rules.max_score:
+            return self.rules.reset_score, True
+        return score, False
+
+# === В ПАМЯТИ ПРОЦЕССА ===
+class _FloodState:
+    __slots__ = ('score', 'last_msg', 'last_time')
+
+    def __init__(self, score, last_msg, last_time):
+        self.score = score
+        self.last_msg = last_msg
+        self.last_time = last_time
+
+class MemoryFloodBackend(FloodBackend):
+    """Счет в памяти процесса: быстро, но только для одного процесса бота."""
+    name = 'memory'
+
+    def __init__(self, rules: FloodRules, ttl: float, maxsize: int = STATE_CACHE_SIZE):
+        super().__init__(rules, ttl)
+        self.users = TTLCache('flood', maxsize=maxsize, ttl=ttl)
+
+    async def last_message(self, user_id: int) -> str:
+        data = self.users.get(user_id)
+        return data.last_msg if data else ""
+
+    async def hit(self, user_id: int, text: str, weight: float, now: float, similarity: float = None):
+        rules = self.rules
+        data = self.users.get(user_id)
+        if data is None:
+            score, muted = self._first_hit(text, weight, similarity)
+            self.users.set(user_id, _FloodState(score, text, now))
+            return score, muted
+
+        score = max(0.0, data.score - (now - data.last_time) * rules.decay_rate)
+        score += weight * self._mult(data.last_msg, text, similarity)
+        muted = score >= rules.max_score
+        data.score = rules.reset_score if muted else score
+        data.last_msg = text
+        data.last_time = now
+        # set() продлевает жизнь записи
+        self.users.set(user_id, data)
+        return data.score, muted
+
+# === ОБЩЕЕ ДЛЯ ПРОЦЕССОВ (SQLite WAL) ===
+# Счет после затухания и нового сообщения. В SET все столбцы — старые значения строки.
+# Похожесть на прошлое сообщение считает функция flood_similarity, зарегистрированная
+# на соединении (см. SQLiteFloodBackend.start): отдельное чтение last_msg не нужно
+_NEW_SCORE = (
+    "(MAX(0.0, score - (excluded.last_time - last_time) * :decay_rate) "
+    "+ :weight * CASE WHEN last_msg = excluded.last_msg THEN :duplicate_mult "
+    "WHEN (CASE WHEN :similarity IS NULL THEN flood_similarity(excluded.last_msg, last_msg) "
+    "ELSE :similarity END) > :similar_ratio THEN :similar_mult ELSE 1.0 END)"
+)
+FLOOD_HIT_SQL = (
+    "INSERT INTO flood_state (user_id, score, last_msg, last_time, muted) "
+    "VALUES (:user_id, :first_score, :text, :now, :first_muted) "
+    "ON CONFLICT(user_id) DO UPDATE SET "
+    f"score = CASE WHEN {_NEW_SCORE} >= :max_score THEN :reset_score ELSE {_NEW_SCORE} END, "
+    f"muted = {_NEW_SCORE} >= :max_score, "
+    "last_msg = excluded.last_msg, "
+    "last_time = excluded.last_time "
+    "RETURNING score, muted"
+)
+
+class SQLiteFloodBackend(FloodBackend):
+    """
+    Счет в общем файле SQLite: каждое сообщение — один атомарный UPSERT с RETURNING,
+    поэтому процессы не затирают обновления друг друга. Между процессами запись
+    сериализует сама SQLite (WAL + busy_timeout).
+    """
+    name = 'sqlite'
+    local = False
+    # Раз в столько сообщений удаляются записи старше ttl
+    PRUNE_EVERY = 1000
+
+    def __init__(self, rules: FloodRules, ttl: float, path: str = FLOOD_DB):
+        super().__init__(rules, ttl)
+        self.pool = ConnectionPool(path, readers=1)
+        self._hits = 0
+
+    async def start(self):
+        if self.pool.started:
+            return
+        await self.pool.start()
+        async with self.pool.write() as db:
+            # _NEW_SCORE встречается в UPSERT трижды: кеш, чтобы сравнение шло один раз
+            await db.create_function('flood_similarity', 2, lru_cache(maxsize=16)(similarity_ratio), deterministic=True)
+            await db.execute('''CREATE TABLE IF NOT EXISTS flood_state (
+                user_id INTEGER PRIMARY KEY,
+                score REAL NOT NULL,
+                last_msg TEXT NOT NULL,
+                last_time REAL NOT NULL,
+                muted INTEGER NOT NULL DEFAULT 0
+            )''')
+            await db.execute('CREATE INDEX IF NOT EXISTS idx_flood_time ON flood_state(last_time)')
+
+    async def close(self):
+        await self.pool.close()
+
+    async def last_message(self, user_id: int) -> str:
+        async with self.pool.read() as db:
+            cursor = await db.execute(
+                'SELECT last_msg FROM flood_state WHERE user_id = ? AND last_time > ?',
+                (user_id, time.time() - self.ttl)
+            )
+            row = await cursor.fetchone()
+        return row[0] if row else ""
+
+    async def hit(self, user_id: int, text: str, weight: float, now: float, similarity: float = None):
+        rules = self.rules
+        first_score, first_muted = self._first_hit(text, weight, similarity)
+        params = {
+            'user_id': user_id, 'text': text, 'now': now, 'weight': weight, 'similarity': similarity,
+            'first_score': first_score, 'first_muted': int(first_muted),
+            'decay_rate': rules.decay_rate, 'duplicate_mult': rules.duplicate_mult,
+            'similar_mult': rules.similar_mult, 'similar_ratio': rules.similar_ratio,
+            'max_score': rules.max_score, 'reset_score': rules.reset_score,
+        }
+        async with self.pool.write() as db:
+            cursor = await db.execute(FLOOD_HIT_SQL, params)
+            score, muted = await cursor.fetchone()
+            self._hits += 1
+            if self._hits % self.PRUNE_EVERY == 0:
+                await db.execute('DELETE FROM flood_state WHERE last_time < ?', (now - self.ttl,))
+        return score, bool(muted)
+
+FLOOD_BACKENDS = {
+    'memory': MemoryFloodBackend,
+    'sqlite': SQLiteFloodBackend,
+}
+
+def create_flood_backend(name: str, rules: FloodRules, ttl: float, **kwargs) -> FloodBackend:
+    """Создает хранилище счета антифлуда по имени из FLOOD_BACKENDS."""
+    try:
+        backend = FLOOD_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестное хранилище антифлуда: {name!r} (доступны: {', '.join(FLOOD_BACKENDS)})")
+    return backend(rules, ttl, **kwargs)
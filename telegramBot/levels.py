@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Конфигурация уровней (XP Cap для каждого уровня)
+LEVEL_CAPS = {
+    1: 500,
+    2: 2000,
+    3: 8000,
+    4: 25000,
+    5: float('inf')
+}
+
+# Порог суммарного (lifetime) XP для каждого уровня: {1: 0, 2: 500, 3: 2500, ...}
+LEVEL_THRESHOLDS = {1: 0}
+for _lvl in range(2, max(LEVEL_CAPS) + 1):
+    LEVEL_THRESHOLDS[_lvl] = LEVEL_THRESHOLDS[_lvl - 1] + LEVEL_CAPS[_lvl - 1]
+MAX_LEVEL = max(LEVEL_THRESHOLDS)
+
+def level_from_total(total_xp):
+    """Суммарный XP -> (XP внутри уровня, уровень)."""
+    for lvl in range(MAX_LEVEL, 0, -1):
+        if total_xp >= LEVEL_THRESHOLDS[lvl]:
+            return total_xp - LEVEL_THRESHOLDS[lvl], lvl
+    return 0, 1
+
+def total_from_level(xp, level):
+    """(XP внутри уровня, уровень) -> суммарный XP."""
+    return LEVEL_THRESHOLDS.get(level, 0) + xp
\ No newline at end of file
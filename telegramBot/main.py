@@ -6,7 +6,12 @@ from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.types import BotCommandScopeDefault
 from config import BOT_TOKEN, COMMANDS
-from database import create_tables
+from analysis import analysis_executor
+from actions import action_queue
+from scheduler import delete_scheduler
+from utils import flood_control
+from context import ContextMiddleware
+from database import create_tables, storage, xp_buffer, rank_indexes, list_cache, warn_sweeper
 
 # Импорт модулей
 from modules import admin, moderation, user, games 
@@ -20,14 +25,27 @@ async def main():
     # !!! ЗАПУСК ВЕБ-СЕРВЕРА ПЕРЕД СТАРТОМ БОТА !!!
     keep_alive()
 
-    # Инициализация БД
+    # Инициализация хранилища (соединения живут до остановки бота)
+    await storage.start()
     await create_tables()
+    await rank_indexes.load()
+    await list_cache.load()
+    await delete_scheduler.load()
+    await flood_control.backend.start()
+    xp_buffer.start()
+    warn_sweeper.start()
+    action_queue.start()
     
     bot = Bot(
         token=BOT_TOKEN, 
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    # Отложенные удаления (в том числе восстановленные из БД) идут от имени этого бота
+    delete_scheduler.start(bot)
+
     dp = Dispatcher()
+    # Строка пользователя, уровень доступа и списки чата — один раз на апдейт, до всех роутеров
+    dp.update.outer_middleware(ContextMiddleware())
 
     # Регистрация роутеров
     dp.include_router(admin.router)
@@ -39,7 +57,16 @@ async def main():
 
     print("🚀 Бот запущен! Система уровней 2.0 активирована.")
     await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    try:
+        await dp.start_polling(bot)
+    finally:
+        analysis_executor.shutdown()
+        await delete_scheduler.stop()
+        await action_queue.stop()
+        await warn_sweeper.stop()
+        await xp_buffer.stop()
+        await flood_control.backend.close()
+        await storage.close()
 
 if __name__ == "__main__":
     try:
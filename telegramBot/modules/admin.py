@@ -5,9 +5,12 @@ from aiogram.filters import Command
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from database import add_to_list, get_list, manage_warn, remove_from_list, clear_list_data
+from database import add_to_list, get_list, manage_warn, remove_from_list, clear_list_data, GLOBAL_CHAT_ID
 from config import OWNER_ID
 from utils import answer_temp, delete_later
+from analysis import analysis_executor
+from cache import cache_report
+from actions import action_queue
 
 router = Router()
 
@@ -17,6 +20,10 @@ class AdminStates(StatesGroup):
     waiting_add_bw = State()
     waiting_del_bw = State()
 
+def list_scope(chat: types.Chat) -> int:
+    """Из лички редактируются глобальные списки, из группы — списки этой группы."""
+    return GLOBAL_CHAT_ID if chat.type == 'private' else chat.id
+
 # --- КЛАВИАТУРЫ ---
 
 def main_admin_kb():
@@ -139,7 +146,7 @@ async def ignore_click(clb: CallbackQuery):
 
 @router.callback_query(F.data == "show_whitelist")
 async def show_wl(clb: CallbackQuery):
-    items = await get_list('whitelist')
+    items = await get_list('whitelist', list_scope(clb.message.chat), include_global=False)
     text = "📋 <b>Белый список:</b>\n\n" + ("\n".join([f"• <code>{i}</code>" for i in items]) if items else "<i>Список пуст</i>")
     
     # Если список слишком длинный, телеграм не отправит. Обрезаем.
@@ -156,7 +163,7 @@ async def show_bw(clb: CallbackQuery):
     except IndexError:
         page = 0
 
-    items = await get_list('badwords')
+    items = await get_list('badwords', list_scope(clb.message.chat), include_global=False)
     
     # Настройки пагинации
     ITEMS_PER_PAGE = 50
@@ -199,7 +206,7 @@ async def ask_clear_bw(clb: CallbackQuery):
 
 @router.callback_query(F.data == "confirm_clear_badwords")
 async def confirm_clear_bw(clb: CallbackQuery):
-    await clear_list_data('badwords')
+    await clear_list_data('badwords', list_scope(clb.message.chat))
     await clb.answer("Список полностью очищен!", show_alert=True)
     await nav_bw(clb)
 
@@ -234,7 +241,7 @@ async def process_add_wl(message: types.Message, state: FSMContext):
     
     count = 0
     for item in items:
-        if await add_to_list('whitelist', item):
+        if await add_to_list('whitelist', item, list_scope(message.chat)):
             count += 1
             
     await message.answer(
@@ -251,7 +258,7 @@ async def process_add_bw(message: types.Message, state: FSMContext):
     
     count = 0
     for item in items:
-        if await add_to_list('badwords', item):
+        if await add_to_list('badwords', item, list_scope(message.chat)):
             count += 1
             
     await message.answer(
@@ -289,7 +296,7 @@ async def process_del_wl(message: types.Message, state: FSMContext):
     items = [i.strip() for i in message.text.split(',') if i.strip()]
     
     for item in items:
-        await remove_from_list('whitelist', item)
+        await remove_from_list('whitelist', item, list_scope(message.chat))
             
     await message.answer(
         f"✅ <b>Обработано удаление {len(items)} записей</b> из Белого списка.", 
@@ -304,7 +311,7 @@ async def process_del_bw(message: types.Message, state: FSMContext):
     items = [i.strip() for i in message.text.split(',') if i.strip()]
     
     for item in items:
-        await remove_from_list('badwords', item)
+        await remove_from_list('badwords', item, list_scope(message.chat))
             
     await message.answer(
         f"✅ <b>Обработано удаление {len(items)} слов</b> из Фильтра.", 
@@ -313,6 +320,50 @@ async def process_del_bw(message: types.Message, state: FSMContext):
     )
     await state.clear()
 
+# --- СТАТИСТИКА ФИЛЬТРА ---
+
+@router.message(Command("filter_stats"))
+async def filter_stats(message: types.Message):
+    await delete_later(message, 0)
+    if message.from_user.id != OWNER_ID: return
+
+    stats = analysis_executor.snapshot()
+    await answer_temp(message,
+        "📊 <b>Анализ сообщений</b>\n"
+        f"• В основном процессе: {stats['inline']} (p50 {stats['inline_p50_ms']} мс, p99 {stats['inline_p99_ms']} мс)\n"
+        f"• В пуле: {stats['offloaded']} (p50 {stats['offloaded_p50_ms']} мс, p99 {stats['offloaded_p99_ms']} мс)\n"
+        f"• Очередь: {stats['pending']} сейчас, максимум {stats['max_pending']}\n"
+        f"• Отклонено: {stats['rejected']}, таймаутов: {stats['timeouts']}, ошибок: {stats['errors']}"
+    )
+
+@router.message(Command("cache_stats"))
+async def cache_stats(message: types.Message):
+    await delete_later(message, 0)
+    if message.from_user.id != OWNER_ID: return
+
+    lines = ["🗄 <b>Кеши в памяти</b>"]
+    for name, stats in sorted(cache_report().items()):
+        ttl = f"{int(stats['ttl'])} с" if stats['ttl'] is not None else "без TTL"
+        lines.append(
+            f"• <code>{name}</code>: {stats['entries']}/{stats['maxsize']} ({ttl}), "
+            f"~{stats['bytes'] // 1024} КБ, попаданий {stats['hits']}, промахов {stats['misses']}, вытеснено {stats['evictions']}"
+        )
+    await answer_temp(message, "\n".join(lines))
+
+@router.message(Command("queue_stats"))
+async def queue_stats(message: types.Message):
+    await delete_later(message, 0)
+    if message.from_user.id != OWNER_ID: return
+
+    stats = action_queue.snapshot()
+    await answer_temp(message,
+        "📤 <b>Очередь запросов к Telegram</b>\n"
+        f"• В очереди: модерация {stats['moderation']}, уведомления {stats['notice']} (ждут лимита: {stats['delayed']})\n"
+        f"• Выполняется: {stats['in_flight']}\n"
+        f"• Принято: {stats['submitted']}, отправлено: {stats['sent']}, объединено удалений: {stats['coalesced']}\n"
+        f"• Повторов после flood wait: {stats['retried']}, отброшено: {stats['dropped']}, ошибок: {stats['failed']}"
+    )
+
 # --- СБРОС ВАРНОВ ---
 
 @router.message(Command("reset_warns"))
@@ -324,5 +375,5 @@ async def admin_reset(message: types.Message):
         return await answer_temp(message, "⚠️ Ответьте на сообщение пользователя.")
     
     target_name = message.reply_to_message.from_user.full_name
-    await manage_warn(message.reply_to_message.from_user.id, "reset")
+    await manage_warn(message.chat.id, message.reply_to_message.from_user.id, "reset")
     await answer_temp(message, f"✅ Предупреждения для <b>{target_name}</b> полностью сброшены.")
\ No newline at end of file
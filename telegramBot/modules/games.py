@@ -1,8 +1,9 @@
 from aiogram import Router, types, F
 from aiogram.filters import Command, CommandObject
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-from database import get_user, update_xp, get_id_by_username, LEVEL_CAPS
-from utils import delete_later
+from database import get_user, update_xp, get_id_by_username, total_from_level
+from utils import delete_later, chat_admins
+from scheduler import schedule_delete
 import asyncio
 import random
 from config import OWNER_ID
@@ -32,13 +33,7 @@ def fmt_num(num):
 async def is_admin_or_owner(user_id, chat):
     if user_id == OWNER_ID: return True
     if user_id in [ANON_BOT_ID, 777000]: return True
-    if chat.type == 'private': return False
-    try:
-        member = await chat.get_member(user_id)
-        if member.status in ['creator', 'administrator']:
-            return True
-    except: pass
-    return False
+    return await chat_admins.is_admin(chat, user_id)
 
 def get_game_btn(game_key, user_level, is_admin, title, callback_base, owner_id):
     """Генерирует кнопку игры или замок, если уровень мал"""
@@ -54,36 +49,18 @@ def can_afford(xp, level, bet):
     """
     Проверяет, может ли игрок позволить себе ставку,
     учитывая возможность понижения уровня.
+    Понижение уровня возвращает его емкость, поэтому достаточно
+    сравнить ставку с суммарным (lifetime) XP.
     """
-    # 1. Если хватает текущего XP - отлично
-    if xp >= bet: 
-        return True
-    
-    # 2. Если не хватает, проверяем, хватит ли спуска по уровням
-    needed = bet - xp
-    temp_lvl = level
-    
-    # Симулируем понижение уровня
-    while temp_lvl > 1 and needed > 0:
-        temp_lvl -= 1
-        # При падении на уровень ниже мы получаем его емкость (cap)
-        # Например, падая с 2 на 1, мы получаем 500 XP (кап 1 уровня)
-        gain = LEVEL_CAPS.get(temp_lvl, 500)
-        needed -= gain
-        
-    # Если долг покрыт (needed <= 0), значит играть можно
-    if needed <= 0:
-        return True
-        
-    return False
+    return total_from_level(xp, level) >= bet
 
 # --- ГЛАВНОЕ МЕНЮ ИГР ---
 @router.message(Command("games"))
-async def cmd_games(message: types.Message):
+async def cmd_games(message: types.Message, user_row: tuple):
     await delete_later(message, 0)
     
-    # Регистрируем/обновляем юзера
-    user_data = await get_user(message.from_user.id, message.from_user.username, message.from_user.full_name)
+    # Юзер уже зарегистрирован/обновлен ContextMiddleware
+    user_data = user_row
     if not user_data: return
     
     xp, level = user_data[3], user_data[4]
@@ -115,7 +92,7 @@ async def cmd_games(message: types.Message):
 
     msg = await message.answer(text, reply_markup=kb)
     # Удаляем меню через 60 сек, если неактивно
-    await delete_later(msg, 60)
+    schedule_delete(msg, 60)
 
 # --- ОБРАБОТЧИК ЗАБЛОКИРОВАННЫХ ИГР ---
 @router.callback_query(F.data.startswith("locked_game"))
@@ -159,7 +136,7 @@ async def game_bet_menu(callback: types.CallbackQuery):
     ])
     
     # Получаем актуальный баланс для отображения
-    user_data = await get_user(owner_id) 
+    user_data = await get_user(callback.message.chat.id, owner_id) 
     curr_xp = fmt_num(user_data[3]) if user_data else "0"
 
     text = (
@@ -176,7 +153,7 @@ async def game_bet_menu(callback: types.CallbackQuery):
 
 # --- ЛОГИКА ИГР (Dice, Basket, Slots) ---
 @router.callback_query(F.data.startswith("play_"))
-async def play_game_logic(callback: types.CallbackQuery):
+async def play_game_logic(callback: types.CallbackQuery, user_row: tuple):
     # format: play_dice:50:123
     try:
         parts = callback.data.split(":")
@@ -207,7 +184,10 @@ async def play_game_logic(callback: types.CallbackQuery):
         player_fullname = callback.from_user.full_name
 
     # 2. Проверка баланса
-    user_data = await get_user(player_id, player_username, player_fullname)
+    if player_id == callback.from_user.id:
+        user_data = user_row
+    else:
+        user_data = await get_user(callback.message.chat.id, player_id, player_username, player_fullname)
     if not user_data: return await callback.answer("Ошибка профиля", show_alert=True)
     
     # ИСПОЛЬЗУЕМ НОВУЮ ФУНКЦИЮ ПРОВЕРКИ
@@ -220,7 +200,7 @@ async def play_game_logic(callback: types.CallbackQuery):
 
     # 4. Списываем ставку
     # Тут возвращаются (старый уровень, новый уровень, изменение)
-    old_lvl_start, new_lvl_start, _ = await update_xp(player_id, -bet)
+    old_lvl_start, new_lvl_start, _ = await update_xp(callback.message.chat.id, player_id, -bet)
     
     # 5. Бросок кубика
     emoji_map = {'dice': '🎲', 'basket': '🏀', 'slots': '🎰'}
@@ -278,7 +258,7 @@ async def play_game_logic(callback: types.CallbackQuery):
     # 7. Начисление выигрыша
     if win_mult > 0:
         win_amt = bet * win_mult
-        old_lvl_win, new_lvl_win, _ = await update_xp(player_id, win_amt)
+        old_lvl_win, new_lvl_win, _ = await update_xp(callback.message.chat.id, player_id, win_amt)
         res_text += f"\n💰 <code>+{fmt_num(win_amt)} XP</code>"
         
         # Проверка Level Up
@@ -299,9 +279,9 @@ async def play_game_logic(callback: types.CallbackQuery):
     result_msg = await callback.message.answer(res_text, reply_markup=kb)
     
     # Удаляем кубик чуть позже, чтобы юзер увидел результат на кубике
-    await delete_later(dice_msg, 4)
+    schedule_delete(dice_msg, 4)
     # Удаляем результат через 60 сек
-    await delete_later(result_msg, 60)
+    schedule_delete(result_msg, 60)
 
 
 # --- ДУЭЛИ (Инфо и Лобби) ---
@@ -348,7 +328,7 @@ async def back_to_games(callback: types.CallbackQuery):
     if not is_owner and not is_anon_owner: return await callback.answer("Это не ваше меню!", show_alert=True)
 
     # Получаем данные владельца меню
-    user_data = await get_user(owner_id)
+    user_data = await get_user(callback.message.chat.id, owner_id)
     xp, level = (user_data[3], user_data[4]) if user_data else (0, 0)
     
     is_adm = await is_admin_or_owner(callback.from_user.id, callback.message.chat)
@@ -382,28 +362,28 @@ async def back_to_games(callback: types.CallbackQuery):
 
 # --- ЛОГИКА ДУЭЛЕЙ (КОМАНДЫ) ---
 @router.message(Command("duel"))
-async def cmd_duel(message: types.Message, command: CommandObject):
+async def cmd_duel(message: types.Message, command: CommandObject, user_row: tuple):
     await delete_later(message, 0)
     
     # Валидация аргументов
     if not command.args:
         msg = await message.reply("⚠️ <b>Ошибка:</b> Введите <code>/duel @username [ставка]</code>")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
     
     args = command.args.split()
     target_username = args[0]
     try: bet = int(args[1])
     except: 
         msg = await message.reply("⚠️ <b>Ошибка:</b> Ставка должна быть числом.")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
         
     if bet < 10: 
         msg = await message.reply("⚠️ Минимальная ставка: <code>10 XP</code>")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
 
     # Инициатор
     initiator = message.from_user
-    init_data = await get_user(initiator.id, initiator.username, initiator.full_name)
+    init_data = user_row
     if not init_data: return
     
     is_adm = await is_admin_or_owner(initiator.id, message.chat)
@@ -411,12 +391,12 @@ async def cmd_duel(message: types.Message, command: CommandObject):
     # Проверка уровня (4 для дуэли)
     if init_data[4] < 4 and not is_adm: 
         msg = await message.reply("🔒 Дуэли доступны с <b>4 уровня</b>!")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
     
     # НОВАЯ ПРОВЕРКА БАЛАНСА
     if not can_afford(init_data[3], init_data[4], bet):
         msg = await message.reply(f"❌ <b>Не хватает XP (даже с учетом уровней)!</b> У вас: <code>{fmt_num(init_data[3])}</code>")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
 
     # Поиск цели
     if message.reply_to_message:
@@ -428,11 +408,11 @@ async def cmd_duel(message: types.Message, command: CommandObject):
         
     if not target_id:
         msg = await message.reply("❌ Пользователь не найден в базе.")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
         
     if target_id == initiator.id:
         msg = await message.reply("🤡 Нельзя вызвать самого себя.")
-        return await delete_later(msg, 10)
+        return schedule_delete(msg, 10)
 
     # Создание дуэли
     active_duels[message.chat.id] = {
@@ -459,7 +439,7 @@ async def cmd_duel(message: types.Message, command: CommandObject):
     )
     
     msg = await message.answer(text, reply_markup=kb)
-    await delete_later(msg, 120) # 2 минуты на принятие
+    schedule_delete(msg, 120) # 2 минуты на принятие
 
 @router.callback_query(F.data == "duel_accept")
 async def duel_accept(callback: types.CallbackQuery):
@@ -484,7 +464,7 @@ async def duel_accept(callback: types.CallbackQuery):
     player_name = "Group Anonymous Bot" if player_id == ANON_BOT_ID else callback.from_user.full_name
     player_username = "GroupAnonymousBot" if player_id == ANON_BOT_ID else callback.from_user.username
     
-    target_data = await get_user(player_id, player_username, player_name)
+    target_data = await get_user(callback.message.chat.id, player_id, player_username, player_name)
     if not target_data: return await callback.answer("Ошибка профиля", show_alert=True)
     
     # НОВАЯ ПРОВЕРКА БАЛАНСА
@@ -592,8 +572,8 @@ async def resolve_duel(message: types.Message, duel):
         l_name = duel['target_name'] if winner == 1 else duel['initiator_name']
         
         # Обмен опытом с проверкой уровней
-        old_lvl_w, new_lvl_w, _ = await update_xp(w_id, duel['bet'])
-        old_lvl_l, new_lvl_l, _ = await update_xp(l_id, -duel['bet'])
+        old_lvl_w, new_lvl_w, _ = await update_xp(message.chat.id, w_id, duel['bet'])
+        old_lvl_l, new_lvl_l, _ = await update_xp(message.chat.id, l_id, -duel['bet'])
         
         # Описание победы
         flavor = ""
@@ -619,4 +599,4 @@ async def resolve_duel(message: types.Message, duel):
     
     # Сообщение результата (удаляется через минуту)
     sent_msg = await message.edit_text(res_text, reply_markup=None)
-    await delete_later(sent_msg, 60)
\ No newline at end of file
+    schedule_delete(sent_msg, 60)
\ No newline at end of file
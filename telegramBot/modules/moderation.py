@@ -2,19 +2,22 @@
 import re
 import asyncio
 import time
+from functools import partial
 from typing import Callable, Dict, Any, Awaitable, Union
 from aiogram import Router, types, F, Bot, BaseMiddleware
 from aiogram.filters import Command, CommandObject
 from aiogram.types import ChatPermissions, ContentType
-from config import WARN_LIMIT, OWNER_ID
+from config import WARN_LIMIT, OWNER_ID, RAID_MUTE_TIME, MESSAGE_LOG_SIZE
+from analysis import check_content, flood_similarity
+from actions import action_queue, PRIORITY_MODERATION
 from database import (
-    get_list, manage_warn, get_user, 
+    get_list, list_version, manage_warn, get_user, 
     set_moderator_level, get_user_stats_full,
     update_xp
 )
 from utils import (
     answer_temp, get_user_link, delete_later, 
-    parse_command_complex, flood_control, text_analyzer
+    parse_command_complex, flood_control, raid_detector, text_analyzer, link_classifier, chat_admins, message_log
 )
 
 router = Router()
@@ -27,9 +30,10 @@ LVL_SENIOR = 3      # Ур3: бан, разбан
 LVL_MANAGER = 4     # Менеджер: выдача прав до ур3
 LVL_ADMIN = 5       # Владелец
 
-async def get_sender_level(chat: types.Chat, user_id: int) -> int:
+async def get_sender_level(chat: types.Chat, user_id: int, user_data=None) -> int:
     """
     Определяет уровень доступа пользователя.
+    user_data — уже загруженная строка пользователя (например, user_row из контекста апдейта).
     """
     # 1. Хардкод
     if user_id == OWNER_ID: 
@@ -38,30 +42,67 @@ async def get_sender_level(chat: types.Chat, user_id: int) -> int:
         return LVL_ADMIN
     
     # 2. База данных
-    user_data = await get_user(user_id)
+    if user_data is None:
+        user_data = await get_user(chat.id, user_id)
     db_level = user_data[6] if user_data and len(user_data) > 6 else 0
     
     if db_level > 0:
         return db_level
 
-    # 3. Админы чата
-    if chat.type != 'private':
-        try:
-            member = await chat.get_member(user_id)
-            if member.status in ['creator', 'administrator']: 
-                return LVL_ADMIN
-        except:
-            pass
+    # 3. Админы чата (кеш, без запроса к API на каждое сообщение)
+    if await chat_admins.is_admin(chat, user_id):
+        return LVL_ADMIN
             
     return LVL_USER
 
-async def is_admin(chat: types.Chat, user_id: int, sender_chat: types.Chat = None, required_level: int = 1) -> bool:
+async def is_admin(chat: types.Chat, user_id: int, sender_chat: types.Chat = None, required_level: int = 1,
+                   level: int = None) -> bool:
+    """level — уже известный уровень отправителя (user_level из контекста апдейта)."""
     if sender_chat and sender_chat.id == chat.id: 
         return True 
     
-    actual_level = await get_sender_level(chat, user_id)
+    actual_level = level if level is not None else await get_sender_level(chat, user_id)
     return actual_level >= required_level
 
+async def moderate(method, *args, **kwargs):
+    """Мут, бан или разбан (chat.restrict, chat.ban, ...) через очередь действий, раньше уведомлений."""
+    return await action_queue.run(method.__self__.id, partial(method, *args, **kwargs), PRIORITY_MODERATION)
+
+def delete_violation(message: types.Message):
+    """Удаление нарушения: с приоритетом модерации, не дожидаясь ответа Telegram."""
+    action_queue.delete(message.bot, message.chat.id, message.message_id, PRIORITY_MODERATION)
+
+# === РЕЙДЫ ===
+async def punish_raid(message: types.Message, cluster) -> bool:
+    """
+    Удаляет сообщения подозрительных авторов кластера рейда (см. _RaidCluster.suspects)
+    и блокирует еще не наказанных. True — сообщение message удалено вместе с ними.
+    """
+    chat = message.chat
+    suspects = cluster.suspects()
+    message_ids = [message_id for message_id, user_id in cluster.messages if user_id in suspects]
+    kept = [entry for entry in cluster.messages if entry[1] not in suspects]
+    cluster.messages.clear()
+    cluster.messages.extend(kept)
+    # Очередь отправит их пачками deleteMessages (до 100 id за раз)
+    action_queue.delete_many(message.bot, chat.id, message_ids, PRIORITY_MODERATION)
+
+    new_users = suspects - cluster.punished
+    cluster.punished |= new_users
+    until = int(time.time()) + RAID_MUTE_TIME
+    await asyncio.gather(*(
+        moderate(chat.restrict, user_id=user_id, permissions=ChatPermissions(can_send_messages=False), until_date=until)
+        for user_id in new_users
+    ), return_exceptions=True)
+
+    if new_users:
+        await answer_temp(message,
+            f"🛡 Обнаружена рассылка: одинаковые сообщения от <b>{len(suspects)}</b> участников.\n"
+            f"Сообщения удалены, авторы заблокированы на <b>{RAID_MUTE_TIME // 60} мин</b>.",
+            key=f"raid_{chat.id}"
+        )
+    return message.from_user.id in suspects
+
 # === MIDDLEWARE: АНТИФЛУД ===
 class FloodMiddleware(BaseMiddleware):
     async def __call__(
@@ -76,21 +117,37 @@ class FloodMiddleware(BaseMiddleware):
         if event.chat.type == 'private':
             return await handler(event, data)
 
+        # Журнал для /purge и /clean (сообщения от имени канала или чата — по sender_chat)
+        author_id = event.sender_chat.id if event.sender_chat else (event.from_user.id if event.from_user else 0)
+        message_log.record(event.chat.id, event.message_id, author_id)
+        for member in event.new_chat_members or ():
+            raid_detector.note_join(event.chat.id, member.id)
+
         if event.from_user:
-            await get_user(event.from_user.id, event.from_user.username, event.from_user.full_name)
-            
+            # Строка пользователя и уровень уже загружены ContextMiddleware
+            # (без него — обычный пользователь, как в аргументах обработчиков)
             user_id = event.from_user.id
-            is_adm = await is_admin(event.chat, user_id, event.sender_chat, required_level=LVL_HELPER)
+            is_adm = await is_admin(event.chat, user_id, event.sender_chat, required_level=LVL_HELPER,
+                                    level=data.get('user_level', LVL_USER))
 
             content_for_flood = event.text or event.caption or "content"
+
+            # Одинаковый текст от многих аккаунтов (проверяется до личного антифлуда)
+            if not is_adm and (event.text or event.caption):
+                normalized = text_analyzer.prepare(content_for_flood)
+                settings = data.get('chat_settings')
+                whitelist, key = (settings.whitelist, (event.chat.id, settings.versions[0])) if settings else ((), None)
+                has_links = bool(link_classifier.forbidden_links(normalized.lower, whitelist, key, mentions=True))
+                cluster = raid_detector.check(event.chat.id, user_id, event.message_id, normalized.skeleton,
+                                              has_links=has_links)
+                if cluster is not None and await punish_raid(event, cluster):
+                    return
             
-            flood_status = flood_control.check(user_id, content_for_flood)
+            similarity = await flood_similarity(user_id, content_for_flood)
+            flood_status = await flood_control.check(user_id, content_for_flood, similarity)
             
             if flood_status != 'ok' and not is_adm:
-                try: 
-                    await event.delete()
-                except: 
-                    pass
+                delete_violation(event)
                 
                 user_name = event.from_user.full_name
                 user_link = get_user_link(user_id, user_name)
@@ -98,7 +155,7 @@ class FloodMiddleware(BaseMiddleware):
                 if flood_status == 'mute':
                     until = int(time.time()) + 600
                     try:
-                        await event.chat.restrict(
+                        await moderate(event.chat.restrict,
                             user_id=user_id, 
                             permissions=ChatPermissions(can_send_messages=False), 
                             until_date=until
@@ -116,46 +173,43 @@ class FloodMiddleware(BaseMiddleware):
 
 router.message.outer_middleware(FloodMiddleware())
 
+# === КЕШ АДМИНОВ: СОБЫТИЯ ===
+@router.chat_member()
+async def on_chat_member_update(event: types.ChatMemberUpdated):
+    """Назначение и снятие админов, вступления (приходит, только если бот сам админ)."""
+    chat_admins.update(event.chat.id, event.new_chat_member.user.id, event.new_chat_member.status)
+    if event.old_chat_member.status in ('left', 'kicked') and event.new_chat_member.status in ('member', 'restricted'):
+        raid_detector.note_join(event.chat.id, event.new_chat_member.user.id)
+
+@router.my_chat_member()
+async def on_my_chat_member_update(event: types.ChatMemberUpdated):
+    """Права бота изменились: до этого события chat_member могли не приходить, список перечитывается."""
+    chat_admins.invalidate(event.chat.id)
+
 
 # === ЛОГИКА ФИЛЬТРАЦИИ КОНТЕНТА ===
-async def bad_content_checker(message: types.Message) -> Union[bool, Dict[str, Any]]:
+async def bad_content_checker(message: types.Message, user_level: int = LVL_USER,
+                              chat_settings=None) -> Union[bool, Dict[str, Any]]:
     if message.chat.type == 'private': return False
     
     if (message.text and message.text.startswith('/')) or (message.caption and message.caption.startswith('/')):
         return False
     
     user_id = message.from_user.id
-    is_adm = await is_admin(message.chat, user_id, message.sender_chat, required_level=LVL_HELPER)
+    is_adm = await is_admin(message.chat, user_id, message.sender_chat, required_level=LVL_HELPER, level=user_level)
     if is_adm: return False
 
     text_to_analyze = message.text or message.caption or ""
     if not text_to_analyze: return False
     
-    reason = None
-    whitelist = await get_list('whitelist')
-    badwords = await get_list('badwords')
-    text_lower = text_to_analyze.lower()
-    
-    # Ссылки
-    link_patterns = [r"(https?://|www\.|t\.me/)[^\s]+", r"[a-zA-Z0-9-]{2,}\.[a-zA-Z]{2,6}\b"]
-    is_link = False
-    for pattern in link_patterns:
-        if re.search(pattern, text_lower):
-            is_link = True
-            break
-            
-    if is_link:
-        is_allowed = False
-        for wl_item in whitelist:
-            if wl_item in text_lower:
-                is_allowed = True
-                break
-        if not is_allowed: 
-            reason = "Реклама / Ссылки"
-
-    # Маты
-    if not reason and text_analyzer.is_bad_word(text_to_analyze, badwords):
-        reason = "Запрещенное слово"
+    if chat_settings is None:
+        whitelist = await get_list('whitelist', message.chat.id)
+        badwords = await get_list('badwords', message.chat.id)
+        versions = (list_version('whitelist'), list_version('badwords'))
+    else:
+        whitelist, badwords, versions = chat_settings
+    # Ссылки и маты (длинные тексты — в пуле процессов, см. analysis.py)
+    reason = await check_content(text_to_analyze, message.chat.id, whitelist, badwords, versions)
 
     if reason:
         return {'reason': reason}
@@ -167,24 +221,24 @@ async def bad_content_checker(message: types.Message) -> Union[bool, Dict[str, A
     bad_content_checker
 )
 async def handle_bad_content(message: types.Message, reason: str):
-    await delete_later(message, 0)
+    delete_violation(message)
     
     user_id = message.from_user.id
     user_name = message.from_user.full_name
     
-    current_warns = await manage_warn(user_id, "add", reason=reason)
+    current_warns = await manage_warn(message.chat.id, user_id, "add", reason=reason)
     # Используем кликабельное имя из БД или текущего сообщения
     user_link_html = get_user_link(user_id, user_name)
 
     if current_warns >= WARN_LIMIT:
         try:
             until = int(time.time()) + 1800 # 30 минут
-            await message.chat.restrict(
+            await moderate(message.chat.restrict,
                 user_id=user_id, 
                 permissions=ChatPermissions(can_send_messages=False), 
                 until_date=until
             )
-            await manage_warn(user_id, "reset")
+            await manage_warn(message.chat.id, user_id, "reset")
             # ИЗМЕНЕНО: СЛЕНГ УБРАН, ДОБАВЛЕНО ФОРМАТИРОВАНИЕ
             await answer_temp(message, 
                 f"🔇 {user_link_html} получил блокировку чата на <b>30 мин</b>,\n"
@@ -203,16 +257,16 @@ async def handle_bad_content(message: types.Message, reason: str):
 # === КОМАНДЫ МОДЕРАЦИИ ===
 
 @router.message(Command("mute"))
-async def cmd_mute(message: types.Message, command: CommandObject):
+async def cmd_mute(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER): 
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER, level=user_level): 
         return await answer_temp(message, "Нет прав (Нужен <b>Moder¹</b>).", key=f"perm_err_{message.from_user.id}")
 
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.", key=f"args_err_{message.from_user.id}")
     
-    sender_lvl = await get_sender_level(message.chat, message.from_user.id)
+    sender_lvl = user_level
     target_lvl = await get_sender_level(message.chat, data['target_id'])
     if target_lvl >= sender_lvl and message.from_user.id != OWNER_ID:
         return await answer_temp(message, "Нельзя заглушить равного или старшего по званию.")
@@ -221,9 +275,9 @@ async def cmd_mute(message: types.Message, command: CommandObject):
     minutes = int(duration / 60)
     
     try:
-        await message.chat.restrict(user_id=data['target_id'], permissions=ChatPermissions(can_send_messages=False), until_date=int(time.time())+duration)
+        await moderate(message.chat.restrict, user_id=data['target_id'], permissions=ChatPermissions(can_send_messages=False), until_date=int(time.time())+duration)
         if data['delete_flag'] and message.reply_to_message: 
-            await delete_later(message.reply_to_message, 0)
+            delete_violation(message.reply_to_message)
         
         # ИЗМЕНЕНО: СЛЕНГ УБРАН, ДОБАВЛЕНО ФОРМАТИРОВАНИЕ
         target_link = get_user_link(data['target_id'], data['target_name'])
@@ -235,35 +289,35 @@ async def cmd_mute(message: types.Message, command: CommandObject):
         await answer_temp(message, f"Ошибка: {e}")
 
 @router.message(Command("warn"))
-async def cmd_warn(message: types.Message, command: CommandObject):
+async def cmd_warn(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER): 
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER, level=user_level): 
         return
     
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.")
     
-    sender_lvl = await get_sender_level(message.chat, message.from_user.id)
+    sender_lvl = user_level
     target_lvl = await get_sender_level(message.chat, data['target_id'])
     if target_lvl >= sender_lvl and message.from_user.id != OWNER_ID:
         return await answer_temp(message, "Нельзя выдать предупреждение равному или старшему.")
     
-    cnt = await manage_warn(data['target_id'], "add", reason=data['reason'])
+    cnt = await manage_warn(message.chat.id, data['target_id'], "add", reason=data['reason'], issuer_id=message.from_user.id)
     target_link = get_user_link(data['target_id'], data['target_name'])
     
     if data['delete_flag'] and message.reply_to_message: 
-        await delete_later(message.reply_to_message, 0)
+        delete_violation(message.reply_to_message)
         
     if cnt >= WARN_LIMIT:
         until = int(time.time()) + 1800
         try:
-            await message.chat.restrict(
+            await moderate(message.chat.restrict,
                 user_id=data['target_id'], 
                 permissions=ChatPermissions(can_send_messages=False), 
                 until_date=until
             )
-            await manage_warn(data['target_id'], "reset")
+            await manage_warn(message.chat.id, data['target_id'], "reset")
             # ИЗМЕНЕНО: СЛЕНГ УБРАН, ДОБАВЛЕНО ФОРМАТИРОВАНИЕ
             await answer_temp(message, 
                 f"🔇 {target_link} получил блокировку чата на <b>30 мин</b>,\n"
@@ -279,9 +333,9 @@ async def cmd_warn(message: types.Message, command: CommandObject):
         )
 
 @router.message(Command("unwarn"))
-async def cmd_unwarn(message: types.Message, command: CommandObject):
+async def cmd_unwarn(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER): 
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER, level=user_level): 
         return
         
     data = await parse_command_complex(message, command.args)
@@ -289,21 +343,21 @@ async def cmd_unwarn(message: types.Message, command: CommandObject):
         return await answer_temp(message, "Укажите цель.")
     
     action = "reset" if "all" in (command.args or "").lower() else "remove"
-    cnt = await manage_warn(data['target_id'], action)
+    cnt = await manage_warn(message.chat.id, data['target_id'], action)
     target_link = get_user_link(data['target_id'], data['target_name'])
     await answer_temp(message, f"✅ Предупреждение снято для {target_link}. Текущее количество: {cnt}")
 
 @router.message(Command("unmute"))
-async def cmd_unmute(message: types.Message, command: CommandObject):
+async def cmd_unmute(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER): 
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER, level=user_level): 
         return
         
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.")
     
-    await message.chat.restrict(
+    await moderate(message.chat.restrict,
         user_id=data['target_id'], 
         permissions=ChatPermissions(
             can_send_messages=True, 
@@ -319,25 +373,25 @@ async def cmd_unmute(message: types.Message, command: CommandObject):
 # --- УРОВЕНЬ 2: МОДЕРАТОР (Kick) ---
 
 @router.message(Command("kick"))
-async def cmd_kick(message: types.Message, command: CommandObject):
+async def cmd_kick(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MODER):
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MODER, level=user_level):
         return await answer_temp(message, "Нужен уровень <b>Moder²</b>.")
 
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.")
     
-    sender_lvl = await get_sender_level(message.chat, message.from_user.id)
+    sender_lvl = user_level
     target_lvl = await get_sender_level(message.chat, data['target_id'])
     if target_lvl >= sender_lvl and message.from_user.id != OWNER_ID:
         return await answer_temp(message, "Нельзя исключить равного или старшего.")
 
     try:
-        await message.chat.ban(user_id=data['target_id'])
-        await message.chat.unban(data['target_id']) 
+        await moderate(message.chat.ban, user_id=data['target_id'])
+        await moderate(message.chat.unban, data['target_id']) 
         if data['delete_flag'] and message.reply_to_message: 
-            await delete_later(message.reply_to_message, 0)
+            delete_violation(message.reply_to_message)
             
         # ИЗМЕНЕНО: СЛЕНГ УБРАН, ДОБАВЛЕНО ФОРМАТИРОВАНИЕ
         target_link = get_user_link(data['target_id'], data['target_name'])
@@ -348,19 +402,90 @@ async def cmd_kick(message: types.Message, command: CommandObject):
     except Exception as e: 
         await answer_temp(message, f"Ошибка: {e}")
 
+# --- УРОВЕНЬ 2: ЧИСТКА ЧАТА (Purge, Clean) ---
+PURGE_MAX = MESSAGE_LOG_SIZE
+
+async def _author_level(chat: types.Chat, author_id: int) -> int:
+    """Уровень автора из журнала сообщений (там же id каналов и 0 для неизвестных)."""
+    if author_id == chat.id:
+        return LVL_ADMIN # анонимный админ пишет от имени группы
+    if author_id <= 0:
+        return LVL_USER  # каналы: без записи в БД
+    return await get_sender_level(chat, author_id)
+
+async def purge_messages(message: types.Message, message_ids, user_level: int) -> int:
+    """
+    Удаляет сообщения пачками deleteMessages (по 100) через очередь действий.
+    Сообщения равных и старших по журналу не трогаются (кроме чистки владельцем).
+    """
+    message_ids = set(message_ids)
+    if message.from_user.id != OWNER_ID:
+        authors = message_log.authors(message.chat.id, message_ids)
+        levels = {author: await _author_level(message.chat, author) for author in set(authors.values())}
+        message_ids -= {message_id for message_id, author in authors.items() if levels[author] >= user_level}
+    message_ids = sorted(message_ids)
+    action_queue.delete_many(message.bot, message.chat.id, message_ids, PRIORITY_MODERATION)
+    message_log.discard(message.chat.id, message_ids)
+    return len(message_ids)
+
+@router.message(Command("purge"))
+async def cmd_purge(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
+    await delete_later(message, 0)
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MODER, level=user_level):
+        return await answer_temp(message, "Нужен уровень <b>Moder²</b>.")
+
+    if message.reply_to_message:
+        # Все от отмеченного сообщения до команды: id в чате идут подряд,
+        # уже удаленные и служебные Telegram пропустит сам
+        start = max(message.reply_to_message.message_id, message.message_id - PURGE_MAX)
+        count = await purge_messages(message, range(start, message.message_id), user_level)
+        return await answer_temp(message, f"🧹 Удалены сообщения, начиная с отмеченного: до <b>{count}</b> шт.")
+
+    arg = (command.args or "").strip()
+    if not arg.isdigit() or int(arg) < 1:
+        return await answer_temp(message, "Использование: <code>/purge N</code> или ответом на сообщение: <code>/purge</code>")
+
+    count = min(int(arg), PURGE_MAX)
+    message_ids = [mid for mid in message_log.last(message.chat.id, count + 1) if mid != message.message_id][:count]
+    if not message_ids:
+        return await answer_temp(message, "Нет сохраненных сообщений для удаления.")
+    count = await purge_messages(message, message_ids, user_level)
+    await answer_temp(message, f"🧹 Удалено сообщений: <b>{count}</b>.")
+
+@router.message(Command("clean"))
+async def cmd_clean(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
+    await delete_later(message, 0)
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MODER, level=user_level):
+        return await answer_temp(message, "Нужен уровень <b>Moder²</b>.")
+
+    data = await parse_command_complex(message, command.args)
+    if not data['target_id']: 
+        return await answer_temp(message, "Укажите цель.")
+
+    target_lvl = await get_sender_level(message.chat, data['target_id'])
+    if target_lvl >= user_level and message.from_user.id != OWNER_ID:
+        return await answer_temp(message, "Нельзя чистить сообщения равного или старшего.")
+
+    message_ids = message_log.by_author(message.chat.id, data['target_id'])
+    target_link = get_user_link(data['target_id'], data['target_name'])
+    if not message_ids:
+        return await answer_temp(message, f"Нет сохраненных сообщений {target_link}.")
+    count = await purge_messages(message, message_ids, user_level)
+    await answer_temp(message, f"🧹 Удалено сообщений {target_link}: <b>{count}</b>.")
+
 # --- УРОВЕНЬ 3: СТАРШИЙ МОДЕРАТОР (Ban, Unban) ---
 
 @router.message(Command("ban"))
-async def cmd_ban(message: types.Message, command: CommandObject):
+async def cmd_ban(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_SENIOR):
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_SENIOR, level=user_level):
         return await answer_temp(message, "Нужен уровень <b>Moder³</b>.")
 
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.")
     
-    sender_lvl = await get_sender_level(message.chat, message.from_user.id)
+    sender_lvl = user_level
     target_lvl = await get_sender_level(message.chat, data['target_id'])
     if target_lvl >= sender_lvl and message.from_user.id != OWNER_ID:
         return await answer_temp(message, "Нельзя заблокировать равного или старшего.")
@@ -368,15 +493,15 @@ async def cmd_ban(message: types.Message, command: CommandObject):
     try:
         until = int(time.time()) + data['duration'] if data['duration'] else 0
         if until > 0: 
-            await message.chat.ban(user_id=data['target_id'], until_date=until)
+            await moderate(message.chat.ban, user_id=data['target_id'], until_date=until)
             days = int(data['duration'] / 86400)
             time_str = f"на {days} дней" if days > 0 else "временно"
         else: 
-            await message.chat.ban(user_id=data['target_id'])
+            await moderate(message.chat.ban, user_id=data['target_id'])
             time_str = "навсегда"
         
         if data['delete_flag'] and message.reply_to_message: 
-            await delete_later(message.reply_to_message, 0)
+            delete_violation(message.reply_to_message)
             
         target_link = get_user_link(data['target_id'], data['target_name'])
         
@@ -389,16 +514,16 @@ async def cmd_ban(message: types.Message, command: CommandObject):
         await answer_temp(message, f"Ошибка: {e}")
 
 @router.message(Command("unban"))
-async def cmd_unban(message: types.Message, command: CommandObject):
+async def cmd_unban(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_SENIOR): 
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_SENIOR, level=user_level): 
         return
         
     data = await parse_command_complex(message, command.args)
     if not data['target_id']: 
         return await answer_temp(message, "Укажите цель.")
     try:
-        await message.chat.unban(data['target_id'])
+        await moderate(message.chat.unban, data['target_id'])
         target_link = get_user_link(data['target_id'], data['target_name'])
         # ИЗМЕНЕНО: СЛЕНГ УБРАН
         await answer_temp(message, f"✅ Блокировка снята с пользователя: {target_link}")
@@ -408,9 +533,9 @@ async def cmd_unban(message: types.Message, command: CommandObject):
 # --- УРОВЕНЬ МЕНЕДЖЕРА: ВЫДАЧА ПРАВ (promote) ---
 
 @router.message(Command("promote", "setlevel"))
-async def cmd_promote(message: types.Message, command: CommandObject):
+async def cmd_promote(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    sender_lvl = await get_sender_level(message.chat, message.from_user.id)
+    sender_lvl = user_level
     if sender_lvl < LVL_MANAGER:
         return await answer_temp(message, "Доступно только <b>Manager</b> и выше.")
 
@@ -437,7 +562,7 @@ async def cmd_promote(message: types.Message, command: CommandObject):
         if target_current_lvl >= LVL_MANAGER:
             return await answer_temp(message, "Нельзя менять права равного или старшего.")
 
-    await set_moderator_level(data['target_id'], new_level)
+    await set_moderator_level(message.chat.id, data['target_id'], new_level)
     
     # Новые названия ролей
     role_name = "Пользователь"
@@ -449,9 +574,9 @@ async def cmd_promote(message: types.Message, command: CommandObject):
     await answer_temp(message, f"🆙 Пользователю {target_link} установлен уровень <b>{new_level} ({role_name})</b>.")
 
 @router.message(Command("addxp", "givexp", "addexp"))
-async def cmd_addxp(message: types.Message, command: CommandObject):
+async def cmd_addxp(message: types.Message, command: CommandObject, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MANAGER):
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_MANAGER, level=user_level):
         return await answer_temp(message, "Доступно с уровня <b>Manager (4)</b>.")
 
     args = command.args.split() if command.args else []
@@ -470,7 +595,7 @@ async def cmd_addxp(message: types.Message, command: CommandObject):
     if not data['target_id']:
          return await answer_temp(message, "Пользователь не найден.")
 
-    old_lvl, new_lvl, _ = await update_xp(data['target_id'], amount)
+    old_lvl, new_lvl, _ = await update_xp(message.chat.id, data['target_id'], amount)
     
     target_link = get_user_link(data['target_id'], data['target_name'])
     msg_text = f"💳 Администратор выдал <code>{amount} XP</code> пользователю {target_link}."
@@ -483,9 +608,9 @@ async def cmd_addxp(message: types.Message, command: CommandObject):
     await answer_temp(message, msg_text)
 
 @router.message(Command("modhelp"))
-async def cmd_modhelp(message: types.Message):
+async def cmd_modhelp(message: types.Message, user_level: int = LVL_USER):
     await delete_later(message, 0)
-    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER): return
+    if not await is_admin(message.chat, message.from_user.id, message.sender_chat, required_level=LVL_HELPER, level=user_level): return
     
     text = (
         "📕 <b>Команды модератора</b>\n\n"
@@ -497,6 +622,8 @@ async def cmd_modhelp(message: types.Message):
         "• <code>/modhelp</code> — Эта панель\n\n"
         "<b>Moder²</b>\n"
         "• <code>/kick @username [причина]</code> — Исключить пользователя из чата\n"
+        "• <code>/purge N</code> — Удалить последние N сообщений (ответом на сообщение — все, начиная с него)\n"
+        "• <code>/clean @username</code> — Удалить последние сообщения пользователя\n"
         "• <code>/profile @username</code> — Просмотр чужого профиля\n\n"
         "<b>Moder³</b>\n"
         "• <code>/ban @username [причина] [Длительность]</code> — Заблокировать пользователя. Формат времени: 1d 1h 1m 1s\n"
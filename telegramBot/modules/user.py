@@ -5,24 +5,32 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, CallbackQu
 from database import (
     get_user, update_xp, get_warn_reasons, get_id_by_username, 
     LEVEL_CAPS, give_reputation, check_wipe_cooldown,
-    get_top_users, get_user_rank, get_all_staff 
+    get_top_users, get_user_rank, get_all_staff, xp_buffer, rank_indexes
 )
-from config import DEFAULT_XP_PER_MSG, WARN_LIMIT, OWNER_ID
-from utils import delete_later, answer_temp, get_user_link
+from config import DEFAULT_XP_PER_MSG, WARN_LIMIT, OWNER_ID, STATE_CACHE_SIZE
+from cache import TTLCache
+from actions import action_queue, PRIORITY_MODERATION
+from utils import delete_later, answer_temp, get_user_link, chat_admins
+from scheduler import schedule_delete
 import random
 import time
 from datetime import datetime
 
 router = Router()
 
-# КЕШИ
-user_last_msg = {}
-media_cooldown = {}
-chat_last_active = {}
-last_welcome_messages = {}
+# КЕШИ (TTL совпадает с кулдауном: истекшая запись ведет себя как отсутствующая)
+user_last_msg = TTLCache('xp_cooldown', maxsize=STATE_CACHE_SIZE, ttl=60)
+media_cooldown = TTLCache('media_cooldown', maxsize=STATE_CACHE_SIZE, ttl=600)
+# По чатам: записей немного, не истекают
+chat_last_active = TTLCache('chat_last_active', maxsize=10000)
+last_welcome_messages = TTLCache('welcome_messages', maxsize=10000)
 
-# КЕШ ДЛЯ ПРОФИЛЕЙ: {user_id: message_id}
-profile_messages = {}
+# КЕШ ДЛЯ ПРОФИЛЕЙ: {user_id: message_id}, сам профиль удаляется через 60 секунд
+profile_messages = TTLCache('profile_messages', maxsize=STATE_CACHE_SIZE, ttl=60)
+
+# КЕШ ТОПА ЛИДЕРОВ: {chat_id: {...}}, готовый HTML действителен,
+# пока не сменилась top_version индекса рейтинга этого чата
+leaders_cache = TTLCache('leaders', maxsize=1000)
 
 # URL КАРТИНОК
 IMG_LEVEL_3 = "https://i.ibb.co/S45s7p2D/Frame-26085979.png"
@@ -33,6 +41,10 @@ IMG_WELCOME = "https://i.ibb.co/Q3GG72fN/Frame-26085986.png"
 
 # --- ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ---
 
+def notify(message: types.Message, text: str):
+    """Ответ-поздравление через очередь действий: не ждет отправки и уступает модерации."""
+    action_queue.submit(message.chat.id, lambda: message.reply(text))
+
 async def get_effective_level(user_id: int, chat: types.Chat, db_level: int):
     """
     Определяет эффективный уровень (учитывая права админа).
@@ -44,13 +56,8 @@ async def get_effective_level(user_id: int, chat: types.Chat, db_level: int):
         return 5
         
     # 2. Проверка админки в текущем чате
-    if chat.type != 'private':
-        try:
-            member = await chat.get_member(user_id)
-            if member.status in ['creator', 'administrator']: 
-                return 5
-        except: 
-            pass
+    if await chat_admins.is_admin(chat, user_id):
+        return 5
             
     return effective_level
 
@@ -83,10 +90,10 @@ async def cmd_start(message: types.Message):
     )
 
 @router.message(Command("help"))
-async def cmd_help(message: types.Message):
+async def cmd_help(message: types.Message, user_row: tuple):
     await delete_later(message, 0)
     
-    user_data = await get_user(message.from_user.id)
+    user_data = user_row
     lvl = user_data[4]
 
     text = (
@@ -115,17 +122,17 @@ async def cmd_help(message: types.Message):
     )
 
 @router.message(Command("staff"))
-async def cmd_staff(message: types.Message):
+async def cmd_staff(message: types.Message, user_row: tuple):
     await delete_later(message, 0)
     
-    user_data = await get_user(message.from_user.id)
+    user_data = user_row
     lvl = user_data[4]
     
     eff_lvl = await get_effective_level(message.from_user.id, message.chat, lvl)
     if eff_lvl < 3:
         return await answer_temp(message, "🔒 Команда <code>/staff</code> доступна с <b>3 уровня</b>.", delay=5)
 
-    staff_list = await get_all_staff()
+    staff_list = await get_all_staff(message.chat.id)
     if not staff_list:
         return await answer_temp(message, "Список персонала пуст.", delay=10)
     
@@ -182,17 +189,17 @@ async def cmd_staff(message: types.Message):
     await answer_temp(message, full_text, delay=60)
 
 @router.message(Command("leaders"))
-async def cmd_leaders(message: types.Message):
+async def cmd_leaders(message: types.Message, user_row: tuple):
     await delete_later(message, 0)
     
-    user_data = await get_user(message.from_user.id)
+    user_data = user_row
     lvl = user_data[4]
     
     eff_lvl = await get_effective_level(message.from_user.id, message.chat, lvl)
     if eff_lvl < 2:
         return await answer_temp(message, "🔒 Список лидеров доступен со <b>2 уровня</b>.", delay=5)
     
-    text = await generate_leaders_text(message.from_user.id)
+    text = await generate_leaders_text(message.chat.id, message.from_user.id)
     
     await message.answer_photo(
         photo=IMG_HELP_LEADERS,
@@ -200,19 +207,29 @@ async def cmd_leaders(message: types.Message):
         parse_mode="HTML"
     )
 
-async def generate_leaders_text(user_id):
-    top_users = await get_top_users(limit=10)
-    text = "🏆 <b>ТОП ЛИДЕРОВ</b>\n\n"
-    
-    top_ids = []
+async def generate_leaders_text(chat_id, user_id):
+    index = rank_indexes.for_chat(chat_id)
+    version = index.top_version if index is not None else None
+    cached = leaders_cache.get(chat_id)
+
+    if version is None or not cached or cached['version'] != version:
+        top_users = await get_top_users(chat_id, limit=10)
+        text = "🏆 <b>ТОП ЛИДЕРОВ</b>\n\n"
+        
+        top_ids = []
+
+        for i, (name, lvl, xp, uid) in enumerate(top_users, 1):
+            top_ids.append(uid)
+            link_name = f"<a href='tg://user?id={uid}'>{name}</a>"
+            text += f"<b>{i}.</b> [LEVEL <b>{lvl}</b>] {link_name} (<code>{format_xp(xp)} XP</code>)\n"
 
-    for i, (name, lvl, xp, uid) in enumerate(top_users, 1):
-        top_ids.append(uid)
-        link_name = f"<a href='tg://user?id={uid}'>{name}</a>"
-        text += f"<b>{i}.</b> [LEVEL <b>{lvl}</b>] {link_name} (<code>{format_xp(xp)} XP</code>)\n"
+        if version is not None:
+            leaders_cache[chat_id] = {'version': version, 'text': text, 'top_ids': tuple(top_ids)}
+    else:
+        text, top_ids = cached['text'], cached['top_ids']
     
     if user_id not in top_ids:
-        my_stats = await get_user_rank(user_id)
+        my_stats = await get_user_rank(chat_id, user_id)
         if my_stats:
             rank, my_lvl, my_xp = my_stats
             text += f"\n\n<b>{rank}.</b> [LEVEL <b>{my_lvl}</b>] Вы (<code>{format_xp(my_xp)} XP</code>)"
@@ -220,21 +237,15 @@ async def generate_leaders_text(user_id):
     return text
 
 @router.message(Command("profile"))
-async def show_profile(message: types.Message, command: CommandObject):
+async def show_profile(message: types.Message, command: CommandObject, user_row: tuple):
     await delete_later(message, 0)
     user_id = message.from_user.id
 
-    if user_id in profile_messages:
-        try:
-            await message.bot.delete_message(chat_id=message.chat.id, message_id=profile_messages[user_id])
-        except Exception:
-            pass
+    old_profile_id = profile_messages.get((message.chat.id, user_id))
+    if old_profile_id:
+        action_queue.delete(message.bot, message.chat.id, old_profile_id)
 
-    caller_data = await get_user(
-        user_id=message.from_user.id, 
-        username=message.from_user.username, 
-        full_name=message.from_user.full_name
-    )
+    caller_data = user_row
     db_level = caller_data[6] if caller_data and len(caller_data) > 6 else 0
     lvl = caller_data[4]
     
@@ -259,7 +270,8 @@ async def show_profile(message: types.Message, command: CommandObject):
     
     if not target_id: return
 
-    text, photo = await generate_profile_content(target_id)
+    own_row = caller_data if target_id == message.from_user.id else None
+    text, photo = await generate_profile_content(message.chat.id, target_id, own_row)
     
     markup = None
     if target_id == message.from_user.id:
@@ -268,19 +280,22 @@ async def show_profile(message: types.Message, command: CommandObject):
 
     try:
         if photo:
-            msg = await message.answer_photo(photo=photo, caption=text, parse_mode="HTML", reply_markup=markup)
+            msg = await action_queue.run(message.chat.id, lambda: message.answer_photo(photo=photo, caption=text, parse_mode="HTML", reply_markup=markup))
         else:
-            msg = await message.answer(text, parse_mode="HTML", reply_markup=markup)
-        
-        profile_messages[user_id] = msg.message_id
-        await delete_later(msg, 60)
+            msg = await action_queue.run(message.chat.id, lambda: message.answer(text, parse_mode="HTML", reply_markup=markup))
+        if msg is None:
+            return
+        profile_messages[(message.chat.id, user_id)] = msg.message_id
+        schedule_delete(msg, 60)
         
     except Exception as e:
         await answer_temp(message, f"Ошибка: {e}")
 
 
-async def generate_profile_content(user_id):
-    data = await get_user(user_id)
+async def generate_profile_content(chat_id, user_id, data=None):
+    """data — уже загруженная строка пользователя (свой профиль: user_row из контекста апдейта)."""
+    if data is None:
+        data = await get_user(chat_id, user_id)
     if not data: return "Нет данных.", None
     
     _, _, db_full_name, xp, lvl, warns, mod_lvl, rep = data
@@ -323,7 +338,7 @@ async def generate_profile_content(user_id):
 
     warn_text = ""
     if warns > 0:
-        reasons_list = await get_warn_reasons(user_id)
+        reasons_list = await get_warn_reasons(chat_id, user_id)
         if reasons_list:
             reasons_formatted = "\n".join([f"• <i>{r}</i>" for r in reasons_list])
             warn_text = f"\n\n⚠️ <b>Предупреждения:</b>\n{reasons_formatted}"
@@ -365,10 +380,10 @@ def get_profile_keyboard(user_lvl):
 # --- CALLBACK HANDLERS (МЕНЮ ПРОФИЛЯ) ---
 
 @router.callback_query(F.data == "nav_profile")
-async def cb_back_profile(callback: CallbackQuery):
-    text, _ = await generate_profile_content(callback.from_user.id)
-    
-    caller_data = await get_user(callback.from_user.id)
+async def cb_back_profile(callback: CallbackQuery, user_row: tuple):
+    caller_data = user_row
+    text, _ = await generate_profile_content(callback.message.chat.id, callback.from_user.id, caller_data)
+
     lvl = caller_data[4]
     db_level = caller_data[6]
     
@@ -384,8 +399,8 @@ async def cb_back_profile(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "nav_leaders")
-async def cb_leaders(callback: CallbackQuery):
-    user_data = await get_user(callback.from_user.id)
+async def cb_leaders(callback: CallbackQuery, user_row: tuple):
+    user_data = user_row
     lvl = user_data[4]
     db_level = user_data[6]
     
@@ -394,7 +409,7 @@ async def cb_leaders(callback: CallbackQuery):
     if eff_lvl < 2 and lvl < 2:
         return await callback.answer("Нужен уровень 2!", show_alert=True)
         
-    text = await generate_leaders_text(callback.from_user.id)
+    text = await generate_leaders_text(callback.message.chat.id, callback.from_user.id)
     
     kb = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔙 Назад", callback_data="nav_profile")]
@@ -417,8 +432,8 @@ async def cb_leaders(callback: CallbackQuery):
     await callback.answer()
 
 @router.callback_query(F.data == "nav_games")
-async def cb_games(callback: CallbackQuery):
-    user_data = await get_user(callback.from_user.id)
+async def cb_games(callback: CallbackQuery, user_row: tuple):
+    user_data = user_row
     lvl = user_data[4]
     db_level = user_data[6]
     
@@ -462,35 +477,31 @@ async def cb_locked(callback: CallbackQuery):
 
 # --- WIPE (Народный модератор) ---
 @router.message(Command("wipe"))
-async def cmd_wipe(message: types.Message):
+async def cmd_wipe(message: types.Message, user_row: tuple):
     if not message.reply_to_message:
-        return await delete_later(message, 0)
+        return schedule_delete(message, 0)
     
-    user_data = await get_user(message.from_user.id)
+    user_data = user_row
     rpg_lvl = user_data[4]
     mod_lvl = user_data[6]
     
     is_chat_admin = False
     if message.from_user.id == OWNER_ID or mod_lvl >= 5:
         is_chat_admin = True
-    elif message.chat.type != 'private':
-        try:
-            member = await message.chat.get_member(message.from_user.id)
-            if member.status in ['administrator', 'creator']:
-                is_chat_admin = True
-        except: pass
+    elif await chat_admins.is_admin(message.chat, message.from_user.id):
+        is_chat_admin = True
     
     if rpg_lvl < 5 and not is_chat_admin:
-        return await delete_later(message, 0)
+        return schedule_delete(message, 0)
         
     if not is_chat_admin:
-        can_wipe = await check_wipe_cooldown(message.from_user.id)
+        can_wipe = await check_wipe_cooldown(message.chat.id, message.from_user.id)
         if not can_wipe:
             await delete_later(message, 0)
             return await answer_temp(message, "⏳ <b>Команду /wipe можно использовать 1 раз в сутки.</b>")
         
     try:
-        await message.reply_to_message.delete()
+        await action_queue.delete(message.bot, message.chat.id, message.reply_to_message.message_id, PRIORITY_MODERATION)
         await delete_later(message, 0)
         await message.answer(f"🗑 <b>Народный модератор {message.from_user.mention_html()} удалил сообщение!</b>")
     except Exception as e:
@@ -500,18 +511,12 @@ async def cmd_wipe(message: types.Message):
 # --- ПРИВЕТСТВИЕ ---
 @router.message(F.new_chat_members)
 async def on_user_join(message: types.Message):
-    try:
-        await message.delete()
-    except Exception:
-        pass
+    await delete_later(message, 0)
 
     chat_id = message.chat.id
-    if chat_id in last_welcome_messages:
-        old_message_id = last_welcome_messages[chat_id]
-        try:
-            await message.bot.delete_message(chat_id=chat_id, message_id=old_message_id)
-        except Exception:
-            pass
+    old_message_id = last_welcome_messages.get(chat_id)
+    if old_message_id:
+        action_queue.delete(message.bot, chat_id, old_message_id)
 
     new_user = message.new_chat_members[0]
     welcome_text = (
@@ -523,20 +528,22 @@ async def on_user_join(message: types.Message):
     )
 
     try:
-        sent_message = await message.answer_photo(
+        sent_message = await action_queue.run(chat_id, lambda: message.answer_photo(
             photo=IMG_WELCOME,
             caption=welcome_text,
             parse_mode="HTML"
-        )
+        ))
+        if sent_message is None:
+            return
         last_welcome_messages[chat_id] = sent_message.message_id
-        await delete_later(sent_message, 600)
+        schedule_delete(sent_message, 600)
     except Exception as e:
         print(f"Ошибка при отправке приветствия: {e}")
 
 
 # --- ОСНОВНОЙ ХЕНДЛЕР ТЕКСТА (ФАРМ XP + REP) ---
 @router.message(F.text & ~F.text.startswith('/'))
-async def text_handler(message: types.Message):
+async def text_handler(message: types.Message, user_row: tuple):
     if message.chat.type == 'private': return
     
     user_id = message.from_user.id
@@ -545,26 +552,22 @@ async def text_handler(message: types.Message):
     
     # 1. СИСТЕМА РЕПУТАЦИИ (+rep)
     if message.reply_to_message and text.strip().lower() in ["+rep", "+реп", "респект"]:
-        giver = await get_user(user_id)
+        giver = user_row
         giver_rpg_lvl = giver[4] # RPG Level
         giver_mod_lvl = giver[6] # Mod Level
         
         is_admin_or_staff = False
         if giver_mod_lvl >= 1 or user_id == OWNER_ID:
              is_admin_or_staff = True
-        elif message.chat.type != 'private':
-            try:
-                member = await message.chat.get_member(user_id)
-                if member.status in ['administrator', 'creator']:
-                    is_admin_or_staff = True
-            except: pass
+        elif await chat_admins.is_admin(message.chat, user_id):
+            is_admin_or_staff = True
         
         if giver_rpg_lvl >= 4 or is_admin_or_staff:
             target_id = message.reply_to_message.from_user.id
-            result = await give_reputation(user_id, target_id)
+            result = await give_reputation(message.chat.id, user_id, target_id)
             
             if result == "success":
-                old, new, added = await update_xp(target_id, 150)
+                old, new, added = await update_xp(message.chat.id, target_id, 150)
                 await message.answer(
                     f"🤝 {message.from_user.mention_html()} повысил репутацию {message.reply_to_message.from_user.mention_html()}!\n"
                     f"Получено <code>+150 XP</code>."
@@ -596,7 +599,7 @@ async def text_handler(message: types.Message):
     if now - chat_last > 3600:
         earned_xp += 50
         # ИЗМЕНЕНО: БОНУС НЕКРОМАНТА -> Бонус за оживление чата
-        await message.reply("⚡ <b>Бонус за оживление чата!</b>\n<code>+50 XP</code>!")
+        notify(message, "⚡ <b>Бонус за оживление чата!</b>\n<code>+50 XP</code>!")
     
     chat_last_active[message.chat.id] = now
     
@@ -604,17 +607,17 @@ async def text_handler(message: types.Message):
     if 2 <= current_hour < 7:
         earned_xp = int(earned_xp * 1.5)
         
-    await get_user(user_id, message.from_user.username, message.from_user.full_name)
-    old_lvl, new_lvl, _ = await update_xp(user_id, earned_xp)
+    # Участник уже создан ContextMiddleware. Начисление через буфер: запись в БД пачкой, уровень считается сразу
+    old_lvl, new_lvl, _ = await xp_buffer.add(message.chat.id, user_id, earned_xp)
     
     # ИЗМЕНЕНО: LEVEL UP/DOWN -> Уровень повышен/понижен
     if new_lvl > old_lvl:
-        await message.reply(
+        notify(message,
             f"🆙 <b>Уровень повышен до {new_lvl}!</b>\n"
             f"{message.from_user.mention_html()} достиг новых высот!"
         )
     elif new_lvl < old_lvl:
-        await message.reply(
+        notify(message,
             f"📉 <b>Уровень понижен до {new_lvl}...</b>\n"
             f"{message.from_user.mention_html()} потерял позиции."
         )
@@ -632,15 +635,13 @@ async def media_handler(message: types.Message):
     if now - last_media > 600:
         media_cooldown[user_id] = now
         
-        await get_user(user_id, message.from_user.username, message.from_user.full_name)
-        
         amount = 15
         current_hour = datetime.now().hour
         if 2 <= current_hour < 7:
             amount = int(amount * 1.5)
             
-        old_lvl, new_lvl, _ = await update_xp(user_id, amount)
+        old_lvl, new_lvl, _ = await xp_buffer.add(message.chat.id, user_id, amount)
         
         # ИЗМЕНЕНО: LEVEL UP
         if new_lvl > old_lvl:
-            await message.reply(f"🆙 <b>Уровень повышен до {new_lvl}! (Контент-мейкер)</b>")
\ No newline at end of file
+            notify(message, f"🆙 <b>Уровень повышен до {new_lvl}! (Контент-мейкер)</b>")
\ No newline at end of file
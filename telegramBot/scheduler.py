@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Отложенное удаление сообщений: одна задача и куча сроков вместо
+спящей задачи на каждое сообщение. Запланированное сохраняется в БД
+и восстанавливается после перезапуска.
+"""
+import asyncio
+import heapq
+import logging
+import time
+import database
+from actions import action_queue
+from config import SCHEDULE_FLUSH_INTERVAL, SCHEDULE_PERSIST_MIN
+
+class DeleteScheduler:
+    """
+    Куча (срок, chat_id, message_id, сохранено ли в БД). Задача спит до ближайшего срока
+    и отдает все наступившие удаления в очередь действий сразу по чатам —
+    там они уходят пачками deleteMessages.
+    В БД изменения пишутся одной транзакцией раз в flush_interval секунд;
+    удаления короче persist_min секунд не сохраняются совсем.
+    """
+    def __init__(self, flush_interval: float = SCHEDULE_FLUSH_INTERVAL, persist_min: float = SCHEDULE_PERSIST_MIN):
+        self.flush_interval = flush_interval
+        self.persist_min = persist_min
+        self.bot = None
+        self._heap = []
+        self._added = {}   # { (chat_id, message_id): due_at } — еще не записано в БД
+        self._removed = set()
+        self._on_delete = {} # { (chat_id, message_id): функция без аргументов } — только в памяти
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._flush_task = None
+
+    def schedule(self, bot, chat_id: int, message_id: int, delay: float, on_delete=None):
+        """
+        Не ждет: возвращается сразу, удаление произойдет через delay секунд.
+        on_delete вызывается, когда удаление уходит в очередь (после перезапуска не вызывается).
+        """
+        if self.bot is None:
+            self.bot = bot
+        if delay <= 0:
+            action_queue.delete(bot, chat_id, message_id)
+            if on_delete:
+                on_delete()
+            return
+        if on_delete:
+            self._on_delete[(chat_id, message_id)] = on_delete
+        due_at = time.time() + delay
+        if not self._heap or due_at < self._heap[0][0]:
+            self._wakeup.set()
+        persisted = delay >= self.persist_min
+        heapq.heappush(self._heap, (due_at, chat_id, message_id, persisted))
+        if persisted:
+            self._added[(chat_id, message_id)] = due_at
+
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def _fire_due(self):
+        now = time.time()
+        by_chat = {}
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id, persisted = heapq.heappop(self._heap)
+            by_chat.setdefault(chat_id, []).append(message_id)
+            key = (chat_id, message_id)
+            # Не успело попасть в БД — записывать уже не нужно
+            if persisted and self._added.pop(key, None) is None:
+                self._removed.add(key)
+            callback = self._on_delete.pop(key, None)
+            if callback:
+                callback()
+        for chat_id, message_ids in by_chat.items():
+            action_queue.delete_many(self.bot, chat_id, message_ids)
+
+    async def _run(self):
+        while True:
+            self._fire_due()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def flush(self):
+        if not self._added and not self._removed:
+            return
+        added, self._added = self._added, {}
+        removed, self._removed = self._removed, set()
+        try:
+            await database.storage.save_scheduled_deletes(
+                [(chat_id, message_id, due_at) for (chat_id, message_id), due_at in added.items()],
+                list(removed)
+            )
+        except Exception:
+            # Вернем в буфер, попробуем в следующий раз
+            for key, due_at in added.items():
+                self._added.setdefault(key, due_at)
+            self._removed |= removed
+            raise
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.error(f"Отложенные удаления: ошибка записи в БД: {e}")
+
+    async def load(self):
+        """Восстанавливает сохраненные удаления; просроченные за время простоя выполнятся сразу."""
+        rows = await database.storage.load_scheduled_deletes()
+        for chat_id, message_id, due_at in rows:
+            heapq.heappush(self._heap, (due_at, chat_id, message_id, True))
+        if rows:
+            logging.info(f"Отложенные удаления: восстановлено {len(rows)}")
+        self._wakeup.set()
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._flush_task = None
+        await self.flush()
+
+delete_scheduler = DeleteScheduler()
+
+def schedule_delete(message, delay: float = 0, on_delete=None):
+    """Удалить сообщение через delay секунд. Не блокирует обработчик."""
+    delete_scheduler.schedule(message.bot, message.chat.id, message.message_id, delay, on_delete)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+Движки хранения данных бота. database.py работает только через интерфейс Storage,
+поэтому движок выбирается настройкой STORAGE_BACKEND без изменений в обработчиках.
+"""
+from .base import Storage, GLOBAL_CHAT_ID, LIST_TABLES, query_stats, count_query
+from .sqlite import SQLiteStorage
+from .memory import MemoryStorage
+
+BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'memory': MemoryStorage,
+}
+
+def create_storage(name: str = 'sqlite', **kwargs) -> Storage:
+    """Создает движок по имени из BACKENDS."""
+    try:
+        backend = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Неизвестный движок хранения: {name!r} (доступны: {', '.join(BACKENDS)})")
+    return backend(**kwargs)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+
+# chat_id записей белого списка и фильтра слов, действующих во всех чатах
+GLOBAL_CHAT_ID = 0
+
+# Таблицы списков и имя столбца значения
+LIST_TABLES = {'whitelist': 'item', 'badwords': 'word'}
+
+# Счетчик обращений к данным в рамках одного апдейта: Counter или None вне апдейта
+# (заводится в ContextMiddleware, см. context.py)
+query_stats = ContextVar('query_stats', default=None)
+
+def count_query(kind: str):
+    stats = query_stats.get()
+    if stats is not None:
+        stats[kind] += 1
+
+class Storage(ABC):
+    """
+    Интерфейс движка хранения. Кеши, буфер XP и индекс рейтинга живут
+    в database.py над движком, здесь только атомарные операции с данными.
+
+    Строка участника — кортеж
+    (user_id, username, full_name, xp, level, warns, mod_level, reputation).
+    """
+    name = 'base'
+
+    # === ЖИЗНЕННЫЙ ЦИКЛ ===
+    async def start(self):
+        """Открывает соединения. Повторный вызов ничего не делает."""
+
+    async def close(self):
+        """Закрывает соединения."""
+
+    @abstractmethod
+    async def create_tables(self):
+        """Приводит схему к актуальной версии."""
+
+    # === ПОЛЬЗОВАТЕЛИ ===
+    @abstractmethod
+    async def fetch_member(self, chat_id, user_id):
+        """
+        Строка участника, None для неизвестного пользователя.
+        Если пользователь известен, но не состоит в чате, поля статистики равны None.
+        """
+
+    @abstractmethod
+    async def create_member(self, chat_id, user_id, username, full_name):
+        """Создает (или обновляет) личность и запись участника со статистикой по умолчанию."""
+
+    @abstractmethod
+    async def update_identity(self, user_id, username, full_name):
+        """Обновляет username и имя пользователя."""
+
+    @abstractmethod
+    async def get_id_by_username(self, username):
+        """user_id по username (без @, в нижнем регистре) или None."""
+
+    # === ОПЫТ ===
+    @abstractmethod
+    async def get_total_xp(self, chat_id, user_id):
+        """Суммарный XP участника или None."""
+
+    @abstractmethod
+    async def add_xp(self, chat_id, user_id, delta):
+        """Атомарно меняет XP (не ниже нуля). Возвращает (прежний total_xp, total_xp, level) или None."""
+
+    @abstractmethod
+    async def add_xp_many(self, deltas):
+        """Пакетная версия add_xp: deltas — [(chat_id, user_id, delta), ...] одной транзакцией."""
+
+    @abstractmethod
+    async def load_rank_totals(self):
+        """[(chat_id, user_id, total_xp), ...] всех участников — для индекса рейтинга."""
+
+    # === РЕПУТАЦИЯ И МОДЕРАЦИЯ ===
+    @abstractmethod
+    async def give_reputation(self, chat_id, from_user_id, to_user_id, today, daily_limit=3):
+        """'success', 'daily_limit_user' или 'daily_limit_total'."""
+
+    @abstractmethod
+    async def check_wipe_cooldown(self, chat_id, user_id, today):
+        """True и отметка даты, если сегодня вайпа еще не было."""
+
+    @abstractmethod
+    async def set_moderator_level(self, chat_id, user_id, level):
+        """Назначает уровень модерации, создавая запись участника при необходимости."""
+
+    @abstractmethod
+    async def manage_warn(self, chat_id, user_id, action, reason=None, issuer_id=None, issued_at=0):
+        """
+        action: 'add', 'remove' или 'reset'. Возвращает новое число активных варнов.
+        Журнал варнов и счетчик warns участника меняются одной транзакцией.
+        """
+
+    @abstractmethod
+    async def get_warn_reasons(self, chat_id, user_id):
+        """Причины активных варнов в порядке выдачи (варны без причины пропускаются)."""
+
+    @abstractmethod
+    async def sweep_warns(self, cutoff, limit):
+        """
+        Удаляет до limit варнов, выданных раньше cutoff (unix-время), и уменьшает счетчики.
+        Возвращает [(chat_id, user_id), ...] по одной паре на каждый удаленный варн.
+        """
+
+    # === СПИСКИ ===
+    @abstractmethod
+    async def add_to_list(self, table, chat_id, item):
+        """False, если запись уже есть."""
+
+    @abstractmethod
+    async def remove_from_list(self, table, chat_id, item):
+        pass
+
+    @abstractmethod
+    async def get_list(self, table, chat_id, include_global=True):
+        pass
+
+    @abstractmethod
+    async def clear_list(self, table, chat_id):
+        pass
+
+    @abstractmethod
+    async def load_lists(self, table):
+        """[(chat_id, значение), ...] всех чатов — для кеша списков."""
+
+    # === ЛИДЕРЫ И СТАФФ ===
+    @abstractmethod
+    async def get_top_users(self, chat_id, limit=10):
+        """[(full_name, level, xp, user_id), ...] по убыванию суммарного XP."""
+
+    @abstractmethod
+    async def get_member_rank(self, chat_id, user_id):
+        """(место, level, xp) или None, без индекса рейтинга."""
+
+    @abstractmethod
+    async def get_all_staff(self, chat_id):
+        """[(full_name, mod_level, username, user_id), ...] по убыванию mod_level."""
+
+    # === ОТЛОЖЕННЫЕ УДАЛЕНИЯ ===
+    @abstractmethod
+    async def save_scheduled_deletes(self, added, removed):
+        """
+        Одной транзакцией: added — [(chat_id, message_id, due_at), ...] запланировать,
+        removed — [(chat_id, message_id), ...] забыть (уже удалены).
+        """
+
+    @abstractmethod
+    async def load_scheduled_deletes(self):
+        """[(chat_id, message_id, due_at), ...] — для восстановления после перезапуска."""
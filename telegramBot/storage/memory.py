@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+from levels import level_from_total
+from .base import Storage, GLOBAL_CHAT_ID, LIST_TABLES
+
+class _Member:
+    __slots__ = ('total_xp', 'warns', 'mod_level', 'reputation', 'last_wipe_date')
+
+    def __init__(self, mod_level=0):
+        self.total_xp = 0
+        self.warns = 0
+        self.mod_level = mod_level
+        self.reputation = 0
+        self.last_wipe_date = None
+
+class MemoryStorage(Storage):
+    """
+    Движок в памяти процесса: для нагрузочных прогонов и запуска без файла БД.
+    Данные не переживают перезапуск. Все операции синхронны внутри одного
+    шага цикла событий, поэтому блокировки не нужны.
+    """
+    name = 'memory'
+
+    def __init__(self):
+        self.users = {}        # { user_id: [username, full_name] }
+        self.members = {}      # { (chat_id, user_id): _Member }
+        self.rep_history = set()  # { (chat_id, from_id, date_str, to_id) }
+        self.warn_reasons = {} # { (chat_id, user_id): [(issued_at, issuer_id, reason), ...] }
+        # { table: { chat_id: {item: None} } } — dict сохраняет порядок добавления
+        self.lists = {table: {} for table in LIST_TABLES}
+        self.scheduled_deletes = {} # { (chat_id, message_id): due_at }
+
+    async def create_tables(self):
+        pass
+
+    def _row(self, user_id, member):
+        username, full_name = self.users[user_id]
+        if member is None:
+            return (user_id, username, full_name, None, None, None, None, None)
+        xp, level = level_from_total(member.total_xp)
+        return (user_id, username, full_name, xp, level, member.warns, member.mod_level, member.reputation)
+
+    # --- Пользователи ---
+    async def fetch_member(self, chat_id, user_id):
+        if user_id not in self.users:
+            return None
+        return self._row(user_id, self.members.get((chat_id, user_id)))
+
+    async def create_member(self, chat_id, user_id, username, full_name):
+        self.users[user_id] = [username, full_name]
+        self.members.setdefault((chat_id, user_id), _Member())
+
+    async def update_identity(self, user_id, username, full_name):
+        if user_id in self.users:
+            self.users[user_id] = [username, full_name]
+
+    async def get_id_by_username(self, username):
+        for user_id, (name, _) in self.users.items():
+            if name == username:
+                return user_id
+        return None
+
+    # --- Опыт ---
+    async def get_total_xp(self, chat_id, user_id):
+        member = self.members.get((chat_id, user_id))
+        return member.total_xp if member else None
+
+    async def add_xp(self, chat_id, user_id, delta):
+        member = self.members.get((chat_id, user_id))
+        if member is None:
+            return None
+        old_total = member.total_xp
+        member.total_xp = max(0, old_total + delta)
+        return old_total, member.total_xp, level_from_total(member.total_xp)[1]
+
+    async def add_xp_many(self, deltas):
+        for chat_id, user_id, delta in deltas:
+            await self.add_xp(chat_id, user_id, delta)
+
+    async def load_rank_totals(self):
+        return [(chat_id, user_id, m.total_xp) for (chat_id, user_id), m in self.members.items()]
+
+    # --- Репутация и модерация ---
+    async def give_reputation(self, chat_id, from_user_id, to_user_id, today, daily_limit=3):
+        if (chat_id, from_user_id, today, to_user_id) in self.rep_history:
+            return "daily_limit_user"
+        given = sum(1 for c, f, d, _ in self.rep_history if (c, f, d) == (chat_id, from_user_id, today))
+        if given >= daily_limit:
+            return "daily_limit_total"
+        self.rep_history.add((chat_id, from_user_id, today, to_user_id))
+        member = self.members.get((chat_id, to_user_id))
+        if member:
+            member.reputation += 1
+        return "success"
+
+    async def check_wipe_cooldown(self, chat_id, user_id, today):
+        member = self.members.get((chat_id, user_id))
+        if member and member.last_wipe_date == today:
+            return False
+        if member:
+            member.last_wipe_date = today
+        return True
+
+    async def set_moderator_level(self, chat_id, user_id, level):
+        member = self.members.get((chat_id, user_id))
+        if member is None:
+            self.members[(chat_id, user_id)] = _Member(mod_level=level)
+        else:
+            member.mod_level = level
+
+    async def manage_warn(self, chat_id, user_id, action, reason=None, issuer_id=None, issued_at=0):
+        key = (chat_id, user_id)
+        member = self.members.get(key)
+        reasons = self.warn_reasons.setdefault(key, [])
+        if action == "reset":
+            if member: member.warns = 0
+            reasons.clear()
+            return 0
+        if action == "remove":
+            if member: member.warns = max(0, member.warns - 1)
+            if reasons: reasons.pop()
+        else:
+            if member: member.warns += 1
+            reasons.append((issued_at, issuer_id, reason))
+        return member.warns if member else 0
+
+    async def get_warn_reasons(self, chat_id, user_id):
+        return [reason for _, _, reason in self.warn_reasons.get((chat_id, user_id), ()) if reason is not None]
+
+    async def sweep_warns(self, cutoff, limit):
+        removed = []
+        for key, ledger in self.warn_reasons.items():
+            expired = [warn for warn in ledger if warn[0] < cutoff][:limit - len(removed)]
+            if not expired:
+                continue
+            for warn in expired:
+                ledger.remove(warn)
+            member = self.members.get(key)
+            if member:
+                member.warns = max(0, member.warns - len(expired))
+            removed.extend([key] * len(expired))
+            if len(removed) >= limit:
+                break
+        return removed
+
+    # --- Списки ---
+    async def add_to_list(self, table, chat_id, item):
+        items = self.lists[table].setdefault(chat_id, {})
+        if item in items:
+            return False
+        items[item] = None
+        return True
+
+    async def remove_from_list(self, table, chat_id, item):
+        self.lists[table].get(chat_id, {}).pop(item, None)
+
+    async def get_list(self, table, chat_id, include_global=True):
+        lists = self.lists[table]
+        items = dict(lists.get(chat_id, {}))
+        if include_global and chat_id != GLOBAL_CHAT_ID:
+            items.update(lists.get(GLOBAL_CHAT_ID, {}))
+        return list(items)
+
+    async def clear_list(self, table, chat_id):
+        self.lists[table].pop(chat_id, None)
+
+    async def load_lists(self, table):
+        return [(chat_id, item) for chat_id, items in self.lists[table].items() for item in items]
+
+    # --- Лидеры и стафф ---
+    def _name(self, user_id, index=1):
+        identity = self.users.get(user_id)
+        return identity[index] if identity else None
+
+    async def get_top_users(self, chat_id, limit=10):
+        chat = [(m.total_xp, user_id) for (c, user_id), m in self.members.items() if c == chat_id]
+        chat.sort(reverse=True)
+        rows = []
+        for total, user_id in chat[:limit]:
+            xp, level = level_from_total(total)
+            rows.append((self._name(user_id) or 'User', level, xp, user_id))
+        return rows
+
+    async def get_member_rank(self, chat_id, user_id):
+        member = self.members.get((chat_id, user_id))
+        if member is None:
+            return None
+        above = sum(1 for (c, _), m in self.members.items() if c == chat_id and m.total_xp > member.total_xp)
+        xp, level = level_from_total(member.total_xp)
+        return above + 1, level, xp
+
+    async def get_all_staff(self, chat_id):
+        staff = [(m.mod_level, user_id) for (c, user_id), m in self.members.items()
+                 if c == chat_id and m.mod_level > 0]
+        staff.sort(key=lambda s: s[0], reverse=True)
+        return [(self._name(user_id, 1) or 'User', level, self._name(user_id, 0), user_id)
+                for level, user_id in staff]
+
+    # --- Отложенные удаления ---
+    async def save_scheduled_deletes(self, added, removed):
+        for chat_id, message_id, due_at in added:
+            self.scheduled_deletes[(chat_id, message_id)] = due_at
+        for key in removed:
+            self.scheduled_deletes.pop(tuple(key), None)
+
+    async def load_scheduled_deletes(self):
+        return [(chat_id, message_id, due_at) for (chat_id, message_id), due_at in self.scheduled_deletes.items()]
@@ -0,0 +1,599 @@
+# -*- coding: utf-8 -*-
+import aiosqlite
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from config import LEGACY_CHAT_ID
+from levels import LEVEL_THRESHOLDS, MAX_LEVEL
+from .base import Storage, GLOBAL_CHAT_ID, LIST_TABLES, count_query
+
+DB_NAME = 'bot_database.db'
+
+def _level_sql(expr: str, thresholds: bool = False) -> str:
+    """CASE-выражение уровня (или его порога) для суммарного XP expr."""
+    whens = " ".join(
+        f"WHEN {expr} >= {LEVEL_THRESHOLDS[lvl]} THEN {LEVEL_THRESHOLDS[lvl] if thresholds else lvl}"
+        for lvl in range(MAX_LEVEL, 1, -1)
+    )
+    return f"CASE {whens} ELSE {0 if thresholds else 1} END"
+
+# Атомарное изменение XP одним запросом: level и xp пересчитываются из total_xp
+_NEW_TOTAL = "MAX(0, total_xp + :delta)"
+XP_UPDATE_SQL = (
+    f"UPDATE chat_members SET total_xp = {_NEW_TOTAL}, "
+    f"level = {_level_sql(_NEW_TOTAL)}, "
+    f"xp = {_NEW_TOTAL} - {_level_sql(_NEW_TOTAL, thresholds=True)} "
+    f"WHERE chat_id = :chat_id AND user_id = :user_id"
+)
+
+# === ПУЛ СОЕДИНЕНИЙ ===
+class ConnectionPool:
+    """
+    Долгоживущие соединения с SQLite: несколько читателей и один писатель.
+    WAL позволяет читать параллельно с записью, поэтому читатели не ждут писателя.
+    """
+    PRAGMAS = (
+        'PRAGMA journal_mode = WAL',
+        'PRAGMA synchronous = NORMAL',
+        'PRAGMA temp_store = MEMORY',
+        'PRAGMA cache_size = -8000',     # ~8 МБ страничного кеша на соединение
+        'PRAGMA mmap_size = 67108864',   # 64 МБ
+        'PRAGMA busy_timeout = 5000',
+        'PRAGMA foreign_keys = ON',
+    )
+
+    def __init__(self, path: str, readers: int = 3):
+        self.path = path
+        self.readers_count = readers
+        self._readers = None
+        self._all_readers = []
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._start_lock = asyncio.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._writer is not None
+
+    async def _open(self, read_only: bool = False):
+        conn = await aiosqlite.connect(self.path)
+        for pragma in self.PRAGMAS:
+            await conn.execute(pragma)
+        if read_only:
+            await conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    async def start(self):
+        async with self._start_lock:
+            if self.started:
+                return
+            # Писатель открывается первым: он включает WAL для файла базы
+            self._writer = await self._open()
+            self._readers = asyncio.Queue()
+            for _ in range(self.readers_count):
+                conn = await self._open(read_only=True)
+                self._all_readers.append(conn)
+                self._readers.put_nowait(conn)
+            logging.info(f"БД: пул открыт ({self.readers_count} читателя + 1 писатель)")
+
+    async def close(self):
+        async with self._start_lock:
+            if not self.started:
+                return
+            # Дожидаемся текущей транзакции записи
+            async with self._write_lock:
+                for conn in self._all_readers:
+                    await conn.close()
+                self._all_readers = []
+                self._readers = None
+                try:
+                    await self._writer.execute('PRAGMA optimize')
+                except Exception:
+                    pass
+                await self._writer.close()
+                self._writer = None
+            logging.info("БД: пул закрыт")
+
+    @asynccontextmanager
+    async def read(self):
+        """Соединение только для чтения (возвращается в пул после использования)."""
+        if not self.started:
+            await self.start()
+        count_query('read')
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self):
+        """Единственный писатель. Транзакция фиксируется при выходе, откатывается при ошибке."""
+        if not self.started:
+            await self.start()
+        count_query('write')
+        async with self._write_lock:
+            try:
+                yield self._writer
+                await self._writer.commit()
+            except BaseException:
+                await self._writer.rollback()
+                raise
+
+# === МИГРАЦИИ СХЕМЫ ===
+# Версия схемы хранится в PRAGMA user_version. Каждый шаг выполняется
+# в своей транзакции вместе с записью новой версии, поэтому применяется ровно один раз.
+# Старые базы без версии (user_version = 0) проходят все шаги: добавление
+# колонок пропускается, если колонка уже есть.
+
+async def _columns(db, table):
+    cursor = await db.execute(f'PRAGMA table_info({table})')
+    return {row[1] for row in await cursor.fetchall()}
+
+async def _add_column(db, table, column, ddl) -> bool:
+    if column in await _columns(db, table):
+        return False
+    await db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+    return True
+
+async def _m1_base_tables(db):
+    # Исходная схема: основная таблица пользователей и служебные таблицы
+    await db.execute('''CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        xp INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        warns INTEGER DEFAULT 0
+    )''')
+    await db.execute('''CREATE TABLE IF NOT EXISTS rep_history (
+        from_id INTEGER,
+        to_id INTEGER,
+        date_str TEXT,
+        PRIMARY KEY (from_id, to_id, date_str)
+    )''')
+    await db.execute('CREATE TABLE IF NOT EXISTS whitelist (item TEXT PRIMARY KEY)')
+    await db.execute('CREATE TABLE IF NOT EXISTS badwords (word TEXT PRIMARY KEY)')
+    await db.execute('''CREATE TABLE IF NOT EXISTS warn_reasons (
+        id INTEGER PRIMARY KEY AUTOINCREMENT, 
+        user_id INTEGER, 
+        reason TEXT
+    )''')
+
+async def _m2_full_name(db):
+    await _add_column(db, 'users', 'full_name', 'TEXT')
+
+async def _m3_mod_level(db):
+    await _add_column(db, 'users', 'mod_level', 'INTEGER DEFAULT 0')
+
+async def _m4_reputation(db):
+    await _add_column(db, 'users', 'reputation', 'INTEGER DEFAULT 0')
+    await _add_column(db, 'users', 'last_wipe_date', 'TEXT DEFAULT NULL')
+
+async def _m5_total_xp(db):
+    if await _add_column(db, 'users', 'total_xp', 'INTEGER DEFAULT 0'):
+        base = " ".join(f"WHEN {lvl} THEN {th}" for lvl, th in LEVEL_THRESHOLDS.items())
+        await db.execute(f'UPDATE users SET total_xp = xp + CASE level {base} ELSE 0 END')
+
+async def _m6_user_indexes(db):
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_username ON users (username)')
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_level_xp ON users (level DESC, xp DESC)') 
+    await db.execute('CREATE INDEX IF NOT EXISTS idx_total_xp ON users (total_xp DESC)')
+
+async def _retire_table(db, table):
+    # Таблица с данными остается как {table}_legacy, пустая (новая установка) удаляется
+    cursor = await db.execute(f'SELECT EXISTS (SELECT 1 FROM {table})')
+    if (await cursor.fetchone())[0]:
+        await db.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+    else:
+        await db.execute(f'DROP TABLE {table}')
+
+async def _has_legacy_stats(db) -> bool:
+    # Данные, которые привязываются к чату. Одни имена и списки переносятся и без LEGACY_CHAT_ID
+    cursor = await db.execute('''
+        SELECT EXISTS (SELECT 1 FROM users WHERE IFNULL(total_xp, 0) > 0 OR IFNULL(xp, 0) > 0
+                           OR IFNULL(warns, 0) > 0 OR IFNULL(mod_level, 0) > 0 OR IFNULL(reputation, 0) > 0)
+            OR EXISTS (SELECT 1 FROM rep_history)
+            OR EXISTS (SELECT 1 FROM warn_reasons)
+    ''')
+    return bool((await cursor.fetchone())[0])
+
+async def _m7_chat_partitions(db):
+    # Статистика переезжает в chat_members с ключом (chat_id, user_id),
+    # в users остается только личность. Старые данные относятся к LEGACY_CHAT_ID.
+    # Прежние таблицы с данными не удаляются, а остаются рядом как *_legacy.
+    if LEGACY_CHAT_ID == GLOBAL_CHAT_ID and await _has_legacy_stats(db):
+        # Глобальный чат никто не читает: перенос туда молча потерял бы XP, варны и права
+        raise RuntimeError(
+            "Миграция v7: в базе есть XP, варны или репутация из общей базы, но LEGACY_CHAT_ID не задан. "
+            "Укажите в config.py ID группы, которой принадлежат эти данные, и перезапустите бота."
+        )
+    await db.execute('''CREATE TABLE chat_members (
+        chat_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        xp INTEGER DEFAULT 0,
+        level INTEGER DEFAULT 1,
+        total_xp INTEGER DEFAULT 0,
+        warns INTEGER DEFAULT 0,
+        mod_level INTEGER DEFAULT 0,
+        reputation INTEGER DEFAULT 0,
+        last_wipe_date TEXT DEFAULT NULL,
+        PRIMARY KEY (chat_id, user_id)
+    )''')
+    await db.execute('''
+        INSERT INTO chat_members (chat_id, user_id, xp, level, total_xp, warns, mod_level, reputation, last_wipe_date)
+        SELECT ?, user_id, IFNULL(xp, 0), IFNULL(level, 1), IFNULL(total_xp, 0), IFNULL(warns, 0),
+               IFNULL(mod_level, 0), IFNULL(reputation, 0), last_wipe_date
+        FROM users
+    ''', (LEGACY_CHAT_ID,))
+    await db.execute('CREATE INDEX idx_members_rank ON chat_members (chat_id, total_xp DESC)')
+    await db.execute('CREATE INDEX idx_members_staff ON chat_members (chat_id, mod_level) WHERE mod_level > 0')
+
+    await db.execute('CREATE TABLE users_new (user_id INTEGER PRIMARY KEY, username TEXT, full_name TEXT)')
+    await db.execute('INSERT INTO users_new SELECT user_id, username, full_name FROM users')
+    # Индексы уехали бы вместе с таблицей и заняли имена новых
+    for index in ('idx_username', 'idx_level_xp', 'idx_total_xp'):
+        await db.execute(f'DROP INDEX IF EXISTS {index}')
+    await _retire_table(db, 'users')
+    await db.execute('ALTER TABLE users_new RENAME TO users')
+    await db.execute('CREATE INDEX idx_username ON users (username)')
+
+    await db.execute('''CREATE TABLE rep_history_new (
+        chat_id INTEGER NOT NULL,
+        from_id INTEGER,
+        to_id INTEGER,
+        date_str TEXT,
+        PRIMARY KEY (chat_id, from_id, date_str, to_id)
+    )''')
+    await db.execute('INSERT INTO rep_history_new SELECT ?, from_id, to_id, date_str FROM rep_history', (LEGACY_CHAT_ID,))
+    await _retire_table(db, 'rep_history')
+    await db.execute('ALTER TABLE rep_history_new RENAME TO rep_history')
+
+    await db.execute(f'ALTER TABLE warn_reasons ADD COLUMN chat_id INTEGER NOT NULL DEFAULT {GLOBAL_CHAT_ID}')
+    await db.execute('UPDATE warn_reasons SET chat_id = ?', (LEGACY_CHAT_ID,))
+    await db.execute('CREATE INDEX idx_warns_member ON warn_reasons (chat_id, user_id, id)')
+
+    # Старые списки становятся глобальными (действуют во всех чатах)
+    for table, field in (('whitelist', 'item'), ('badwords', 'word')):
+        await db.execute(f'''CREATE TABLE {table}_new (
+            chat_id INTEGER NOT NULL DEFAULT {GLOBAL_CHAT_ID},
+            {field} TEXT NOT NULL,
+            PRIMARY KEY (chat_id, {field})
+        )''')
+        await db.execute(f'INSERT INTO {table}_new SELECT {GLOBAL_CHAT_ID}, {field} FROM {table}')
+        await _retire_table(db, table)
+        await db.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+async def _m8_warn_ledger(db):
+    # warn_reasons становится журналом: каждый варн — строка с временем и выдавшим
+    await _add_column(db, 'warn_reasons', 'issued_at', 'INTEGER NOT NULL DEFAULT 0')
+    await _add_column(db, 'warn_reasons', 'issuer_id', 'INTEGER')
+    now = int(time.time())
+    # Старым варнам срок отсчитывается с момента миграции
+    await db.execute('UPDATE warn_reasons SET issued_at = ?', (now,))
+    # Варны без причины раньше не записывались: добавляем недостающие строки,
+    # чтобы счетчик warns совпадал с журналом и они тоже могли истечь
+    await db.execute('''
+        WITH RECURSIVE missing(chat_id, user_id, n) AS (
+            SELECT m.chat_id, m.user_id,
+                   m.warns - (SELECT COUNT(*) FROM warn_reasons w WHERE w.chat_id = m.chat_id AND w.user_id = m.user_id)
+            FROM chat_members m WHERE m.warns > 0
+            UNION ALL
+            SELECT chat_id, user_id, n - 1 FROM missing WHERE n > 1
+        )
+        INSERT INTO warn_reasons (chat_id, user_id, reason, issued_at)
+        SELECT chat_id, user_id, NULL, ? FROM missing WHERE n > 0
+    ''', (now,))
+    await db.execute('CREATE INDEX idx_warns_issued ON warn_reasons (issued_at)')
+
+async def _m9_scheduled_deletes(db):
+    # Отложенные удаления сообщений бота переживают перезапуск
+    await db.execute('''CREATE TABLE IF NOT EXISTS scheduled_deletes (
+        chat_id INTEGER NOT NULL,
+        message_id INTEGER NOT NULL,
+        due_at REAL NOT NULL,
+        PRIMARY KEY (chat_id, message_id)
+    ) WITHOUT ROWID''')
+
+# (версия, описание, шаг) — только добавлять в конец, не менять существующие
+MIGRATIONS = [
+    (1, "базовые таблицы", _m1_base_tables),
+    (2, "full_name", _m2_full_name),
+    (3, "mod_level", _m3_mod_level),
+    (4, "reputation и last_wipe_date", _m4_reputation),
+    (5, "total_xp", _m5_total_xp),
+    (6, "индексы users", _m6_user_indexes),
+    (7, "разделение данных по чатам", _m7_chat_partitions),
+    (8, "журнал варнов со сроком действия", _m8_warn_ledger),
+    (9, "отложенные удаления", _m9_scheduled_deletes),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# === ДВИЖОК SQLITE ===
+class SQLiteStorage(Storage):
+    """Движок по умолчанию: файл SQLite в режиме WAL через пул соединений."""
+    name = 'sqlite'
+
+    def __init__(self, path: str = DB_NAME, readers: int = 3):
+        self.pool = ConnectionPool(path, readers)
+
+    async def start(self):
+        await self.pool.start()
+
+    async def close(self):
+        await self.pool.close()
+
+    async def create_tables(self):
+        """Приводит схему БД к SCHEMA_VERSION. Для актуальной базы это одно чтение PRAGMA."""
+        async with self.pool.read() as db:
+            cursor = await db.execute('PRAGMA user_version')
+            current = (await cursor.fetchone())[0]
+        if current >= SCHEMA_VERSION:
+            return
+
+        started = time.perf_counter()
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            step_started = time.perf_counter()
+            async with self.pool.write() as db:
+                # DDL в sqlite3 не открывает транзакцию сам, открываем явно
+                await db.execute('BEGIN')
+                await step(db)
+                await db.execute(f'PRAGMA user_version = {version}')
+            print(f"⚠️ Миграция v{version}: {description} ({(time.perf_counter() - step_started) * 1000:.1f} мс)")
+        print(f"✅ Схема БД обновлена v{current} -> v{SCHEMA_VERSION} за {(time.perf_counter() - started) * 1000:.1f} мс")
+
+    # --- Пользователи ---
+    async def fetch_member(self, chat_id, user_id):
+        async with self.pool.read() as db:
+            cursor = await db.execute('''
+                SELECT u.user_id, u.username, u.full_name, m.xp, m.level, m.warns, m.mod_level, m.reputation 
+                FROM users u
+                LEFT JOIN chat_members m ON m.chat_id = ? AND m.user_id = u.user_id
+                WHERE u.user_id = ?
+            ''', (chat_id, user_id))
+            return await cursor.fetchone()
+
+    async def create_member(self, chat_id, user_id, username, full_name):
+        async with self.pool.write() as db:
+            await db.execute('''
+                INSERT INTO users (user_id, username, full_name) VALUES (?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET username = excluded.username, full_name = excluded.full_name
+            ''', (user_id, username, full_name))
+            await db.execute('INSERT OR IGNORE INTO chat_members (chat_id, user_id) VALUES (?, ?)', (chat_id, user_id))
+
+    async def update_identity(self, user_id, username, full_name):
+        async with self.pool.write() as db:
+            await db.execute('UPDATE users SET username = ?, full_name = ? WHERE user_id = ?', 
+                             (username, full_name, user_id))
+
+    async def get_id_by_username(self, username):
+        async with self.pool.read() as db:
+            cursor = await db.execute('SELECT user_id FROM users WHERE username = ?', (username,))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    # --- Опыт ---
+    async def get_total_xp(self, chat_id, user_id):
+        async with self.pool.read() as db:
+            cursor = await db.execute('SELECT total_xp FROM chat_members WHERE chat_id = ? AND user_id = ?',
+                                      (chat_id, user_id))
+            row = await cursor.fetchone()
+            return row[0] if row else None
+
+    async def add_xp(self, chat_id, user_id, delta):
+        params = {'delta': delta, 'chat_id': chat_id, 'user_id': user_id}
+        async with self.pool.write() as db:
+            if delta >= 0:
+                # Ограничение снизу не срабатывает: прежний total_xp = новый - delta, один запрос
+                cursor = await db.execute(XP_UPDATE_SQL + ' RETURNING total_xp, level', params)
+                row = await cursor.fetchone()
+                return (row[0] - delta, *row) if row else None
+            # Списание могло упереться в 0, тогда по новому значению прежнее не восстановить.
+            # RETURNING отдает только новые значения, поэтому прежнее читаем под той же блокировкой записи
+            cursor = await db.execute('SELECT total_xp FROM chat_members WHERE chat_id = ? AND user_id = ?',
+                                      (chat_id, user_id))
+            old = await cursor.fetchone()
+            if old is None:
+                return None
+            cursor = await db.execute(XP_UPDATE_SQL + ' RETURNING total_xp, level', params)
+            return (old[0], *await cursor.fetchone())
+
+    async def add_xp_many(self, deltas):
+        # Без предварительных SELECT: одна команда на всю пачку
+        params = [{'delta': delta, 'chat_id': chat_id, 'user_id': user_id}
+                  for chat_id, user_id, delta in deltas if delta]
+        if not params: return
+        async with self.pool.write() as db:
+            await db.executemany(XP_UPDATE_SQL, params)
+
+    async def load_rank_totals(self):
+        async with self.pool.read() as db:
+            cursor = await db.execute('SELECT chat_id, user_id, total_xp FROM chat_members')
+            return await cursor.fetchall()
+
+    # --- Репутация и модерация ---
+    async def give_reputation(self, chat_id, from_user_id, to_user_id, today, daily_limit=3):
+        async with self.pool.write() as db:
+            cursor = await db.execute('SELECT 1 FROM rep_history WHERE chat_id = ? AND from_id = ? AND to_id = ? AND date_str = ?', 
+                                      (chat_id, from_user_id, to_user_id, today))
+            if await cursor.fetchone():
+                return "daily_limit_user" 
+            
+            cursor = await db.execute('SELECT count(*) FROM rep_history WHERE chat_id = ? AND from_id = ? AND date_str = ?',
+                                      (chat_id, from_user_id, today))
+            count = await cursor.fetchone()
+            if count and count[0] >= daily_limit:
+                return "daily_limit_total"
+
+            await db.execute('INSERT INTO rep_history (chat_id, from_id, to_id, date_str) VALUES (?, ?, ?, ?)',
+                             (chat_id, from_user_id, to_user_id, today))
+            await db.execute('UPDATE chat_members SET reputation = reputation + 1 WHERE chat_id = ? AND user_id = ?',
+                             (chat_id, to_user_id))
+        return "success"
+
+    async def check_wipe_cooldown(self, chat_id, user_id, today):
+        async with self.pool.write() as db:
+            cursor = await db.execute('SELECT last_wipe_date FROM chat_members WHERE chat_id = ? AND user_id = ?',
+                                      (chat_id, user_id))
+            row = await cursor.fetchone()
+            last_date = row[0] if row else None
+            
+            if last_date == today:
+                return False
+            
+            await db.execute('UPDATE chat_members SET last_wipe_date = ? WHERE chat_id = ? AND user_id = ?',
+                             (today, chat_id, user_id))
+            return True
+
+    async def set_moderator_level(self, chat_id, user_id, level):
+        async with self.pool.write() as db:
+            # Назначить можно и того, кто еще не писал в этом чате
+            await db.execute('''
+                INSERT INTO chat_members (chat_id, user_id, mod_level) VALUES (?, ?, ?)
+                ON CONFLICT(chat_id, user_id) DO UPDATE SET mod_level = excluded.mod_level
+            ''', (chat_id, user_id, level))
+
+    async def manage_warn(self, chat_id, user_id, action, reason=None, issuer_id=None, issued_at=0):
+        async with self.pool.write() as db:
+            if action == "reset":
+                await db.execute('UPDATE chat_members SET warns = 0 WHERE chat_id = ? AND user_id = ?', (chat_id, user_id))
+                await db.execute('DELETE FROM warn_reasons WHERE chat_id = ? AND user_id = ?', (chat_id, user_id))
+                return 0
+            if action == "remove":
+                # MAX(id) по индексу idx_warns_member — без сканирования журнала
+                await db.execute('''
+                    DELETE FROM warn_reasons WHERE id = (
+                        SELECT MAX(id) FROM warn_reasons WHERE chat_id = ? AND user_id = ?
+                    )
+                ''', (chat_id, user_id))
+                cursor = await db.execute(
+                    'UPDATE chat_members SET warns = MAX(0, warns - 1) WHERE chat_id = ? AND user_id = ? RETURNING warns',
+                    (chat_id, user_id))
+            else: 
+                await db.execute('INSERT INTO warn_reasons (chat_id, user_id, reason, issued_at, issuer_id) VALUES (?, ?, ?, ?, ?)',
+                                 (chat_id, user_id, reason, issued_at, issuer_id))
+                cursor = await db.execute(
+                    'UPDATE chat_members SET warns = warns + 1 WHERE chat_id = ? AND user_id = ? RETURNING warns',
+                    (chat_id, user_id))
+            row = await cursor.fetchone()
+            return row[0] if row else 0
+
+    async def get_warn_reasons(self, chat_id, user_id):
+        async with self.pool.read() as db:
+            cursor = await db.execute('''
+                SELECT reason FROM warn_reasons
+                WHERE chat_id = ? AND user_id = ? AND reason IS NOT NULL ORDER BY id
+            ''', (chat_id, user_id))
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+    async def sweep_warns(self, cutoff, limit):
+        async with self.pool.write() as db:
+            # Самые старые варны по индексу idx_warns_issued, не больше limit за транзакцию
+            cursor = await db.execute('''
+                DELETE FROM warn_reasons WHERE id IN (
+                    SELECT id FROM warn_reasons WHERE issued_at < ? ORDER BY issued_at LIMIT ?
+                ) RETURNING chat_id, user_id
+            ''', (cutoff, limit))
+            removed = [tuple(row) for row in await cursor.fetchall()]
+            await db.executemany(
+                'UPDATE chat_members SET warns = MAX(0, warns - ?) WHERE chat_id = ? AND user_id = ?',
+                [(count, chat_id, user_id) for (chat_id, user_id), count in Counter(removed).items()])
+        return removed
+
+    # --- Списки ---
+    # Имя таблицы подставляется в SQL, поэтому принимаем только известные таблицы
+    async def add_to_list(self, table, chat_id, item):
+        field = LIST_TABLES[table]
+        try:
+            async with self.pool.write() as db:
+                await db.execute(f'INSERT INTO {table} (chat_id, {field}) VALUES (?, ?)', (chat_id, item))
+            return True
+        except aiosqlite.IntegrityError:
+            return False
+
+    async def remove_from_list(self, table, chat_id, item):
+        field = LIST_TABLES[table]
+        async with self.pool.write() as db:
+            await db.execute(f'DELETE FROM {table} WHERE chat_id = ? AND {field} = ?', (chat_id, item))
+
+    async def get_list(self, table, chat_id, include_global=True):
+        field = LIST_TABLES[table]
+        async with self.pool.read() as db:
+            if include_global and chat_id != GLOBAL_CHAT_ID:
+                cursor = await db.execute(f'SELECT DISTINCT {field} FROM {table} WHERE chat_id IN (?, ?)',
+                                          (chat_id, GLOBAL_CHAT_ID))
+            else:
+                cursor = await db.execute(f'SELECT {field} FROM {table} WHERE chat_id = ?', (chat_id,))
+            rows = await cursor.fetchall()
+            return [row[0] for row in rows]
+
+    async def clear_list(self, table, chat_id):
+        if table not in LIST_TABLES:
+            raise KeyError(table)
+        async with self.pool.write() as db:
+            await db.execute(f'DELETE FROM {table} WHERE chat_id = ?', (chat_id,))
+
+    async def load_lists(self, table):
+        field = LIST_TABLES[table]
+        async with self.pool.read() as db:
+            cursor = await db.execute(f'SELECT chat_id, {field} FROM {table}')
+            return await cursor.fetchall()
+
+    # --- Лидеры и стафф ---
+    async def get_top_users(self, chat_id, limit=10):
+        async with self.pool.read() as db:
+            cursor = await db.execute('''
+                SELECT IFNULL(u.full_name, 'User'), m.level, m.xp, m.user_id 
+                FROM chat_members m
+                LEFT JOIN users u ON u.user_id = m.user_id
+                WHERE m.chat_id = ?
+                ORDER BY m.total_xp DESC 
+                LIMIT ?
+            ''', (chat_id, limit))
+            return await cursor.fetchall()
+
+    async def get_member_rank(self, chat_id, user_id):
+        async with self.pool.read() as db:
+            cursor = await db.execute('SELECT level, xp, total_xp FROM chat_members WHERE chat_id = ? AND user_id = ?',
+                                      (chat_id, user_id))
+            user_data = await cursor.fetchone()
+            if not user_data:
+                return None
+            
+            u_lvl, u_xp, u_total = user_data
+            
+            # Считаем сколько людей выше (по суммарному XP, это порядок (level, xp))
+            cursor = await db.execute('SELECT COUNT(*) FROM chat_members WHERE chat_id = ? AND total_xp > ?',
+                                      (chat_id, u_total))
+            count = await cursor.fetchone()
+            return count[0] + 1, u_lvl, u_xp # +1 потому что если 0 людей выше, мы 1-е
+
+    async def get_all_staff(self, chat_id):
+        async with self.pool.read() as db:
+            cursor = await db.execute('''
+                SELECT IFNULL(u.full_name, 'User'), m.mod_level, u.username, m.user_id
+                FROM chat_members m
+                LEFT JOIN users u ON u.user_id = m.user_id
+                WHERE m.chat_id = ? AND m.mod_level > 0 
+                ORDER BY m.mod_level DESC
+            ''', (chat_id,))
+            return await cursor.fetchall()
+
+    # --- Отложенные удаления ---
+    async def save_scheduled_deletes(self, added, removed):
+        async with self.pool.write() as db:
+            if added:
+                await db.executemany(
+                    'INSERT OR REPLACE INTO scheduled_deletes (chat_id, message_id, due_at) VALUES (?, ?, ?)', added
+                )
+            if removed:
+                await db.executemany('DELETE FROM scheduled_deletes WHERE chat_id = ? AND message_id = ?', removed)
+
+    async def load_scheduled_deletes(self):
+        async with self.pool.read() as db:
+            cursor = await db.execute('SELECT chat_id, message_id, due_at FROM scheduled_deletes')
+            return await cursor.fetchall()
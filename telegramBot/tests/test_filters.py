@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import pytest
+from utils import LinkWhitelist, RaidDetector, TextAnalyzer, extract_links
+
+# === ФИЛЬТР СЛОВ ===
+BADWORDS = ['ass', 'cock', 'booob', 'хер', 'хуй']
+
+@pytest.mark.parametrize('text', [
+    'as well as before',  # повтор буквы в слове не сжимается: «ass» не равно «as»
+    'я пью сок',          # кириллическое «сок» не превращается в «cok»
+    'bob',
+    'xep',                # латиница целиком — не «хер»
+])
+def test_badwords_no_false_positives(text):
+    assert not TextAnalyzer().is_bad_word(text, BADWORDS)
+
+@pytest.mark.parametrize('text', ['ASSSS', 'a$$', 'сooock', 'boooob', 'xyй', 'хееер'])
+def test_badwords_obfuscated(text):
+    assert TextAnalyzer().is_bad_word(text, BADWORDS)
+
+PHRASES = ['иди нахуй', 'casino online']
+
+@pytest.mark.parametrize('text', ['ну иди нахуй', 'CASINO   ONLINE', 'иди нaхуй'])
+def test_badword_phrase_matches_whole(text):
+    assert TextAnalyzer().is_bad_word(text, PHRASES)
+
+@pytest.mark.parametrize('text', ['иди домой', 'я иди', 'online shop', 'лучшее casino'])
+def test_badword_phrase_words_alone_are_allowed(text):
+    assert not TextAnalyzer().is_bad_word(text, PHRASES)
+
+# === БЕЛЫЙ СПИСОК ССЫЛОК ===
+def test_whitelist_bare_tg_host_allows_all_channels():
+    whitelist = LinkWhitelist(['t.me'])
+    assert whitelist.hosts == {'t.me'}
+    assert whitelist.handles == set()
+    for kind, value in extract_links('заходите в t.me/somechannel и @otherchannel'):
+        assert whitelist.allows(kind, value)
+
+def test_whitelist_entries_are_parsed_by_kind():
+    whitelist = LinkWhitelist(['https://www.YouTube.com/', 't.me/news', '@chat_rules', 'my_channel'])
+    assert whitelist.hosts == {'youtube.com'}
+    assert whitelist.handles == {'news', 'chat_rules', 'my_channel'}
+    assert whitelist.allows('host', 'm.youtube.com')
+    assert not whitelist.allows('handle', 'spam')
+
+# === РЕЙДЫ ===
+def _send(detector, users, text, start=0, has_links=False):
+    cluster = None
+    for i, user_id in enumerate(users):
+        cluster = detector.check(-100, user_id, start + i, text, now=1000.0 + i, has_links=has_links) or cluster
+    return cluster
+
+def test_raid_shared_greeting_is_not_punished():
+    detector = RaidDetector()
+    greeting = TextAnalyzer().normalize('С днём рождения!!! 🎉')
+    # Столько людей, сколько раньше хватало для мута, — уже не рейд
+    assert _send(detector, range(1, 5), greeting) is None
+    # Без ссылок и новичков не рейд при любом числе авторов: сообщения не удаляются
+    assert _send(detector, range(5, 5 + 2 * detector.min_users), greeting, start=10) is None
+
+def test_raid_with_link_punishes_all_authors():
+    detector = RaidDetector()
+    spam = TextAnalyzer().normalize('Лучшие ставки тут: t.me/spam_casino')
+    cluster = _send(detector, range(1, 1 + detector.min_users), spam, has_links=True)
+    assert cluster.suspects() == set(range(1, 1 + detector.min_users))
+
+def test_raid_newcomers_are_punished():
+    detector = RaidDetector()
+    detector.note_join(-100, 3)
+    greeting = TextAnalyzer().normalize('С днём рождения!!! 🎉')
+    cluster = _send(detector, range(1, 1 + detector.min_users), greeting)
+    assert cluster.suspects() == {3}
@@ -1,13 +1,32 @@
 import asyncio
+import itertools
 import re
 import time
 import difflib
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict, deque, namedtuple
+from functools import partial
 from aiogram import types, Bot
 from database import get_id_by_username
+from cache import TTLCache
+from flood import FloodRules, create_flood_backend, similarity_ratio
+from actions import action_queue
+from scheduler import schedule_delete
+from config import (
+    BLOCK_MENTIONS, STATE_CACHE_SIZE, FLOOD_BACKEND, CHAT_ADMINS_TTL, MESSAGE_LOG_SIZE, MESSAGE_LOG_CHATS, RAID_WINDOW, RAID_MAX_MESSAGES, RAID_MIN_USERS, RAID_MIN_LENGTH, RAID_MAX_CHATS,
+    RAID_JOIN_WINDOW
+)
 
 # === 0. MESSAGE TRACKER (Синглтон сообщений) ===
-# Хранит { 'unique_key': message_id }
-_active_temp_messages = {}
+# Хранит { (chat_id, 'unique_key'): message_id }. Запись снимается, когда ее сообщение
+# удаляется по расписанию; час — только страховка для записей без удаления
+_active_temp_messages = TTLCache('temp_messages', maxsize=STATE_CACHE_SIZE, ttl=3600)
+
+def _forget_temp(slot, message_id: int):
+    # Ключ мог уже перейти к более новому сообщению
+    if _active_temp_messages.get(slot) == message_id:
+        _active_temp_messages.pop(slot)
 
 async def answer_temp(message: types.Message, text: str, delay: int = 60, key: str = None):
     """
@@ -17,79 +36,380 @@ async def answer_temp(message: types.Message, text: str, delay: int = 60, key: s
     bot = message.bot
     chat_id = message.chat.id
 
-    # Если передан ключ, пытаемся удалить старое сообщение этого типа
+    # Если передан ключ, удаляем старое сообщение этого типа в этом чате
+    slot = (chat_id, key)
     if key:
-        old_msg_id = _active_temp_messages.get(key)
+        old_msg_id = _active_temp_messages.pop(slot)
         if old_msg_id:
-            try:
-                await bot.delete_message(chat_id=chat_id, message_id=old_msg_id)
-            except:
-                pass # Сообщение могло быть удалено вручную или устареть
+            action_queue.delete(bot, chat_id, old_msg_id)
     
     try:
-        sent_msg = await message.answer(text)
+        # Через очередь действий: при перегрузке уведомление может быть отброшено (None)
+        sent_msg = await action_queue.run(chat_id, lambda: message.answer(text))
+        if sent_msg is None:
+            return None
         
         # Регистрируем новое сообщение, если есть ключ
+        on_delete = None
         if key:
-            _active_temp_messages[key] = sent_msg.message_id
+            _active_temp_messages[slot] = sent_msg.message_id
+            on_delete = partial(_forget_temp, slot, sent_msg.message_id)
 
-        # Запускаем таймер удаления
-        asyncio.create_task(delete_later(sent_msg, delay, key))
+        # Ставим удаление в планировщик (одна задача на все сообщения)
+        schedule_delete(sent_msg, delay, on_delete)
         return sent_msg
     except Exception:
         pass
 
-async def delete_later(message: types.Message, delay: int = 0, key: str = None):
-    if delay > 0:
-        await asyncio.sleep(delay)
-    try:
-        await message.delete()
-    except:
-        pass
-    
-    # Очистка ключа, если он все еще указывает на это сообщение
-    # (чтобы не удалить ключ, если он уже был перезаписан более новым сообщением)
-    if key and _active_temp_messages.get(key) == message.message_id:
-        del _active_temp_messages[key]
+async def delete_later(message: types.Message, delay: int = 0):
+    """Совместимость со старыми вызовами: возвращается сразу, не дожидаясь удаления (см. schedule_delete)."""
+    schedule_delete(message, delay)
 
 # === 1. TEXT CLEANER & NORMALIZER ===
+# Невидимые символы (zero-width, мягкий перенос, BOM, bidi-метки) и комбинируемые
+# диакритики (zalgo, «х̆уй»): удаляются до любых проверок
+_INVISIBLE_CHARS = '\u00ad\u034f\u061c\u115f\u1160\u17b4\u17b5\u180e\u200b\u200c\u200d\u200e\u200f' \
+                   '\u202a\u202b\u202c\u202d\u202e\u2060\u2061\u2062\u2063\u2064\u2066\u2067\u2068\u2069\u3164\ufeff'
+_COMBINING_RANGES = ((0x0300, 0x036F), (0x0483, 0x0489), (0x1AB0, 0x1AFF), (0x1DC0, 0x1DFF), (0x20D0, 0x20FF), (0xFE20, 0xFE2F))
+_INVISIBLE = dict.fromkeys(map(ord, _INVISIBLE_CHARS))
+for _start, _end in _COMBINING_RANGES:
+    _INVISIBLE.update(dict.fromkeys(range(_start, _end + 1)))
+
+# Повторы одной буквы: «нууууу» -> «ну» (для отпечатков рейдов; фильтр слов сам допускает повторы)
+_REPEATS = re.compile(r'(\w)\1+')
+# Слово, в котором латиница смешана с кириллицей или греческим: «xyй», «аss»
+_LATIN = re.compile('[a-z]')
+_NON_LATIN = re.compile('[\u0370-\u03ff\u0400-\u04ff]')
+_SPACES = re.compile(r'(\s+)')
+
+def fold_text(text: str) -> str:
+    """NFKC (полноширинные и «жирные» буквы -> обычные), нижний регистр, без невидимых символов."""
+    return unicodedata.normalize('NFKC', text).lower().translate(_INVISIBLE)
+
+# Результат нормализации, общий для фильтра слов и ссылок:
+# lower — для ссылок (точки и регистр доменов сохранены), skeleton — для поиска слов
+NormalizedText = namedtuple('NormalizedText', 'lower skeleton')
+
+# Символы, из которых состоит слово: совпадение засчитывается только целым словом
+_WORD_CHARS = 'a-zа-яё0-9'
+
+def _runs(word: str):
+    """«booob» -> [('b', 1), ('o', 3), ('b', 1)]"""
+    return [(char, len(list(group))) for char, group in itertools.groupby(word)]
+
+def _run_regex(char: str, count: int) -> str:
+    # Повтор буквы в тексте допустим («сууука»), но не меньше, чем в самом слове
+    return re.escape(char) + ('+' if count == 1 else f'{{{count},}}')
+
+def _trie_regex(node: dict) -> str:
+    """Префиксное дерево {(буква, повторов): поддерево, '': конец слова} -> регулярное выражение без перебора."""
+    branches = [_run_regex(*run) + _trie_regex(node[run]) for run in sorted(k for k in node if k)]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if '' in node:
+        # Слово может закончиться здесь, а может продолжиться (мат / матом)
+        return f'(?:{body})?'
+    return body
+
+def _bigrams(word: str):
+    return [word[i:i + 2] for i in range(len(word) - 1)]
+
+class FuzzyIndex:
+    """
+    Нечеткий поиск слов по инвертированному индексу биграмм.
+    SequenceMatcher запускается только для кандидатов, которые могут набрать
+    ratio > RATIO: при M совпавших символах в блоках у слов длиной la и lb
+    не меньше 3M - 1 - (la + lb) общих биграмм, а M не больше min(la, lb).
+    Поэтому вердикты совпадают с полным перебором (см. benchmarks/fuzzy_badwords.py).
+    """
+    RATIO = 0.85
+
+    def __init__(self, words):
+        self.words = list(words)
+        self._lengths = [len(w) for w in self.words]
+        self._postings = {} # { биграмма: [(номер слова, сколько раз встречается), ...] }
+        for word_id, word in enumerate(self.words):
+            for gram, count in Counter(_bigrams(word)).items():
+                self._postings.setdefault(gram, []).append((word_id, count))
+
+    def candidates(self, token: str):
+        """Слова, прошедшие фильтр по длине и числу общих биграмм."""
+        shared = {}
+        for gram, count in Counter(_bigrams(token)).items():
+            for word_id, word_count in self._postings.get(gram, ()):
+                shared[word_id] = shared.get(word_id, 0) + min(count, word_count)
+
+        la = len(token)
+        for word_id, common in shared.items():
+            lb = self._lengths[word_id]
+            total = la + lb
+            min_matches = int(self.RATIO * total / 2) + 1
+            if min(la, lb) >= min_matches and common >= 3 * min_matches - 1 - total:
+                yield self.words[word_id]
+
+    def find(self, token: str) -> bool:
+        for word in self.candidates(token):
+            if difflib.SequenceMatcher(None, token, word).ratio() > self.RATIO:
+                return True
+        return False
+
+class BadwordMatcher:
+    """
+    Список запрещенных слов, скомпилированный в одно регулярное выражение-дерево.
+    Строится один раз на версию списка; точный поиск — один проход по тексту
+    независимо от размера списка.
+    """
+    def __init__(self, badwords):
+        self.words = tuple(dict.fromkeys(w for w in badwords if w))
+        # Нечеткое сравнение только для слов длиннее 3 символов
+        self.fuzzy = FuzzyIndex(w for w in self.words if len(w) > 3)
+        self._pattern = None
+        if self.words:
+            trie = {}
+            for word in self.words:
+                node = trie
+                for run in _runs(word):
+                    node = node.setdefault(run, {})
+                node[''] = {}
+            self._pattern = re.compile(
+                f'(?<![{_WORD_CHARS}])' + _trie_regex(trie) + f'(?![{_WORD_CHARS}])'
+            )
+
+    def search(self, clean_text: str) -> bool:
+        """Есть ли в нормализованном тексте запрещенное слово целиком."""
+        return self._pattern is not None and self._pattern.search(clean_text) is not None
+
+    def search_fuzzy(self, clean_text: str) -> bool:
+        """Есть ли слово, похожее на запрещенное (опечатки, лишняя или пропущенная буква)."""
+        return any(self.fuzzy.find(word) for word in set(clean_text.split()))
+
 class TextAnalyzer:
+    # Сколько скомпилированных списков держать (по одному на чат со своим списком)
+    MATCHER_CACHE_SIZE = 64
+
     def __init__(self):
         self.leet_map = {
             '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', 
             '7': 't', '8': 'b', '@': 'a', '$': 's', '(': 'c',
             '+': 't', '_': '', '.': '', ',': '', '-': ''
         }
+        # Похожие по написанию буквы кириллицы и греческого -> латиница (после lower()).
+        # Применяются только внутри слов со смешанными алфавитами: такое слово проверяется
+        # и целиком латиницей, и целиком кириллицей, поэтому «xyй» совпадет с «хуй»,
+        # а латинское «xep» с «хер» и кириллическое «сок» с «cock» — нет
+        self.confusables = {
+            'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h', 'о': 'o',
+            'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i', 'ј': 'j', 'ѕ': 's', 'ў': 'y',
+            'α': 'a', 'β': 'b', 'ε': 'e', 'ι': 'i', 'κ': 'k', 'ν': 'v', 'ο': 'o', 'ρ': 'p',
+            'τ': 't', 'υ': 'u', 'χ': 'x',
+        }
+        # Одна таблица на leet и невидимые символы: str.translate проходит строку один раз
+        self._table = str.maketrans(self.leet_map)
+        self._table.update(_INVISIBLE)
+        self._to_latin = str.maketrans(self.confusables)
+        to_cyrillic = {}
+        for char, latin in self.confusables.items():
+            if '\u0400' <= char <= '\u04ff':
+                to_cyrillic.setdefault(latin, char)
+        greek = {char: to_cyrillic[latin] for char, latin in self.confusables.items()
+                 if '\u0370' <= char <= '\u03ff' and latin in to_cyrillic}
+        self._to_cyrillic = str.maketrans({**greek, **to_cyrillic})
+        self._matchers = {} # { ключ версии или tuple(badwords): BadwordMatcher }
     
+    def _unmix(self, token: str) -> list:
+        """Слово со смешанными алфавитами -> [латиницей, кириллицей], остальные -> [как есть]."""
+        if _LATIN.search(token) and _NON_LATIN.search(token):
+            return [token.translate(self._to_latin), token.translate(self._to_cyrillic)]
+        return [token]
+
+    def variants(self, lower: str) -> list:
+        """
+        Уже приведенный fold_text() текст после leet, без невидимых символов. Если в нем есть слова
+        со смешанными алфавитами — два варианта: такие слова латиницей и кириллицей, остальное как есть.
+        """
+        text = lower.translate(self._table)
+        if not (_LATIN.search(text) and _NON_LATIN.search(text)):
+            return [text]
+        latin, cyrillic = [], []
+        for part in _SPACES.split(text):
+            forms = self._unmix(part)
+            latin.append(forms[0])
+            cyrillic.append(forms[-1])
+        return list(dict.fromkeys((''.join(latin), ''.join(cyrillic))))
+
+    def skeleton(self, lower: str) -> str:
+        """Варианты из variants() через перевод строки: фраза из списка не совпадет на их стыке."""
+        return '\n'.join(self.variants(lower))
+
+    def prepare(self, text: str) -> NormalizedText:
+        """Нормализует сообщение один раз для всех проверок."""
+        lower = fold_text(text)
+        return NormalizedText(lower, self.skeleton(lower))
+
     def normalize(self, text: str) -> str:
-        text = text.lower()
-        for char, repl in self.leet_map.items():
-            text = text.replace(char, repl)
-        return text
-
-    def is_bad_word(self, text: str, badwords: list) -> bool:
-        clean_text = self.normalize(text)
-        words = clean_text.split()
-        
-        for bad in badwords:
-            pattern = r'(^|\s|[^a-zа-яё0-9])' + re.escape(bad) + r'($|\s|[^a-zа-яё0-9])'
-            if re.search(pattern, clean_text):
-                return True
+        return self.prepare(text).skeleton
 
-            for word in words:
-                if len(bad) <= 3: 
-                    if word == bad: return True
-                    continue
-                if difflib.SequenceMatcher(None, word, bad).ratio() > 0.85:
-                    return True
-        return False
+    def matcher(self, badwords, key=None) -> BadwordMatcher:
+        """
+        Скомпилированный matcher для списка; пересобирается только при изменении списка.
+        key — версия списка (например, (chat_id, list_version('badwords'))), чтобы не сравнивать сам список.
+        """
+        if key is None:
+            key = tuple(badwords)
+        matcher = self._matchers.get(key)
+        if matcher is None:
+            if len(self._matchers) >= self.MATCHER_CACHE_SIZE:
+                self._matchers.pop(next(iter(self._matchers)))
+            # Фраза из нескольких слов остается целой: запрещена только вместе
+            matcher = self._matchers[key] = BadwordMatcher(
+                variant for w in badwords for variant in self.variants(fold_text(w).strip())
+            )
+        return matcher
+
+    def is_bad_word(self, text, badwords: list, key=None, fuzzy: bool = True) -> bool:
+        """text — строка или NormalizedText из prepare(). fuzzy=False — только точные совпадения."""
+        if isinstance(text, str):
+            text = self.prepare(text)
+        matcher = self.matcher(badwords, key)
+        return matcher.search(text.skeleton) or (fuzzy and matcher.search_fuzzy(text.skeleton))
 
 text_analyzer = TextAnalyzer()
 
+# === 1.1 LINK CLASSIFIER ===
+# Один проход по тексту в нижнем регистре. Порядок веток важен: t.me раньше обычных URL,
+# упоминания раньше «голых» доменов (иначе @name.com разберется как домен)
+_LINK_RE = re.compile(r"""
+    (?:https?://)?(?:www\.)?(?P<tg_host>t\.me|telegram\.me)/(?:s/|joinchat/)?(?P<tg>\+?[a-z0-9_-]+)
+  | (?:https?://|www\.)(?P<url>[^\s/?#:@]+)
+  | (?<![\w@])@(?P<mention>[a-z0-9_]{4,32})(?!\w|\.\w)
+  | (?<![\w.-])(?P<domain>(?:[a-z0-9-]+\.)*[a-z0-9-]{2,}\.[a-z]{2,6})\b
+""", re.VERBOSE)
+
+# Запись белого списка, которая целиком является доменом: t.me, youtube.com, https://m.vk.com/
+_BARE_HOST_RE = re.compile(r'(?:https?://)?(?P<host>(?:[a-z0-9-]+\.)+[a-z0-9-]+)/?')
+
+def _clean_host(host: str) -> str:
+    host = host.strip('.')
+    return host[4:] if host.startswith('www.') else host
+
+def extract_links(text_lower: str):
+    """
+    Ссылки из текста: [(вид, значение), ...], где вид —
+    'host' (домен без www), 'handle' (t.me/имя) или 'mention' (@имя).
+    """
+    links = []
+    for match in _LINK_RE.finditer(text_lower):
+        kind = match.lastgroup
+        if kind == 'tg_host' or kind == 'tg':
+            links.append(('handle', match.group('tg').lstrip('+')))
+        elif kind == 'mention':
+            links.append(('mention', match.group('mention')))
+        else:
+            links.append(('host', _clean_host(match.group(kind))))
+    return links
+
+class LinkWhitelist:
+    """
+    Белый список, разобранный тем же парсером, что и сообщения: домены и имена каналов.
+    Домен разрешен, если разрешен он сам или любой родительский домен
+    (m.youtube.com -> youtube.com), так что проверка стоит O(число меток), а не O(размер списка).
+    """
+    TG_HOSTS = ('t.me', 'telegram.me')
+
+    def __init__(self, items):
+        self.hosts = set()
+        self.handles = set()
+        for item in items:
+            item = fold_text(item).strip()
+            # Домен проверяем до парсера: t.me без имени канала он принял бы за имя
+            bare = _BARE_HOST_RE.fullmatch(item)
+            if bare:
+                self.hosts.add(_clean_host(bare.group('host')))
+                continue
+            links = extract_links(item)
+            if not links:
+                # Просто имя канала без @ и t.me/
+                self.handles.add(item.lstrip('@'))
+            for kind, value in links:
+                (self.hosts if kind == 'host' else self.handles).add(value)
+
+    def host_allowed(self, host: str) -> bool:
+        while True:
+            if host in self.hosts:
+                return True
+            dot = host.find('.')
+            if dot < 0:
+                return False
+            host = host[dot + 1:]
+
+    def allows(self, kind: str, value: str) -> bool:
+        if kind == 'host':
+            return self.host_allowed(value)
+        # t.me/имя и @имя: разрешено имя или весь t.me
+        return value in self.handles or any(host in self.hosts for host in self.TG_HOSTS)
+
+class LinkClassifier:
+    # Сколько разобранных белых списков держать (по одному на чат)
+    CACHE_SIZE = 64
+
+    def __init__(self, block_mentions: bool = False):
+        self.block_mentions = block_mentions
+        self._whitelists = {} # { ключ версии: LinkWhitelist }
+
+    def whitelist(self, items, key=None) -> LinkWhitelist:
+        """Разобранный белый список; key — версия списка, как в TextAnalyzer.matcher."""
+        if key is None:
+            key = tuple(items)
+        whitelist = self._whitelists.get(key)
+        if whitelist is None:
+            if len(self._whitelists) >= self.CACHE_SIZE:
+                self._whitelists.pop(next(iter(self._whitelists)))
+            whitelist = self._whitelists[key] = LinkWhitelist(items)
+        return whitelist
+
+    def forbidden_links(self, text_lower: str, items, key=None, mentions: bool = None):
+        """
+        Ссылки сообщения, которых нет в белом списке. @упоминания — только при block_mentions
+        (или mentions=True). text_lower — результат fold_text() (поле lower у NormalizedText).
+        """
+        if mentions is None:
+            mentions = self.block_mentions
+        links = [
+            link for link in extract_links(text_lower)
+            if link[0] != 'mention' or mentions
+        ]
+        if not links:
+            return []
+        whitelist = self.whitelist(items, key)
+        return [link for link in links if not whitelist.allows(*link)]
+
+link_classifier = LinkClassifier(BLOCK_MENTIONS)
+
+def content_verdict(text: str, whitelist, badwords, whitelist_key=None, badwords_key=None, fuzzy: bool = True):
+    """
+    Причина удаления сообщения или None. Чистая функция без обращений к боту и БД:
+    может выполняться в отдельном процессе (см. analysis.py), кеши matcher'ов там свои.
+    """
+    # Нормализуем один раз: ссылки проверяются по lower, слова по skeleton
+    normalized = text_analyzer.prepare(text)
+
+    # Ссылки: каждая должна быть в белом списке (домен, поддомен или канал)
+    if link_classifier.forbidden_links(normalized.lower, whitelist, key=whitelist_key):
+        return "Реклама / Ссылки"
+
+    # Маты
+    if text_analyzer.is_bad_word(normalized, badwords, key=badwords_key, fuzzy=fuzzy):
+        return "Запрещенное слово"
+    return None
+
 # === 2. SMART FLOOD CONTROL ===
 class SmartFloodControl:
-    def __init__(self):
-        self.users = {}
+    """Вес сообщения считается здесь, счет с затуханием хранит backend (см. flood.py)."""
+    # Через 10 минут тишины счет гарантированно обнулился, запись можно забыть
+    STATE_TTL = 600
+
+    def __init__(self, backend: str = FLOOD_BACKEND):
         self.DECAY_RATE = 0.5      
         self.MAX_SCORE = 10.0      
         self.WARN_SCORE = 6.0      
@@ -97,40 +417,308 @@ class SmartFloodControl:
         self.SHORT_MSG_MULT = 1.5  
         self.DUPLICATE_MULT = 4.0  
         self.SIMILAR_MULT = 2.0    
+        self.SIMILAR_RATIO = 0.75
+        rules = FloodRules(self.DECAY_RATE, self.DUPLICATE_MULT, self.MAX_SCORE, self.WARN_SCORE,
+                           self.SIMILAR_MULT, self.SIMILAR_RATIO)
+        self.backend = create_flood_backend(backend, rules, self.STATE_TTL)
         
     def _calculate_similarity(self, text1: str, text2: str) -> float:
-        return difflib.SequenceMatcher(None, text1, text2).ratio()
+        return similarity_ratio(text1, text2)
 
-    def check(self, user_id: int, text: str):
-        now = time.time()
-        if user_id not in self.users:
-            self.users[user_id] = {'score': 0.0, 'last_msg': "", 'last_time': now}
-        
-        data = self.users[user_id]
-        time_diff = now - data['last_time']
-        data['score'] = max(0.0, data['score'] - (time_diff * self.DECAY_RATE))
-        
-        current_weight = self.BASE_WEIGHT
+    async def last_message(self, user_id: int) -> str:
+        """Предыдущее сообщение пользователя в том виде, в каком его сравнивает check()."""
+        return await self.backend.last_message(user_id)
+
+    async def check(self, user_id: int, text: str, similarity: float = None):
+        """
+        similarity — заранее посчитанная похожесть на last_message() (например, в процессе анализа).
+        None — backend сравнит с прошлым сообщением сам, тем же обращением, что и обновление счета.
+        Повтор и похожесть учитывает backend.
+        """
         clean_text = text.lower().strip()
-        
+
+        current_weight = self.BASE_WEIGHT
         if len(clean_text) < 5: current_weight *= self.SHORT_MSG_MULT
-        if clean_text == data['last_msg']: current_weight *= self.DUPLICATE_MULT
-        elif self._calculate_similarity(clean_text, data['last_msg']) > 0.75: current_weight *= self.SIMILAR_MULT
         if len(clean_text) > 8 and len(set(clean_text)) < 4: current_weight *= 2.0
 
-        data['score'] += current_weight
-        data['last_msg'] = clean_text
-        data['last_time'] = now
-
-        if data['score'] >= self.MAX_SCORE:
-            data['score'] = self.WARN_SCORE 
+        score, muted = await self.backend.hit(user_id, clean_text, current_weight, time.time(), similarity)
+        if muted:
             return 'mute'
-        if data['score'] >= self.WARN_SCORE:
+        if score >= self.WARN_SCORE:
             return 'warn'
         return 'ok'
 
 flood_control = SmartFloodControl()
 
+# === 3. RAID DETECTION (одинаковый текст от разных пользователей) ===
+_MASK64 = (1 << 64) - 1
+_WORD_RE = re.compile(r'\w+')
+
+def simhash(skeleton: str) -> int:
+    """
+    64-битный SimHash по 4-граммам букв.
+    Близкие тексты дают отпечатки с малым расстоянием Хэмминга.
+    hash() строк случаен между запусками, поэтому отпечатки живут только в памяти процесса.
+    """
+    # Признаки — 4-граммы букв без пробелов и знаков: лишний «!» или эмодзи меняет
+    # лишь пару признаков из десятков, и отпечаток почти не сдвигается
+    compact = _REPEATS.sub(r'\1', ''.join(_WORD_RE.findall(skeleton)))
+    features = {compact[i:i + 4] for i in range(max(1, len(compact) - 3))}
+    hashes = [format(hash(f) & _MASK64, '064b') for f in features]
+    half = len(hashes) / 2
+    # Разряд отпечатка = 1, если он выставлен у большинства признаков (столбцы считаются в C)
+    bits = ''.join('1' if column.count('1') > half else '0' for column in zip(*hashes))
+    return int(bits, 2)
+
+class _RaidCluster:
+    __slots__ = ('users', 'messages', 'flagged', 'punished', 'spam', 'newcomers')
+
+    def __init__(self, max_messages):
+        self.users = set()
+        self.messages = deque(maxlen=max_messages) # (message_id, user_id), еще не удаленные
+        self.flagged = False
+        self.punished = set() # Авторы, которые уже заблокированы
+        self.spam = False     # В сообщениях есть ссылка или @упоминание
+        self.newcomers = set() # Авторы, недавно вступившие в чат
+
+    def suspects(self) -> set:
+        """Чьи сообщения удалять и кого блокировать: всех авторов рассылки со ссылками, иначе только новичков."""
+        return self.users if self.spam else self.newcomers
+
+class _ChatWindow:
+    __slots__ = ('entries', 'buckets')
+
+    def __init__(self):
+        self.entries = deque()  # (время, отпечаток, кластер) по возрастанию времени
+        self.buckets = {}       # { (номер полосы, значение полосы): deque записей }
+
+class RaidDetector:
+    """
+    Скользящее окно отпечатков сообщений по каждому чату.
+    Отпечаток делится на BANDS полос по 16 бит: тексты с расстоянием Хэмминга
+    не больше MAX_DISTANCE обязательно совпадут хотя бы в одной полосе, поэтому
+    похожие ищутся по BANDS словарям, а не перебором окна. Похожие сообщения
+    объединяются в кластер; когда в нем min_users разных авторов, это рейд.
+    Одинаковый текст сам по себе бывает и у обычного чата («С днём рождения!»),
+    поэтому кластер помнит признаки рассылки: ссылки и недавно вступивших авторов,
+    и без них рейдом не считается.
+    Память ограничена: max_messages записей на чат, BUCKET_LIMIT на полосу, max_chats чатов.
+    """
+    BANDS = 4
+    MAX_DISTANCE = 3
+    BUCKET_LIMIT = 16
+
+    def __init__(self, window: float = RAID_WINDOW, max_messages: int = RAID_MAX_MESSAGES,
+                 min_users: int = RAID_MIN_USERS, min_length: int = RAID_MIN_LENGTH, max_chats: int = RAID_MAX_CHATS,
+                 join_window: float = RAID_JOIN_WINDOW):
+        self.window = window
+        self.max_messages = max_messages
+        self.min_users = min_users
+        self.min_length = min_length
+        self.max_chats = max_chats
+        self.chats = OrderedDict() # { chat_id: _ChatWindow }
+        self.joins = TTLCache('raid_joins', maxsize=STATE_CACHE_SIZE, ttl=join_window) # { (chat_id, user_id): время }
+
+    def note_join(self, chat_id: int, user_id: int):
+        self.joins.set((chat_id, user_id), time.time())
+
+    def _bands(self, fingerprint):
+        return [(band, (fingerprint >> (16 * band)) & 0xFFFF) for band in range(self.BANDS)]
+
+    def _evict(self, chat, now):
+        entries = chat.entries
+        while entries and (len(entries) > self.max_messages or entries[0][0] < now - self.window):
+            entry = entries.popleft()
+            for band in self._bands(entry[1]):
+                bucket = chat.buckets.get(band)
+                if bucket and bucket[0] is entry:
+                    bucket.popleft()
+                if bucket is not None and not bucket:
+                    del chat.buckets[band]
+
+    def check(self, chat_id: int, user_id: int, message_id: int, skeleton: str, now: float = None,
+              has_links: bool = False):
+        """
+        Регистрирует сообщение. Возвращает None или кластер рейда: все его сообщения
+        (message_id, user_id) и авторы. flagged у кластера уже выставлен.
+        has_links — в сообщении есть ссылка или @упоминание не из белого списка.
+        """
+        if len(skeleton) < self.min_length:
+            return None
+        now = time.time() if now is None else now
+
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = _ChatWindow()
+            if len(self.chats) > self.max_chats:
+                self.chats.popitem(last=False)
+        else:
+            self.chats.move_to_end(chat_id)
+        self._evict(chat, now)
+
+        fingerprint = simhash(skeleton)
+        bands = self._bands(fingerprint)
+        cluster = None
+        for band in bands:
+            for _, other, other_cluster in chat.buckets.get(band, ()):
+                if bin(fingerprint ^ other).count('1') <= self.MAX_DISTANCE:
+                    cluster = other_cluster
+                    break
+            if cluster is not None:
+                break
+        if cluster is None:
+            cluster = _RaidCluster(self.max_messages)
+
+        entry = (now, fingerprint, cluster)
+        chat.entries.append(entry)
+        for band in bands:
+            bucket = chat.buckets.get(band)
+            if bucket is None:
+                bucket = chat.buckets[band] = deque(maxlen=self.BUCKET_LIMIT)
+            bucket.append(entry)
+
+        cluster.users.add(user_id)
+        cluster.messages.append((message_id, user_id))
+        cluster.spam |= has_links
+        if (chat_id, user_id) in self.joins:
+            cluster.newcomers.add(user_id)
+        if cluster.flagged or (len(cluster.users) >= self.min_users and cluster.suspects()):
+            cluster.flagged = True
+            return cluster
+        return None
+
+raid_detector = RaidDetector()
+
+# === 4. CHAT ADMINS (кеш администраторов чатов) ===
+ADMIN_STATUSES = ('creator', 'administrator')
+
+class ChatAdminCache:
+    """
+    Множество id администраторов каждого чата. Загружается одним get_chat_administrators
+    и живет CHAT_ADMINS_TTL секунд; между загрузками поддерживается событиями chat_member.
+    Проверка прав — поиск в множестве вместо get_member на каждое сообщение.
+    """
+    def __init__(self, ttl: int = CHAT_ADMINS_TTL):
+        self.admins = TTLCache('chat_admins', maxsize=10000, ttl=ttl) # { chat_id: set(user_id) }
+        self._loading = {} # { chat_id: Task }: одновременные запросы ждут одну загрузку
+
+    async def _load(self, chat: types.Chat) -> set:
+        members = await chat.bot.get_chat_administrators(chat.id)
+        admins = {member.user.id for member in members}
+        self.admins.set(chat.id, admins)
+        return admins
+
+    async def get(self, chat: types.Chat) -> set:
+        admins = self.admins.get(chat.id)
+        if admins is not None:
+            return admins
+        task = self._loading.get(chat.id)
+        if task is None:
+            task = asyncio.ensure_future(self._load(chat))
+            self._loading[chat.id] = task
+            task.add_done_callback(lambda _: self._loading.pop(chat.id, None))
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            # Ошибка не кешируется: следующее сообщение попробует снова
+            return set()
+
+    async def is_admin(self, chat: types.Chat, user_id: int) -> bool:
+        if chat.type == 'private':
+            return False
+        return user_id in await self.get(chat)
+
+    def update(self, chat_id: int, user_id: int, status: str):
+        """Событие chat_member: правим загруженный список (незагруженный подтянется при обращении)."""
+        admins = self.admins.get(chat_id)
+        if admins is None:
+            return
+        if status in ADMIN_STATUSES:
+            admins.add(user_id)
+        else:
+            admins.discard(user_id)
+
+    def invalidate(self, chat_id: int):
+        self.admins.pop(chat_id)
+
+chat_admins = ChatAdminCache()
+
+# === 5. MESSAGE LOG (последние сообщения чата для /purge и /clean) ===
+class MessageRing:
+    """
+    Кольцевой буфер (message_id, автор) фиксированного размера в двух массивах int64:
+    16 байт на сообщение вместо кортежа в списке. 0 в ids — пустая или удаленная ячейка.
+    """
+    __slots__ = ('ids', 'authors', 'pos')
+
+    def __init__(self, capacity: int):
+        self.ids = array('q', bytes(8 * capacity))
+        self.authors = array('q', bytes(8 * capacity))
+        self.pos = 0 # следующая ячейка для записи
+
+    def add(self, message_id: int, user_id: int):
+        self.ids[self.pos] = message_id
+        self.authors[self.pos] = user_id
+        self.pos = (self.pos + 1) % len(self.ids)
+
+    def recent(self):
+        """(message_id, user_id) от новых к старым."""
+        ids, authors, capacity = self.ids, self.authors, len(self.ids)
+        for step in range(1, capacity + 1):
+            i = (self.pos - step) % capacity
+            if ids[i]:
+                yield ids[i], authors[i]
+
+    def discard(self, message_ids):
+        """Помечает удаленные сообщения, чтобы повторная чистка их не трогала."""
+        message_ids = set(message_ids)
+        ids = self.ids
+        for i in range(len(ids)):
+            if ids[i] in message_ids:
+                ids[i] = 0
+
+class MessageLog:
+    def __init__(self, size: int = MESSAGE_LOG_SIZE, chats: int = MESSAGE_LOG_CHATS):
+        self.size = size
+        self.chats = TTLCache('message_log', maxsize=chats) # { chat_id: MessageRing }
+
+    def record(self, chat_id: int, message_id: int, user_id: int):
+        ring = self.chats.get(chat_id)
+        if ring is None:
+            ring = MessageRing(self.size)
+        # set() поднимает чат в конец очереди вытеснения
+        self.chats.set(chat_id, ring)
+        ring.add(message_id, user_id)
+
+    def last(self, chat_id: int, count: int) -> list:
+        """id последних count сообщений чата."""
+        ring = self.chats.get(chat_id)
+        if ring is None:
+            return []
+        return [message_id for message_id, _ in itertools.islice(ring.recent(), count)]
+
+    def by_author(self, chat_id: int, user_id: int) -> list:
+        """id всех известных сообщений пользователя в чате."""
+        ring = self.chats.get(chat_id)
+        if ring is None:
+            return []
+        return [message_id for message_id, author in ring.recent() if author == user_id]
+
+    def authors(self, chat_id: int, message_ids) -> dict:
+        """{ message_id: автор } для сообщений из message_ids, которые есть в журнале."""
+        ring = self.chats.get(chat_id)
+        if ring is None:
+            return {}
+        message_ids = set(message_ids)
+        return {message_id: author for message_id, author in ring.recent() if message_id in message_ids}
+
+    def discard(self, chat_id: int, message_ids):
+        ring = self.chats.get(chat_id)
+        if ring is not None:
+            ring.discard(message_ids)
+
+message_log = MessageLog()
+
 # === ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ===
 
 def parse_time(time_string):